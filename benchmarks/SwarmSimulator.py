@@ -0,0 +1,341 @@
+import hashlib
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+import bencodepy
+
+
+class LinkProfile:
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0,
+                 bandwidth: Optional[float] = None, retransmit_timeout: float = 0.2):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.bandwidth = bandwidth
+        self.retransmit_timeout = retransmit_timeout
+
+    def to_dict(self) -> dict:
+        return {
+            'latency_ms': self.latency * 1000,
+            'jitter_ms': self.jitter * 1000,
+            'loss': self.loss,
+            'bandwidth': self.bandwidth,
+        }
+
+
+class SyntheticTorrent:
+
+    def __init__(self, directory: str, size: int, piece_length: int, file_count: int = 1,
+                 name: str = 'synthetic', seed: int = 0):
+        self.directory = directory
+        self.size = size
+        self.piece_length = piece_length
+        self.file_count = max(1, file_count)
+        self.name = name
+        self.seed = seed
+        # The seeders serve from one flat file laid out like the torrent's byte stream
+        self.payload_path = os.path.join(directory, 'payload.bin')
+        self.info = None
+        self.info_hash = None
+
+    def generate(self) -> 'SyntheticTorrent':
+        os.makedirs(self.directory, exist_ok=True)
+        rng = random.Random(self.seed)
+        hashes = []
+        with open(self.payload_path, 'wb') as f:
+            remaining = self.size
+            while remaining > 0:
+                chunk = rng.randbytes(min(self.piece_length, remaining))
+                hashes.append(hashlib.sha1(chunk).digest())
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        info = {
+            b'name': self.name.encode(),
+            b'piece length': self.piece_length,
+            b'pieces': b''.join(hashes),
+        }
+        if self.file_count == 1:
+            info[b'length'] = self.size
+        else:
+            files = []
+            base = self.size // self.file_count
+            for i in range(self.file_count):
+                length = base if i < self.file_count - 1 else self.size - base * (self.file_count - 1)
+                files.append({b'length': length, b'path': [b'dir%d' % (i % 4), b'file%04d.bin' % i]})
+            info[b'files'] = files
+        self.info = info
+        self.info_hash = hashlib.sha1(bencodepy.encode(info)).digest()
+        return self
+
+    def write_torrent(self, announce_url: str) -> str:
+        path = os.path.join(self.directory, f"{self.name}.torrent")
+        with open(path, 'wb') as f:
+            f.write(bencodepy.encode({b'announce': announce_url.encode(), b'info': self.info}))
+        return path
+
+
+class _DelayedSender:
+    """Releases outgoing messages in order after the link's simulated delay."""
+
+    def __init__(self, sock: socket.socket, link: LinkProfile, rng: random.Random):
+        self.sock = sock
+        self.link = link
+        self.rng = rng
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.last_due = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send(self, data: bytes):
+        link = self.link
+        now = time.monotonic()
+        due = now + link.latency
+        if link.jitter:
+            due += self.rng.uniform(0, link.jitter)
+        if link.loss and self.rng.random() < link.loss:
+            # TCP hides the loss but the retransmission stalls the stream
+            due += link.retransmit_timeout + 2 * link.latency
+        if link.bandwidth:
+            due = max(due, self.last_due + len(data) / link.bandwidth)
+        due = max(due, self.last_due)
+        self.last_due = due
+        with self.cond:
+            self.queue.append((due, data))
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                due, data = self.queue.popleft()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                return
+
+
+class SeederPeer:
+
+    def __init__(self, torrent: SyntheticTorrent, link: Optional[LinkProfile] = None,
+                 host: str = '127.0.0.1', fast_extension: bool = True):
+        self.torrent = torrent
+        self.link = link or LinkProfile()
+        self.fast_extension = fast_extension
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, 0))
+        self.addr = self.server.getsockname()
+        self.peer_id = b'-SIM001-' + os.urandom(6).hex().encode()
+        self.fd = None
+        self.running = False
+        self.blocks_served = 0
+
+    def start(self):
+        self.fd = os.open(self.torrent.payload_path, os.O_RDONLY)
+        self.server.listen(64)
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.server.close()
+        except OSError:
+            pass
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _recv_exact(conn: socket.socket, length: int) -> bytes:
+        data = bytearray()
+        while len(data) < length:
+            chunk = conn.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("peer closed")
+            data += chunk
+        return bytes(data)
+
+    def _serve(self, conn: socket.socket):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sender = _DelayedSender(conn, self.link, random.Random())
+        torrent = self.torrent
+        num_pieces = len(torrent.info[b'pieces']) // 20
+        try:
+            handshake = self._recv_exact(conn, 68)
+            if handshake[28:48] != torrent.info_hash:
+                return
+            reserved = bytearray(8)
+            if self.fast_extension:
+                reserved[7] |= 0x04
+            sender.send(struct.pack('B', 19) + b'BitTorrent protocol' + bytes(reserved) + torrent.info_hash + self.peer_id)
+
+            if self.fast_extension:
+                sender.send(struct.pack('>IB', 1, 0x0E))
+            else:
+                bitfield = bytearray(b'\xff' * ((num_pieces + 7) // 8))
+                spare = len(bitfield) * 8 - num_pieces
+                if spare:
+                    bitfield[-1] = (0xFF << spare) & 0xFF
+                sender.send(struct.pack('>IB', len(bitfield) + 1, 5) + bytes(bitfield))
+            sender.send(struct.pack('>IB', 1, 1))
+
+            while self.running:
+                length = struct.unpack('>I', self._recv_exact(conn, 4))[0]
+                if length == 0:
+                    continue
+                message = self._recv_exact(conn, length)
+                if message[0] != 6 or length != 13:
+                    continue
+                index, begin, block_length = struct.unpack('>III', message[1:13])
+                offset = index * torrent.piece_length + begin
+                if index >= num_pieces or block_length > 131072 or offset + block_length > torrent.size:
+                    if self.fast_extension:
+                        sender.send(struct.pack('>IB', 13, 0x10) + message[1:13])
+                    continue
+                block = os.pread(self.fd, block_length, offset)
+                sender.send(struct.pack('>IBII', 9 + len(block), 7, index, begin) + block)
+                self.blocks_served += 1
+        except (ConnectionError, OSError, struct.error):
+            pass
+        finally:
+            sender.close()
+            conn.close()
+
+
+class HTTPTracker:
+
+    def __init__(self, peers: List[Tuple[str, int]], host: str = '127.0.0.1'):
+        self.peers = peers
+        tracker = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                query = dict(urllib.parse.parse_qsl(parsed.query, encoding='latin-1'))
+                if parsed.path != '/announce' or len(query.get('info_hash', '').encode('latin-1')) != 20:
+                    body = bencodepy.encode({b'failure reason': b'bad announce'})
+                else:
+                    body = bencodepy.encode({b'interval': 1800, b'peers': tracker.compact_peers()})
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.announce_url = f"http://{host}:{self.server.server_address[1]}/announce"
+
+    def compact_peers(self) -> bytes:
+        return b''.join(socket.inet_aton(ip) + struct.pack('>H', port) for ip, port in self.peers)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class UDPTracker:
+
+    def __init__(self, peers: List[Tuple[str, int]], host: str = '127.0.0.1', loss: float = 0.0):
+        self.peers = peers
+        self.loss = loss
+        self.rng = random.Random()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, 0))
+        self.announce_url = f"udp://{host}:{self.sock.getsockname()[1]}/announce"
+        self.connection_ids = set()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+    def _run(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except OSError:
+                return
+            if self.loss and self.rng.random() < self.loss:
+                continue
+            if len(data) < 16:
+                continue
+            connection_id, action, transaction_id = struct.unpack('>QII', data[:16])
+            if action == 0 and connection_id == 0x41727101980:
+                new_id = self.rng.getrandbits(64)
+                self.connection_ids.add(new_id)
+                self.sock.sendto(struct.pack('>IIQ', 0, transaction_id, new_id), addr)
+            elif action == 1 and connection_id in self.connection_ids and len(data) >= 98:
+                compact = b''.join(socket.inet_aton(ip) + struct.pack('>H', port) for ip, port in self.peers)
+                header = struct.pack('>IIIII', 1, transaction_id, 1800, 0, len(self.peers))
+                self.sock.sendto(header + compact, addr)
+
+
+class Swarm:
+
+    def __init__(self, torrent: SyntheticTorrent, seeders: int = 4, tracker: str = 'http',
+                 link: Optional[LinkProfile] = None, tracker_loss: float = 0.0):
+        self.torrent = torrent
+        self.link = link or LinkProfile()
+        self.seeders = [SeederPeer(torrent, self.link) for _ in range(seeders)]
+        peers = [seeder.addr for seeder in self.seeders]
+        if tracker == 'udp':
+            self.tracker = UDPTracker(peers, loss=tracker_loss)
+        else:
+            self.tracker = HTTPTracker(peers)
+
+    @property
+    def announce_url(self) -> str:
+        return self.tracker.announce_url
+
+    def start(self):
+        for seeder in self.seeders:
+            seeder.start()
+        self.tracker.start()
+
+    def stop(self):
+        self.tracker.stop()
+        for seeder in self.seeders:
+            seeder.stop()
@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bencodepy
+
+from fileManager.DiskScheduler import DiskScheduler
+from fileManager.FileManager import FileManager
+from getPeers import Extensions
+from getPeers.Peers import Peer
+from getPeers.get_peers_https import get_peers_https
+from getPeers.get_peers_udp import get_peers_udp
+from pieceManager.PieceManager import PieceManager
+from torrent.TorrentFile import TorrentFile
+
+
+BLOCK_SIZE = 16384
+MB = 1024 * 1024
+
+
+class BenchTorrent:
+    """Just the attributes PieceManager and FileManager read from a Torrent."""
+
+    def __init__(self, total_length: int, piece_length: int, file_lengths=None, name: str = 'bench'):
+        self.name = name
+        self.piece_length = piece_length
+        self.total_length = total_length
+        self.num_pieces = (total_length + piece_length - 1) // piece_length
+        self.pieces = b'\x00' * 20 * self.num_pieces
+        self.info_hash = b'\x01' * 20
+        self.files = []
+        offset = 0
+        for i, length in enumerate(file_lengths or [total_length]):
+            self.files.append(TorrentFile([f"d{i % 16}", f"f{i}.bin"], length, offset))
+            offset += length
+
+    def get_piece_hash(self, piece_index: int) -> bytes:
+        start = piece_index * 20
+        return self.pieces[start:start + 20]
+
+
+class _BufferSocket:
+
+    def __init__(self, data: bytes):
+        self.view = memoryview(data)
+        self.pos = 0
+
+    def recv(self, size: int) -> bytes:
+        chunk = self.view[self.pos:self.pos + size].tobytes()
+        self.pos += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+def best_of(repeat: int, fn) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_framing(quick: bool) -> dict:
+    count = 2000 if quick else 20000
+    block = os.urandom(BLOCK_SIZE)
+    message = struct.pack('>IBII', 9 + BLOCK_SIZE, 7, 0, 0) + block
+    stream = message * count
+
+    def run():
+        peer = Peer('127.0.0.1', 1, b'\x01' * 20, b'\x02' * 20)
+        peer.socket = _BufferSocket(stream)
+        peer.connected = True
+        for _ in range(count):
+            peer.receive_message()
+
+    seconds = best_of(3, run)
+    return {'messages': count, 'seconds': seconds, 'messages_per_second': count / seconds,
+            'mb_per_second': len(stream) / MB / seconds}
+
+
+def bench_add_block(quick: bool) -> dict:
+    results = {}
+    for piece_length in (256 * 1024, 4 * MB):
+        pieces = max(1, (2 if quick else 16) * MB // piece_length)
+        torrent = BenchTorrent(piece_length * pieces, piece_length)
+        blocks = [(begin, os.urandom(BLOCK_SIZE)) for begin in range(0, piece_length, BLOCK_SIZE)]
+
+        def run():
+            pm = PieceManager(torrent)
+            for index in range(pieces):
+                for begin, data in blocks:
+                    pm.add_block(index, begin, data)
+
+        seconds = best_of(3 if piece_length <= MB else 1, run)
+        results[f"piece_{piece_length // 1024}k"] = {'pieces_per_second': pieces / seconds,
+                                                     'mb_per_second': pieces * piece_length / MB / seconds}
+    return results
+
+
+def bench_verify_piece(quick: bool) -> dict:
+    piece_length = 256 * 1024
+    pieces = 50 if quick else 400
+    torrent = BenchTorrent(piece_length * pieces, piece_length)
+    pm = PieceManager(torrent)
+    data = os.urandom(piece_length)
+
+    def run():
+        for index in range(pieces):
+            pm.verify_piece(index, data)
+
+    seconds = best_of(3, run)
+    return {'pieces_per_second': pieces / seconds, 'mb_per_second': pieces * piece_length / MB / seconds}
+
+
+def bench_get_next_piece(quick: bool) -> dict:
+    results = {}
+    sizes = (10_000, 100_000) if quick else (10_000, 100_000, 1_000_000)
+    for num_pieces in sizes:
+        torrent = BenchTorrent(num_pieces * BLOCK_SIZE, BLOCK_SIZE)
+        pm = PieceManager(torrent)
+        # Late in a download: most pieces are done and the picker has to skip them
+        done = int(num_pieces * 0.9)
+        for index in range(done):
+            pm.mark_piece(index)
+        calls = max(5, 2_000_000 // num_pieces) if quick else max(20, 20_000_000 // num_pieces)
+
+        def run():
+            for _ in range(calls):
+                index = pm.get_next_piece('bench')
+                pm.release_piece(index)
+
+        seconds = best_of(3, run)
+        results[str(num_pieces)] = {'calls_per_second': calls / seconds, 'microseconds_per_call': seconds / calls * 1e6}
+    return results
+
+
+def bench_write_piece_data(quick: bool) -> dict:
+    results = {}
+    total = (16 if quick else 64) * MB
+    piece_length = 256 * 1024
+    for label, file_count in (('1_file', 1), ('100_files', 100), ('2000_small_files', 2000)):
+        rng = random.Random(file_count)
+        weights = [rng.random() + 0.1 for _ in range(file_count)]
+        lengths = [int(total * w / sum(weights)) for w in weights]
+        lengths[-1] += total - sum(lengths)
+        directory = tempfile.mkdtemp(prefix='micro-write-')
+        try:
+            torrent = BenchTorrent(total, piece_length, lengths)
+            fm = FileManager(torrent, directory)
+            fm.create_files()
+            data = os.urandom(piece_length)
+
+            def run():
+                for index in range(torrent.num_pieces):
+                    fm.write_piece_data(index, data[:min(piece_length, total - index * piece_length)])
+
+            seconds = best_of(2, run)
+            results[label] = {'mb_per_second': total / MB / seconds}
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def bench_disk_scheduler(quick: bool) -> dict:
+    # Pieces finishing in random order, written directly versus through the scheduler
+    results = {}
+    total = (16 if quick else 64) * MB
+    piece_length = 256 * 1024
+    torrent = BenchTorrent(total, piece_length, [total // 4] * 4)
+    order = list(range(torrent.num_pieces))
+    random.Random(0).shuffle(order)
+    data = os.urandom(piece_length)
+    for label in ('direct', 'scheduled'):
+        directory = tempfile.mkdtemp(prefix='micro-disk-')
+        try:
+            fm = FileManager(torrent, directory)
+            fm.create_files()
+
+            def run():
+                if label == 'direct':
+                    for index in order:
+                        fm.write_piece_data(index, data)
+                    return
+                scheduler = DiskScheduler(fm)
+                for index in order:
+                    scheduler.submit(index, data)
+                scheduler.close()
+
+            seconds = best_of(2, run)
+            fm.close()
+            results[label] = {'mb_per_second': total / MB / seconds}
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def bench_compact_peers(quick: bool) -> dict:
+    count = 200
+    peers = [(socket.inet_ntoa(struct.pack('>I', random.getrandbits(32))), random.randint(1, 65535)) for _ in range(count)]
+    compact = Extensions.encode_compact_peers(peers)
+    response = bencodepy.encode({b'interval': 1800, b'peers': compact})
+    torrent = BenchTorrent(BLOCK_SIZE, BLOCK_SIZE)
+    rounds = 200 if quick else 2000
+    http_client = get_peers_https(torrent, b'\x02' * 20)
+    udp_client = get_peers_udp(torrent, b'\x02' * 20)
+
+    results = {}
+    for label, fn in (('http_response', lambda: http_client.parse_tracker_response(response)),
+                      ('udp_compact', lambda: udp_client._parse_peers(compact)),
+                      ('pex_compact', lambda: Extensions.parse_compact_peers(compact))):
+        seconds = best_of(3, lambda: [fn() for _ in range(rounds)])
+        results[label] = {'peers_per_second': rounds * count / seconds}
+    return results
+
+
+BENCHMARKS = {
+    'framing': bench_framing,
+    'add_block': bench_add_block,
+    'verify_piece': bench_verify_piece,
+    'get_next_piece': bench_get_next_piece,
+    'write_piece_data': bench_write_piece_data,
+    'disk_scheduler': bench_disk_scheduler,
+    'compact_peers': bench_compact_peers,
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the download hot paths")
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument('--quick', action='store_true', help="smaller inputs for a fast smoke run")
+    parser.add_argument('--label', default='')
+    parser.add_argument('--output', help="append the JSON result to this file")
+    args = parser.parse_args(argv)
+
+    results = {'label': args.label, 'timestamp': time.time(), 'quick': args.quick}
+    for name in args.only or BENCHMARKS:
+        results[name] = BENCHMARKS[name](args.quick)
+
+    line = json.dumps(results, sort_keys=True)
+    print(line)
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(line + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.SwarmSimulator import LinkProfile, Swarm, SyntheticTorrent
+from downloadSession.DownloadSession import DownloadSession
+from downloadSession.MultiProcessSession import MultiProcessSession
+from log.Log import configure, set_level
+from torrent.Torrent import Torrent
+from tracker.TrackerClient import TrackerClient
+
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+def parse_size(text: str) -> int:
+    units = {'k': 1024, 'm': MB, 'g': GB}
+    text = text.strip().lower().rstrip('b').rstrip('i')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def link_from_args(args) -> LinkProfile:
+    return LinkProfile(args.latency_ms / 1000, args.jitter_ms / 1000, args.loss,
+                       parse_size(args.bandwidth) if args.bandwidth else None)
+
+
+def _run_swarm(torrent: SyntheticTorrent, args, ready, stop):
+    # Seeders and tracker live in their own process so their CPU time and
+    # memory never show up in the client's measurements
+    swarm = Swarm(torrent, args.seeders, args.tracker, link_from_args(args), args.tracker_loss)
+    swarm.start()
+    ready.put(swarm.announce_url)
+    stop.wait()
+    swarm.stop()
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_once(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='swarm-bench-')
+    try:
+        synthetic = SyntheticTorrent(os.path.join(workdir, 'seed'), parse_size(args.size),
+                                     parse_size(args.piece_length), args.files).generate()
+
+        ready = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        swarm_process = multiprocessing.Process(target=_run_swarm, args=(synthetic, args, ready, stop), daemon=True)
+        swarm_process.start()
+        try:
+            announce_url = ready.get(timeout=30)
+            torrent_path = synthetic.write_torrent(announce_url)
+
+            usage_before = resource.getrusage(resource.RUSAGE_SELF)
+            children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            started = time.monotonic()
+
+            torrent = Torrent(torrent_path)
+            peer_id = b'-TS0001-' + os.urandom(6).hex().encode()
+            # Loopback answers in microseconds, no need for BEP 15's 15 s first timeout
+            peers = TrackerClient(torrent, peer_id, use_dht=False, udp_timeout=0.5).get_peers()
+            announce_done = time.monotonic()
+            if not peers:
+                raise RuntimeError(f"tracker at {announce_url} returned no peers")
+
+            if args.processes > 1:
+                session = MultiProcessSession(torrent, peer_id, os.path.join(workdir, 'download'),
+                                              processes=args.processes, max_connections=args.seeders)
+            else:
+                session = DownloadSession(torrent, peer_id, os.path.join(workdir, 'download'),
+                                          max_connections=args.seeders)
+            session.add_peers(peers)
+            session.start()
+            completed = session.wait(args.timeout)
+            finished = time.monotonic()
+            session.stop()
+
+            usage_after = resource.getrusage(resource.RUSAGE_SELF)
+            # Download workers have been joined by now, the swarm process has not
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            stats = session.get_stats()['torrent']
+        finally:
+            stop.set()
+            swarm_process.join(timeout=10)
+
+        elapsed = finished - started
+        cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime) \
+            + (children_after.ru_utime - children_before.ru_utime) + (children_after.ru_stime - children_before.ru_stime)
+        verified = stats['verified_bytes']
+        return {
+            'label': args.label,
+            'revision': _git_revision(),
+            'timestamp': time.time(),
+            'size': synthetic.size,
+            'piece_length': synthetic.piece_length,
+            'files': synthetic.file_count,
+            'seeders': args.seeders,
+            'processes': args.processes,
+            'tracker': args.tracker,
+            'link': link_from_args(args).to_dict(),
+            'completed': completed,
+            'peers_from_tracker': len(peers),
+            'announce_seconds': announce_done - started,
+            'elapsed_seconds': elapsed,
+            'mb_per_second': verified / MB / elapsed if elapsed else 0.0,
+            'cpu_seconds': cpu,
+            'cpu_seconds_per_gb': cpu / (verified / GB) if verified else None,
+            # ru_maxrss is reported in KiB on Linux
+            'peak_rss_mb': max(usage_after.ru_maxrss, children_after.ru_maxrss) / 1024,
+            'time_to_first_piece': stats['time_to_first_piece'],
+            'hash_failures': stats['hash_failures'],
+            'wasted_bytes': stats['wasted_bytes'],
+            'request_timeouts': stats['request_timeouts'],
+            'request_rtt_p50': stats['request_rtt']['p50'],
+            'disk_write_p99': stats['disk_write_latency']['p99'],
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end download benchmark against a loopback swarm")
+    parser.add_argument('--size', default='64M', help="total torrent size, e.g. 64M or 1G")
+    parser.add_argument('--piece-length', default='256K')
+    parser.add_argument('--files', type=int, default=1)
+    parser.add_argument('--seeders', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=1, help="download worker processes, 1 runs in-process")
+    parser.add_argument('--tracker', choices=('http', 'udp'), default='http')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="one-way latency added by each seeder")
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--loss', type=float, default=0.0, help="probability a message stalls for a retransmit")
+    parser.add_argument('--tracker-loss', type=float, default=0.0, help="UDP tracker packet drop probability")
+    parser.add_argument('--bandwidth', default=None, help="per-seeder upload cap in bytes/s, e.g. 10M")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--label', default='')
+    parser.add_argument('--output', help="append one JSON result per line to this file")
+    parser.add_argument('--keep', action='store_true', help="keep the generated files")
+    parser.add_argument('--log-level', default='WARNING', help="level for the client's log on stderr")
+    parser.add_argument('--debug', action='append', default=[], metavar='MODULE',
+                        help="log this module (e.g. downloadSession, tracker.udp) at DEBUG")
+    args = parser.parse_args(argv)
+
+    configure(args.log_level)
+    for module in args.debug:
+        set_level(module, 'DEBUG')
+
+    failures = 0
+    for _ in range(args.repeat):
+        result = run_once(args)
+        line = json.dumps(result, sort_keys=True)
+        print(line)
+        if args.output:
+            with open(args.output, 'a') as f:
+                f.write(line + '\n')
+        failures += not result['completed']
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,8 @@ from rich.panel import Panel
 from rich.layout import Layout
 from rich.live import Live
 from rich.text import Text
+import threading
+import time
 
 
 
@@ -12,8 +14,10 @@ from rich.text import Text
 
 
 class RichBitTorrentDisplay:
-    def __init__(self):
-        self.console = Console()
+    def __init__(self, headless=False, refresh_per_second=4):
+        self.headless = headless
+        self.refresh_per_second = refresh_per_second
+        self.console = Console(quiet=headless)
         self.progress = Progress(
             TextColumn("[bold blue]{task.fields[filename]}", justify="left"),
             BarColumn(bar_width=None),
@@ -38,6 +42,15 @@ class RichBitTorrentDisplay:
             'total_pieces': 0,
             'connected_time': 0
         }
+        self._layout = None
+        self._stats_key = None
+        self._stats_panel = None
+        self._stats_cells = []
+        self._peers_key = None
+        self._peers_panel = None
+        self._peers_cells = []
+        self._live_thread = None
+        self._live_stop = threading.Event()
         
     def start_download(self, filename, total_size, total_pieces):
         
@@ -68,7 +81,8 @@ class RichBitTorrentDisplay:
                     'status': 'Connected' if peer.connected else 'Disconnected',
                     'download_speed': getattr(peer, 'download_speed', 0),
                     'upload_speed': getattr(peer, 'upload_speed', 0),
-                    'pieces': getattr(peer, 'pieces_count', 0)
+                    'pieces': getattr(peer, 'pieces_count', 0),
+                    'connected_time': int(time.monotonic() - peer.stats.connected_at) if hasattr(peer, 'stats') else None
                 })
         
         self.stats['active_peers'] = active_count
@@ -77,75 +91,169 @@ class RichBitTorrentDisplay:
     def update_pieces(self, completed_pieces):
     
         self.stats['pieces_completed'] = completed_pieces
+
+    def update_speed(self, download_speed, upload_speed):
+
+        self.stats['download_speed'] = download_speed
+        self.stats['upload_speed'] = upload_speed
     
-    def create_stats_panel(self):
-       
-        stats_table = Table(show_header=False, box=None, padding=(0, 1))
-        stats_table.add_column("Stat", style="cyan", width=15)
-        stats_table.add_column("Value", style="white")
-        
-      
+    def apply_snapshot(self, snapshot):
+
+        torrent = snapshot['torrent']
+        self.update_progress(torrent.get('verified_bytes', torrent['downloaded']))
+        self.update_speed(torrent['download_speed'], torrent['upload_speed'])
+        self.update_pieces(torrent['pieces_completed'])
+        self.stats['total_pieces'] = torrent['total_pieces']
+        self.stats['total_peers'] = torrent.get('known_peers', len(snapshot['peers']))
+        self.stats['active_peers'] = len(snapshot['peers'])
+        self.peers_data = [{
+            'ip': peer['ip'],
+            'port': peer['port'],
+            'status': 'Connected',
+            'download_speed': peer['download_speed'],
+            'upload_speed': peer['upload_speed'],
+            'pieces': peer['pieces'],
+            'connected_time': int(peer['connected_seconds'])
+        } for peer in snapshot['peers']]
+
+    def start_live(self, snapshot_fn):
+
+        if self.headless or self._live_thread:
+            return
+        self._live_stop.clear()
+        self._live_thread = threading.Thread(target=self._live_loop, args=(snapshot_fn,), name='display', daemon=True)
+        self._live_thread.start()
+
+    def stop_live(self):
+
+        self._live_stop.set()
+        if self._live_thread:
+            self._live_thread.join(timeout=2)
+            self._live_thread = None
+
+    def _live_loop(self, snapshot_fn):
+
+        interval = 1 / self.refresh_per_second
+        # Download threads never touch the renderer, this thread pulls a
+        # snapshot at a fixed rate and only redraws what changed
+        with Live(self.create_layout(), console=self.console, auto_refresh=False, transient=False) as live:
+            while not self._live_stop.wait(interval):
+                try:
+                    self.apply_snapshot(snapshot_fn())
+                except Exception as e:
+                    self.log_message(f"Display snapshot failed: {e}", "red")
+                    continue
+                live.update(self.create_layout(), refresh=True)
+
+    def _stats_rows(self):
+
         dl_speed = f"{self.stats['download_speed'] / 1024 / 1024:.2f} MB/s" if self.stats['download_speed'] > 0 else "0 MB/s"
         ul_speed = f"{self.stats['upload_speed'] / 1024 / 1024:.2f} MB/s" if self.stats['upload_speed'] > 0 else "0 MB/s"
-        
-      
         downloaded_mb = self.stats['downloaded'] / 1024 / 1024
-        
-        stats_table.add_row("Downloaded:", f"{downloaded_mb:.2f} MB")
-        stats_table.add_row("Active Peers:", f"[bold]{self.stats['active_peers']}/{self.stats['total_peers']}[/bold]")
-        stats_table.add_row("Pieces:", f"{self.stats['pieces_completed']}/{self.stats['total_pieces']}")
-        
-      
+
+        rows = [
+            ("Downloaded:", f"{downloaded_mb:.2f} MB", ""),
+            ("Download:", dl_speed, ""),
+            ("Upload:", ul_speed, ""),
+            ("Active Peers:", f"{self.stats['active_peers']}/{self.stats['total_peers']}", "bold"),
+            ("Pieces:", f"{self.stats['pieces_completed']}/{self.stats['total_pieces']}", ""),
+        ]
         if self.stats['active_peers'] > 0:
             connection_status = "🟢 Good" if self.stats['active_peers'] >= 10 else "🟡 Fair" if self.stats['active_peers'] >= 5 else "🔴 Poor"
-            stats_table.add_row("Connection:", connection_status)
-        
-        return Panel(stats_table, title="[bold cyan]Statistics[/bold cyan]", border_style="blue")
-    
+            rows.append(("Connection:", connection_status, ""))
+        return rows
+
+    def create_stats_panel(self):
+
+        rows = self._stats_rows()
+        # Speeds and byte counts change every tick, only the set of rows
+        # decides the table's shape; values are rewritten in place
+        key = tuple(label for label, _, _ in rows)
+        if key == self._stats_key:
+            for cell, (_, value, _) in zip(self._stats_cells, rows):
+                cell.plain = value
+            return self._stats_panel
+
+        stats_table = Table(show_header=False, box=None, padding=(0, 1))
+        stats_table.add_column("Stat", style="cyan", width=15)
+        stats_table.add_column("Value", style="white")
+        self._stats_cells = []
+        for label, value, style in rows:
+            cell = Text(value, style=style)
+            self._stats_cells.append(cell)
+            stats_table.add_row(label, cell)
+
+        self._stats_key = key
+        self._stats_panel = Panel(stats_table, title="[bold cyan]Statistics[/bold cyan]", border_style="blue")
+        return self._stats_panel
+
     def create_peers_panel(self):
-     
+
+        rows = [
+            (f"{peer['ip']}:{peer['port']}", peer['status'], f"{peer['download_speed'] / 1024 / 1024:.2f}",
+             str(peer['pieces']),
+             f"{peer['connected_time']}s" if peer.get('connected_time') is not None else "Unknown")
+            for peer in self.peers_data[:15]
+        ]
+        # The same peers in the same order keep their table, only the
+        # cells that changed are rewritten
+        key = (tuple((address, status) for address, status, _, _, _ in rows), len(self.peers_data))
+        if key == self._peers_key:
+            for cells, row in zip(self._peers_cells, rows):
+                for cell, value in zip(cells, row[2:]):
+                    cell.plain = value
+            return self._peers_panel
+        self._peers_key = key
+
         if not self.peers_data:
-            return Panel("[dim]No active peers[/dim]", title="[bold green]Active Peers[/bold green]", border_style="green")
+            self._peers_cells = []
+            self._peers_panel = Panel("[dim]No active peers[/dim]", title="[bold green]Active Peers[/bold green]", border_style="green")
+            return self._peers_panel
         
         peers_table = Table(show_header=True, header_style="bold magenta")
         peers_table.add_column("IP:Port", width=21)
         peers_table.add_column("Status", width=12)
+        peers_table.add_column("Down MB/s", width=10)
+        peers_table.add_column("Pieces", width=8)
         peers_table.add_column("Connected", width=12)
         
-       
-        for i, peer in enumerate(self.peers_data[:15]):
-            status_color = "green" if peer['status'] == "Connected" else "red"
-           
-            connected_time = getattr(peer, 'connected_time', 'Unknown')
-            
-            peers_table.add_row(
-                f"{peer['ip']}:{peer['port']}",
-                f"[{status_color}]{peer['status']}[/{status_color}]",
-                f"[dim]{connected_time}[/dim]"
-            )
+        self._peers_cells = []
+        for address, status, download_speed, pieces, connected in rows:
+            status_color = "green" if status == "Connected" else "red"
+            cells = (Text(download_speed), Text(pieces), Text(connected, style="dim"))
+            self._peers_cells.append(cells)
+            peers_table.add_row(address, Text(status, style=status_color), *cells)
         
         title = f"[bold green]Active Peers ({len(self.peers_data)})[/bold green]"
-        return Panel(peers_table, title=title, border_style="green")
+        self._peers_panel = Panel(peers_table, title=title, border_style="green")
+        return self._peers_panel
     
     def create_layout(self):
         
-        layout = Layout()
-        
-        layout.split(
-            Layout(name="progress", size=3),
-            Layout(name="main"),
-        )
-        
-        layout["main"].split_row(
-            Layout(name="stats", ratio=1),
-            Layout(name="peers", ratio=2),
-        )
-        
-        layout["progress"].update(self.progress)
-        layout["stats"].update(self.create_stats_panel())
-        layout["peers"].update(self.create_peers_panel())
+        if self._layout is None:
+            layout = Layout()
+            
+            layout.split(
+                Layout(name="progress", size=3),
+                Layout(name="main"),
+            )
+            
+            layout["main"].split_row(
+                Layout(name="stats", ratio=1),
+                Layout(name="peers", ratio=2),
+            )
+            
+            layout["progress"].update(self.progress)
+            self._layout = layout
+
+        stats_panel = self._stats_panel
+        peers_panel = self._peers_panel
+        if self.create_stats_panel() is not stats_panel or stats_panel is None:
+            self._layout["stats"].update(self._stats_panel)
+        if self.create_peers_panel() is not peers_panel or peers_panel is None:
+            self._layout["peers"].update(self._peers_panel)
         
-        return layout
+        return self._layout
     
     def display_header(self):
        
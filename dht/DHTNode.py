@@ -0,0 +1,355 @@
+import asyncio
+import hashlib
+import os
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import bencodepy
+
+from dht.RoutingTable import (
+    K, NodeInfo, RoutingTable, decode_compact_nodes, decode_compact_peers,
+    distance, encode_compact_nodes,
+)
+
+
+BOOTSTRAP_NODES = [
+    ('router.bittorrent.com', 6881),
+    ('dht.transmissionbt.com', 6881),
+    ('router.utorrent.com', 6881),
+]
+
+ALPHA = 3
+QUERY_TIMEOUT = 2.0
+TOKEN_ROTATE_INTERVAL = 300
+PEER_TTL = 30 * 60
+MAX_PEERS_PER_TORRENT = 200
+
+
+class KRPCError(Exception):
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class _KRPCProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, node: 'DHTNode'):
+        self.node = node
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        self.node._datagram_received(data, addr)
+
+    def error_received(self, exc: Exception):
+        pass
+
+
+class DHTNode:
+
+    def __init__(self, node_id: Optional[bytes] = None, cache_path: Optional[str] = None,
+                 k: int = K, alpha: int = ALPHA, query_timeout: float = QUERY_TIMEOUT):
+        self.cache_path = cache_path
+        cached_id, self._cached_nodes = self.load_cache(cache_path) if cache_path else (None, [])
+        self.node_id = node_id or cached_id or os.urandom(20)
+        self.k = k
+        self.alpha = alpha
+        self.query_timeout = query_timeout
+        self.routing_table = RoutingTable(self.node_id, k)
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.port = 0
+
+        self._pending: Dict[bytes, Tuple[asyncio.Future, Tuple[str, int]]] = {}
+        self._next_tid = 0
+        self._secret = os.urandom(16)
+        self._prev_secret = self._secret
+        self._secret_rotated = time.monotonic()
+        # info_hash -> {(ip, port): announce time}
+        self.peer_store: Dict[bytes, Dict[Tuple[str, int], float]] = {}
+
+    async def start(self, host: str = '0.0.0.0', port: int = 6881):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _KRPCProtocol(self), local_addr=(host, port))
+        self.port = self.transport.get_extra_info('sockname')[1]
+
+    def close(self):
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    # ------------------------------------------------------------------
+    # Wire handling
+    # ------------------------------------------------------------------
+
+    def _new_tid(self) -> bytes:
+        while True:
+            self._next_tid = (self._next_tid + 1) & 0xFFFF
+            tid = struct.pack('>H', self._next_tid)
+            if tid not in self._pending:
+                return tid
+
+    def _send(self, message: dict, addr: Tuple[str, int]):
+        if self.transport:
+            self.transport.sendto(bencodepy.encode(message), addr)
+
+    def _datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        try:
+            message = bencodepy.decode(data)
+            kind = message[b'y']
+            tid = message[b't']
+        except Exception:
+            return
+
+        if kind == b'q':
+            self._handle_query(message, tid, addr)
+        elif kind in (b'r', b'e'):
+            pending = self._pending.get(tid)
+            if pending is None:
+                return
+            future, expected_addr = pending
+            # Another node behind the same IP can answer with a colliding
+            # tid, so the reply must come from the exact address we asked
+            if addr[:2] != expected_addr or future.done():
+                return
+            del self._pending[tid]
+            if kind == b'e':
+                code, text = (message.get(b'e') or [201, b'Generic Error'])[:2]
+                future.set_exception(KRPCError(code, text.decode('utf-8', 'replace')))
+                return
+            response = message.get(b'r', {})
+            node_id = response.get(b'id', b'')
+            if len(node_id) == 20:
+                self.routing_table.add_node(NodeInfo(node_id, addr[0], addr[1]))
+            future.set_result(response)
+
+    async def _query(self, addr: Tuple[str, int], method: str, args: dict) -> dict:
+        tid = self._new_tid()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tid] = (future, (addr[0], int(addr[1])))
+        args = dict(args)
+        args[b'id'] = self.node_id
+        self._send({b't': tid, b'y': b'q', b'q': method.encode(), b'a': args}, addr)
+        try:
+            return await asyncio.wait_for(future, self.query_timeout)
+        finally:
+            self._pending.pop(tid, None)
+
+    # ------------------------------------------------------------------
+    # Server side
+    # ------------------------------------------------------------------
+
+    def _token_for(self, ip: str, secret: Optional[bytes] = None) -> bytes:
+        return hashlib.sha1((secret or self._secret) + socket.inet_aton(ip)).digest()[:8]
+
+    def _rotate_secret(self):
+        now = time.monotonic()
+        if now - self._secret_rotated > TOKEN_ROTATE_INTERVAL:
+            self._prev_secret = self._secret
+            self._secret = os.urandom(16)
+            self._secret_rotated = now
+
+    def _valid_token(self, token: bytes, ip: str) -> bool:
+        self._rotate_secret()
+        return token in (self._token_for(ip), self._token_for(ip, self._prev_secret))
+
+    def _handle_query(self, message: dict, tid: bytes, addr: Tuple[str, int]):
+        method = message.get(b'q', b'')
+        args = message.get(b'a', {})
+        sender_id = args.get(b'id', b'')
+        if len(sender_id) != 20:
+            self._send({b't': tid, b'y': b'e', b'e': [203, b'Protocol Error']}, addr)
+            return
+        self.routing_table.add_node(NodeInfo(sender_id, addr[0], addr[1]))
+
+        response = {b'id': self.node_id}
+        if method == b'ping':
+            pass
+        elif method == b'find_node':
+            target = args.get(b'target', b'')
+            response[b'nodes'] = encode_compact_nodes(self.routing_table.closest(target, self.k))
+        elif method == b'get_peers':
+            info_hash = args.get(b'info_hash', b'')
+            self._rotate_secret()
+            response[b'token'] = self._token_for(addr[0])
+            peers = self._stored_peers(info_hash)
+            if peers:
+                response[b'values'] = [socket.inet_aton(ip) + struct.pack('>H', port) for ip, port in peers]
+            else:
+                response[b'nodes'] = encode_compact_nodes(self.routing_table.closest(info_hash, self.k))
+        elif method == b'announce_peer':
+            if not self._valid_token(args.get(b'token', b''), addr[0]):
+                self._send({b't': tid, b'y': b'e', b'e': [203, b'Bad token']}, addr)
+                return
+            port = addr[1] if args.get(b'implied_port') else args.get(b'port', 0)
+            self._store_peer(args.get(b'info_hash', b''), (addr[0], port))
+        else:
+            self._send({b't': tid, b'y': b'e', b'e': [204, b'Method Unknown']}, addr)
+            return
+
+        self._send({b't': tid, b'y': b'r', b'r': response}, addr)
+
+    def _store_peer(self, info_hash: bytes, peer: Tuple[str, int]):
+        if len(info_hash) != 20 or not peer[1]:
+            return
+        peers = self.peer_store.setdefault(info_hash, {})
+        peers[peer] = time.monotonic()
+        if len(peers) > MAX_PEERS_PER_TORRENT:
+            oldest = min(peers, key=peers.get)
+            del peers[oldest]
+
+    def _stored_peers(self, info_hash: bytes) -> List[Tuple[str, int]]:
+        peers = self.peer_store.get(info_hash)
+        if not peers:
+            return []
+        cutoff = time.monotonic() - PEER_TTL
+        for peer in [p for p, seen in peers.items() if seen < cutoff]:
+            del peers[peer]
+        return list(peers)[:50]
+
+    # ------------------------------------------------------------------
+    # Client side
+    # ------------------------------------------------------------------
+
+    async def ping(self, addr: Tuple[str, int]) -> Optional[bytes]:
+        try:
+            response = await self._query(addr, 'ping', {})
+            return response.get(b'id')
+        except (asyncio.TimeoutError, KRPCError, OSError):
+            return None
+
+    async def _query_node(self, node: NodeInfo, method: str, target: bytes) -> Optional[dict]:
+        key = b'target' if method == 'find_node' else b'info_hash'
+        try:
+            return await self._query(node.addr, method, {key: target})
+        except (asyncio.TimeoutError, KRPCError, OSError):
+            return None
+
+    async def _iterative_lookup(self, target: bytes, method: str,
+                                max_peers: int = 0) -> Tuple[Set[Tuple[str, int]], List[Tuple[NodeInfo, bytes]]]:
+        shortlist: Dict[bytes, NodeInfo] = {n.node_id: n for n in self.routing_table.closest(target, self.k)}
+        queried: Set[bytes] = set()
+        responded: Dict[bytes, Tuple[NodeInfo, bytes]] = {}
+        peers: Set[Tuple[str, int]] = set()
+        in_flight: Dict[asyncio.Task, NodeInfo] = {}
+
+        def by_distance(node: NodeInfo) -> int:
+            return distance(node.node_id, target)
+
+        try:
+            while True:
+                closest = sorted(shortlist.values(), key=by_distance)[:self.k]
+                pending = [n for n in closest if n.node_id not in queried]
+                while pending and len(in_flight) < self.alpha:
+                    node = pending.pop(0)
+                    queried.add(node.node_id)
+                    task = asyncio.ensure_future(self._query_node(node, method, target))
+                    in_flight[task] = node
+
+                if not in_flight:
+                    break
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node = in_flight.pop(task)
+                    response = task.result()
+                    if response is None:
+                        self.routing_table.mark_failed(node.node_id)
+                        shortlist.pop(node.node_id, None)
+                        continue
+
+                    for found in decode_compact_nodes(response.get(b'nodes', b'')):
+                        if found.node_id != self.node_id and found.node_id not in shortlist:
+                            shortlist[found.node_id] = found
+                    values = response.get(b'values')
+                    if isinstance(values, list):
+                        peers.update(decode_compact_peers(values))
+                    token = response.get(b'token')
+                    if token:
+                        responded[node.node_id] = (node, token)
+
+                if max_peers and len(peers) >= max_peers:
+                    break
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        closest_responders = sorted(responded.values(), key=lambda item: by_distance(item[0]))[:self.k]
+        return peers, closest_responders
+
+    async def find_node(self, target: bytes) -> List[NodeInfo]:
+        await self._iterative_lookup(target, 'find_node')
+        return self.routing_table.closest(target, self.k)
+
+    async def get_peers(self, info_hash: bytes, max_peers: int = 0) -> List[Tuple[str, int]]:
+        peers, _ = await self._iterative_lookup(info_hash, 'get_peers', max_peers)
+        return list(peers)
+
+    async def announce_peer(self, info_hash: bytes, port: int = 0) -> List[Tuple[str, int]]:
+        peers, responders = await self._iterative_lookup(info_hash, 'get_peers')
+        args = {b'info_hash': info_hash, b'port': port or self.port, b'implied_port': 0 if port else 1}
+
+        async def announce(node: NodeInfo, token: bytes):
+            try:
+                await self._query(node.addr, 'announce_peer', {**args, b'token': token})
+            except (asyncio.TimeoutError, KRPCError, OSError):
+                pass
+
+        await asyncio.gather(*(announce(node, token) for node, token in responders))
+        return list(peers)
+
+    async def bootstrap(self, bootstrap_nodes: Optional[List[Tuple[str, int]]] = None):
+        cached = self._cached_nodes
+        self._cached_nodes = []
+        await asyncio.gather(*(self.ping(node.addr) for node in cached))
+
+        if len(self.routing_table) < self.k:
+            routers = BOOTSTRAP_NODES if bootstrap_nodes is None else bootstrap_nodes
+            loop = asyncio.get_running_loop()
+            for host, port in routers:
+                try:
+                    infos = await loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+                except OSError:
+                    continue
+                for info in infos[:1]:
+                    await self.ping(info[4][:2])
+
+        await self.find_node(self.node_id)
+
+    async def refresh(self, max_age: float = 15 * 60):
+        for bucket in self.routing_table.stale_buckets(max_age):
+            span = bucket.high - bucket.low
+            target = (bucket.low + int.from_bytes(os.urandom(20), 'big') % span).to_bytes(20, 'big')
+            await self.find_node(target)
+
+    # ------------------------------------------------------------------
+    # Node cache
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def load_cache(path: str) -> Tuple[Optional[bytes], List[NodeInfo]]:
+        try:
+            with open(path, 'rb') as f:
+                data = bencodepy.decode(f.read())
+            node_id = data.get(b'id')
+            return (node_id if node_id and len(node_id) == 20 else None,
+                    decode_compact_nodes(data.get(b'nodes', b'')))
+        except (OSError, bencodepy.exceptions.DecodingError, AttributeError):
+            return None, []
+
+    def save_cache(self, path: Optional[str] = None):
+        path = path or self.cache_path
+        if not path:
+            return
+        nodes = sorted(self.routing_table.all_nodes(), key=lambda n: (n.failures, -n.last_seen))
+        data = {b'id': self.node_id, b'nodes': encode_compact_nodes(nodes[:200])}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(bencodepy.encode(data))
+        os.replace(tmp_path, path)
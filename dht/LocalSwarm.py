@@ -0,0 +1,51 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from dht.DHTNode import DHTNode
+
+
+class LocalSwarm:
+    """Runs a set of DHT nodes on loopback so lookups can be exercised offline."""
+
+    def __init__(self, num_nodes: int = 32, host: str = '127.0.0.1', query_timeout: float = 0.5):
+        self.num_nodes = num_nodes
+        self.host = host
+        self.query_timeout = query_timeout
+        self.nodes: List[DHTNode] = []
+
+    async def start(self):
+        for _ in range(self.num_nodes):
+            node = DHTNode(query_timeout=self.query_timeout)
+            await node.start(self.host, 0)
+            self.nodes.append(node)
+
+        seed = [self.bootstrap_addr]
+        for node in self.nodes[1:]:
+            await node.bootstrap(seed)
+        # Second pass lets early joiners learn about nodes that came later
+        await asyncio.gather(*(node.bootstrap(seed) for node in self.nodes))
+
+    def close(self):
+        for node in self.nodes:
+            node.close()
+        self.nodes = []
+
+    async def __aenter__(self) -> 'LocalSwarm':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    @property
+    def bootstrap_addr(self) -> Tuple[str, int]:
+        return (self.host, self.nodes[0].port)
+
+    async def spawn_client(self, cache_path: Optional[str] = None) -> DHTNode:
+        node = DHTNode(cache_path=cache_path, query_timeout=self.query_timeout)
+        await node.start(self.host, 0)
+        await node.bootstrap([self.bootstrap_addr])
+        return node
+
+    async def announce(self, info_hash: bytes, peer_port: int, node_index: int = -1):
+        await self.nodes[node_index].announce_peer(info_hash, peer_port)
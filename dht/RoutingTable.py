@@ -0,0 +1,200 @@
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+K = 8
+ID_BITS = 160
+MAX_FAILURES = 2
+MAX_REPLACEMENTS = 8
+
+
+def distance(a: bytes, b: bytes) -> int:
+    return int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')
+
+
+class NodeInfo:
+
+    __slots__ = ('node_id', 'ip', 'port', 'last_seen', 'failures')
+
+    def __init__(self, node_id: bytes, ip: str, port: int):
+        self.node_id = node_id
+        self.ip = ip
+        self.port = port
+        self.last_seen = 0.0
+        self.failures = 0
+
+    @property
+    def addr(self) -> Tuple[str, int]:
+        return (self.ip, self.port)
+
+    def compact(self) -> bytes:
+        return self.node_id + socket.inet_aton(self.ip) + struct.pack('>H', self.port)
+
+    def __repr__(self) -> str:
+        return f"NodeInfo({self.node_id.hex()[:8]}, {self.ip}:{self.port})"
+
+
+def decode_compact_nodes(data: bytes) -> List[NodeInfo]:
+    nodes = []
+    for i in range(0, len(data) - 25, 26):
+        node_id = data[i:i + 20]
+        ip = socket.inet_ntoa(data[i + 20:i + 24])
+        port = struct.unpack('>H', data[i + 24:i + 26])[0]
+        if port:
+            nodes.append(NodeInfo(node_id, ip, port))
+    return nodes
+
+
+def encode_compact_nodes(nodes: List[NodeInfo]) -> bytes:
+    return b''.join(node.compact() for node in nodes)
+
+
+def decode_compact_peers(values: list) -> List[Tuple[str, int]]:
+    peers = []
+    for value in values:
+        if isinstance(value, bytes) and len(value) == 6:
+            ip = socket.inet_ntoa(value[:4])
+            port = struct.unpack('>H', value[4:])[0]
+            if port:
+                peers.append((ip, port))
+    return peers
+
+
+class KBucket:
+
+    def __init__(self, low: int, high: int, k: int = K):
+        self.low = low
+        self.high = high
+        self.k = k
+        # Least recently seen first, as in the Kademlia paper
+        self.nodes: List[NodeInfo] = []
+        self.replacements: List[NodeInfo] = []
+        self.last_changed = time.monotonic()
+
+    def covers(self, id_int: int) -> bool:
+        return self.low <= id_int < self.high
+
+    def is_full(self) -> bool:
+        return len(self.nodes) >= self.k
+
+    def find(self, node_id: bytes) -> Optional[NodeInfo]:
+        for node in self.nodes:
+            if node.node_id == node_id:
+                return node
+        return None
+
+    def add(self, node: NodeInfo) -> bool:
+        existing = self.find(node.node_id)
+        if existing:
+            self.nodes.remove(existing)
+            existing.ip, existing.port = node.ip, node.port
+            existing.last_seen = time.monotonic()
+            existing.failures = 0
+            self.nodes.append(existing)
+            self.last_changed = existing.last_seen
+            return True
+
+        node.last_seen = time.monotonic()
+        if not self.is_full():
+            self.nodes.append(node)
+            self.last_changed = node.last_seen
+            return True
+
+        for stale in self.nodes:
+            if stale.failures >= MAX_FAILURES:
+                self.nodes.remove(stale)
+                self.nodes.append(node)
+                self.last_changed = node.last_seen
+                return True
+
+        self.replacements = [n for n in self.replacements if n.node_id != node.node_id]
+        self.replacements.append(node)
+        del self.replacements[:-MAX_REPLACEMENTS]
+        return False
+
+    def remove(self, node_id: bytes):
+        node = self.find(node_id)
+        if node:
+            self.nodes.remove(node)
+            if self.replacements:
+                self.nodes.append(self.replacements.pop())
+
+    def split(self) -> Tuple['KBucket', 'KBucket']:
+        middle = (self.low + self.high) // 2
+        lower = KBucket(self.low, middle, self.k)
+        upper = KBucket(middle, self.high, self.k)
+        for node in self.nodes + self.replacements:
+            target = lower if int.from_bytes(node.node_id, 'big') < middle else upper
+            target.add(node)
+        return lower, upper
+
+
+class RoutingTable:
+
+    def __init__(self, own_id: bytes, k: int = K):
+        self.own_id = own_id
+        self.own_int = int.from_bytes(own_id, 'big')
+        self.k = k
+        self.buckets: List[KBucket] = [KBucket(0, 2 ** ID_BITS, k)]
+
+    def _bucket_index(self, node_id: bytes) -> int:
+        id_int = int.from_bytes(node_id, 'big')
+        for i, bucket in enumerate(self.buckets):
+            if bucket.covers(id_int):
+                return i
+        raise ValueError("node id out of range")
+
+    def add_node(self, node: NodeInfo) -> bool:
+        if node.node_id == self.own_id or len(node.node_id) != 20:
+            return False
+
+        while True:
+            index = self._bucket_index(node.node_id)
+            bucket = self.buckets[index]
+            if bucket.add(node):
+                return True
+            # Only the bucket holding our own id may split, which keeps the
+            # table at O(log n) buckets and dense around ourselves.
+            if not bucket.covers(self.own_int) or bucket.high - bucket.low <= self.k:
+                return False
+            self.buckets[index:index + 1] = bucket.split()
+
+    def mark_failed(self, node_id: bytes):
+        bucket = self.buckets[self._bucket_index(node_id)]
+        node = bucket.find(node_id)
+        if node is None:
+            return
+        node.failures += 1
+        if node.failures >= MAX_FAILURES and bucket.replacements:
+            bucket.remove(node_id)
+
+    def get_node(self, node_id: bytes) -> Optional[NodeInfo]:
+        return self.buckets[self._bucket_index(node_id)].find(node_id)
+
+    def closest(self, target: bytes, count: Optional[int] = None) -> List[NodeInfo]:
+        count = count or self.k
+        candidates = [n for n in self.all_nodes() if n.failures < MAX_FAILURES]
+        candidates.sort(key=lambda n: distance(n.node_id, target))
+        return candidates[:count]
+
+    def all_nodes(self) -> List[NodeInfo]:
+        nodes = []
+        for bucket in self.buckets:
+            nodes.extend(bucket.nodes)
+        return nodes
+
+    def stale_buckets(self, max_age: float) -> List[KBucket]:
+        now = time.monotonic()
+        return [b for b in self.buckets if now - b.last_changed > max_age]
+
+    def __len__(self) -> int:
+        return sum(len(bucket.nodes) for bucket in self.buckets)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'buckets': len(self.buckets),
+            'nodes': len(self),
+            'replacements': sum(len(b.replacements) for b in self.buckets),
+        }
@@ -0,0 +1,661 @@
+import random
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from getPeers.Peers import Peer
+from getPeers.PeerPool import PeerPool
+from pieceManager.PieceManager import PRIORITY_DEFAULT, PRIORITY_SKIP, PieceManager
+from pieceManager.SmartBan import SmartBan, split_blocks
+from fileManager.FileManager import FileManager
+from fileManager.DiskScheduler import DiskScheduler
+from fileManager.ReadCache import ReadCache
+from downloadSession.TimerWheel import Timer, TimerWheel
+from stats.Metrics import TorrentStats
+from log.Log import RateLimitedLog, get_logger
+
+logger = get_logger('downloadSession')
+# Per-peer events, keyed by kind so a large swarm cannot flood the log
+peer_log = RateLimitedLog(logger)
+
+
+BLOCK_SIZE = 16384
+MAX_SERVED_BLOCK = 131072
+PEX_INTERVAL = 60
+KEEPALIVE_INTERVAL = 90
+# Peers drop a connection after about two minutes without any message
+IDLE_TIMEOUT = 180
+SNUB_TIMEOUT = 60
+CHOKE_TIMEOUT = 300
+# Peers with nothing in flight block until woken, this is how often they
+# get a turn to pick up released pieces or newly urgent deadlines
+IDLE_WAKE_INTERVAL = 1.0
+# Upload slots are re-ranked this often, and one of them is handed to a
+# random interested peer for OPTIMISTIC_INTERVAL so newcomers get a chance
+UNCHOKE_INTERVAL = 10
+OPTIMISTIC_INTERVAL = 30
+
+
+class DownloadSession:
+
+    def __init__(self, torrent, peer_id: bytes, download_dir: str, listen_port: int = 6881,
+                 max_connections: int = 30, piece_manager: Optional[PieceManager] = None,
+                 file_manager: Optional[FileManager] = None, peer_pool: Optional[PeerPool] = None,
+                 disk_scheduler: Optional[DiskScheduler] = None, read_cache: Optional[ReadCache] = None,
+                 upload_slots: int = 4, seed: bool = False, keepalive_interval: float = KEEPALIVE_INTERVAL,
+                 idle_timeout: float = IDLE_TIMEOUT, snub_timeout: float = SNUB_TIMEOUT,
+                 choke_timeout: float = CHOKE_TIMEOUT, accept_incoming: bool = False):
+        self.torrent = torrent
+        self.peer_id = peer_id
+        self.listen_port = listen_port
+        self.piece_manager = piece_manager or PieceManager(torrent)
+        self.file_manager = file_manager or FileManager(torrent, download_dir)
+        self.peer_pool = peer_pool if peer_pool is not None else PeerPool(max_connections)
+        self.stats = TorrentStats()
+        self.smart_ban = SmartBan()
+        self.disk = disk_scheduler or DiskScheduler(self.file_manager, stats=self.stats)
+        if self.disk.on_failed is None:
+            self.disk.on_failed = self._write_failed
+        self.cache = read_cache or ReadCache(self.file_manager, disk=self.disk, stats=self.stats)
+        self.upload_slots = upload_slots
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+        self.snub_timeout = snub_timeout
+        self.choke_timeout = choke_timeout
+        self.timers = TimerWheel()
+        self.seed = seed
+        # A seed has nobody to dial, it is only useful if peers can reach it
+        self.accept_incoming = accept_incoming or seed
+        self.unchoked = set()
+        self.optimistic: Optional[Peer] = None
+        self.optimistic_at = 0.0
+        self.unchoke_lock = threading.Lock()
+        # Verified pieces in completion order, each peer announces the tail it has not seen
+        self.completed: List[int] = []
+        # Set once a piece is handed to the disk scheduler and can be read back
+        self.servable = bytearray(torrent.num_pieces)
+        self.piece_ready = threading.Condition()
+        self.workers: List[threading.Thread] = []
+        self.stop_event = threading.Event()
+        self.complete_event = threading.Event()
+        # Set when the download cannot go on, wait() raises it
+        self.error: Optional[BaseException] = None
+        self._connector = None
+        self._listener: Optional[socket.socket] = None
+
+    def add_peers(self, peers: List[Tuple[str, int]], source: str = 'tracker') -> int:
+        return self.peer_pool.add_peers(peers, source)
+
+    def start(self):
+        self.stats.started_at = time.monotonic()
+        self.file_manager.create_files()
+        self.timers.start()
+        self.timers.schedule(IDLE_WAKE_INTERVAL, self._wake_idle_peers)
+        self.timers.schedule(UNCHOKE_INTERVAL, self._rechoke)
+        if self.accept_incoming:
+            self._listener = socket.create_server(('', self.listen_port))
+            # Port 0 asks for any free port, peers learn the real one
+            self.listen_port = self._listener.getsockname()[1]
+            threading.Thread(target=self._listen_loop, name='listener', daemon=True).start()
+        self._connector = threading.Thread(target=self._connect_loop, name='connector', daemon=True)
+        self._connector.start()
+
+    def _running(self) -> bool:
+        return not self.stop_event.is_set() and (self.seed or not self.complete_event.is_set())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.complete_event.is_set():
+            if self.error is not None:
+                raise self.error
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self.complete_event.wait(0.5 if remaining is None else min(0.5, remaining))
+        return True
+
+    def read(self, offset: int, length: int, timeout: Optional[float] = None) -> bytes:
+        """Returns length bytes of the torrent's byte stream starting at
+        offset, blocking only until the pieces covering them are verified."""
+        pm = self.piece_manager
+        piece_length = self.torrent.piece_length
+        length = max(0, min(length, self.torrent.total_length - offset))
+        if length == 0:
+            return b''
+        first = offset // piece_length
+        last = (offset + length - 1) // piece_length
+        if any(not pm.priorities[i] and not self.servable[i] for i in range(first, last + 1)):
+            raise ValueError("range covers pieces that are set to be skipped")
+
+        if pm.sequential:
+            pm.set_cursor(first)
+        now = time.monotonic()
+        for i in range(first, last + 1):
+            if not self.servable[i]:
+                # Needed right now
+                pm.set_piece_deadline(i, now)
+        self._wake_peers()
+
+        deadline = None if timeout is None else now + timeout
+        with self.piece_ready:
+            while not all(self.servable[first:last + 1]):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"pieces {first}-{last} not ready after {timeout} s")
+                if self.stop_event.is_set():
+                    raise RuntimeError("session stopped")
+                self.piece_ready.wait(remaining if remaining is not None else 0.5)
+
+        parts = []
+        for i in range(first, last + 1):
+            start = max(offset, i * piece_length) - i * piece_length
+            end = min(offset + length, (i + 1) * piece_length) - i * piece_length
+            block = self.cache.read_block(i, start, end - start)
+            if block is None:
+                raise IOError(f"piece {i} could not be read back")
+            parts.append(block)
+        return b''.join(parts)
+
+    def read_file(self, file_index: int, offset: int, length: int, timeout: Optional[float] = None) -> bytes:
+        torrent_file = self.torrent.files[file_index]
+        length = max(0, min(length, torrent_file.length - offset))
+        return self.read(torrent_file.offset + offset, length, timeout)
+
+    def select_files(self, file_indices: Iterable[int]):
+        """Download only these files. Pieces that lie entirely in other files
+        are skipped; the parts of boundary pieces outside the selection
+        are kept in the file manager's part-file."""
+        selected = set(file_indices)
+        self.file_manager.select_files(selected)
+        pm = self.piece_manager
+        for file_index in range(len(self.torrent.files)):
+            if file_index not in selected:
+                pm.set_file_priority(file_index, PRIORITY_SKIP)
+            elif not pm.file_priorities[file_index]:
+                pm.set_file_priority(file_index, PRIORITY_DEFAULT)
+
+    def get_stats(self) -> Dict:
+        pm = self.piece_manager
+        torrent_stats = self.stats.snapshot()
+        torrent_stats['pieces_completed'] = sum(pm.pieces)
+        torrent_stats['total_pieces'] = len(pm.pieces)
+        torrent_stats['known_peers'] = len(self.peer_pool.known)
+        torrent_stats['read_cache'] = self.cache.snapshot()
+        torrent_stats['smart_ban'] = self.smart_ban.snapshot()
+        peers = []
+        for peer in self.peer_pool.connected_peers():
+            peer_stats = peer.stats.snapshot()
+            peer_stats.update({
+                'ip': peer.ip,
+                'port': peer.port,
+                'client': peer.client_name,
+                'pieces': peer.pieces_count,
+                'choked': peer.peer_choking,
+                'snubbed': peer.snubbed,
+            })
+            peers.append(peer_stats)
+        return {'torrent': torrent_stats, 'peers': peers}
+
+    def stop(self):
+        self.stop_event.set()
+        if self._listener:
+            try:
+                # Wakes the listener thread out of accept()
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+        for peer in self.peer_pool.connected_peers():
+            peer.disconnect()
+        if self._connector:
+            self._connector.join(timeout=5)
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.timers.stop()
+        # The last partial batch of the aggregated log would be lost otherwise
+        self.piece_manager.verified_log.flush()
+        try:
+            self.disk.close()
+        finally:
+            self.file_manager.close()
+
+    def _connect_loop(self):
+        while self._running():
+            self.workers = [w for w in self.workers if w.is_alive()]
+            addr = self.peer_pool.next_candidate()
+            if addr is None:
+                self.stop_event.wait(0.2)
+                continue
+            worker = threading.Thread(target=self._peer_worker, args=(addr,), name=f"peer-{addr[0]}:{addr[1]}", daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def _listen_loop(self):
+        while self._running():
+            try:
+                sock, addr = self._listener.accept()
+            except OSError:
+                return
+            if self.peer_pool.is_banned_ip(addr[0]) or not self.peer_pool.reserve(addr):
+                sock.close()
+                continue
+            worker = threading.Thread(target=self._inbound_worker, args=(sock, addr),
+                                      name=f"peer-in-{addr[0]}:{addr[1]}", daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def _new_peer(self, addr: Tuple[str, int]) -> Peer:
+        peer = Peer(addr[0], addr[1], self.torrent.info_hash, self.peer_id, self.listen_port,
+                    self.torrent.num_pieces)
+        peer.stats.parent = self.stats
+        return peer
+
+    def _peer_worker(self, addr: Tuple[str, int]):
+        peer = self._new_peer(addr)
+        if peer.connect():
+            self._serve_peer(peer)
+        else:
+            self.peer_pool.mark_failed(addr)
+
+    def _inbound_worker(self, sock: socket.socket, addr: Tuple[str, int]):
+        peer = self._new_peer(addr)
+        if peer.accept(sock):
+            self._serve_peer(peer)
+        else:
+            self.peer_pool.release(addr)
+
+    def _serve_peer(self, peer: Peer):
+        self.peer_pool.mark_connected(peer)
+        timers = self._arm_timers(peer, f"{peer.ip}:{peer.port}")
+        try:
+            self._run_peer(peer)
+        finally:
+            for timer in timers.values():
+                timer.cancel()
+            self.peer_pool.mark_disconnected(peer)
+            peer.disconnect()
+            with self.unchoke_lock:
+                self.unchoked.discard(peer)
+                if self.optimistic is peer:
+                    self.optimistic = None
+            self._fill_slots()
+
+    def _arm_timers(self, peer: Peer, peer_key: str) -> Dict[str, Timer]:
+        # Each timer re-arms itself for the deadline implied by the peer's
+        # latest timestamps, so traffic never has to touch the wheel
+        timers: Dict[str, Timer] = {}
+
+        def arm(name: str, delay: float, callback):
+            if peer.connected and not self.stop_event.is_set():
+                timers[name] = self.timers.schedule(delay, callback)
+
+        def keepalive():
+            if not peer.connected:
+                return
+            due = peer.last_sent + self.keepalive_interval
+            if time.monotonic() >= due:
+                # Sending could block on a full socket buffer, leave it to
+                # the peer's own thread
+                peer.post(peer.send_keepalive)
+                due = time.monotonic() + self.keepalive_interval
+            arm('keepalive', due - time.monotonic(), keepalive)
+
+        def pex():
+            if not peer.connected:
+                return
+            peer.post(lambda: peer.send_pex(self.peer_pool.connected_addrs()))
+            arm('pex', PEX_INTERVAL, pex)
+
+        def idle():
+            if not peer.connected:
+                return
+            now = time.monotonic()
+            due = peer.last_received + self.idle_timeout
+            if now >= due:
+                peer_log.info('idle', "Dropping %s, nothing received for %.0f s", peer_key, now - peer.last_received)
+                peer.stats.on_timeout()
+                self.stats.idle_disconnects.inc()
+                peer.disconnect()
+                return
+            arm('idle', due - now, idle)
+
+        def snub():
+            if not peer.connected:
+                return
+            now = time.monotonic()
+            due = now + self.snub_timeout
+            if peer.peer_choking:
+                if peer.interested and now - peer.choked_at >= self.choke_timeout \
+                        and self._rotate(peer, peer_key, "kept us choked"):
+                    return
+            elif peer.outstanding:
+                due = peer.last_block_at + self.snub_timeout
+                if now >= due:
+                    self._snubbed(peer, peer_key)
+                    if self._rotate(peer, peer_key, "snubbed us"):
+                        return
+                    due = now + self.snub_timeout
+            arm('snub', due - now, snub)
+
+        arm('keepalive', self.keepalive_interval, keepalive)
+        arm('pex', PEX_INTERVAL, pex)
+        arm('idle', self.idle_timeout, idle)
+        arm('snub', self.snub_timeout, snub)
+        return timers
+
+    def _wake_idle_peers(self):
+        if self.stop_event.is_set():
+            return
+        for peer in self.peer_pool.connected_peers():
+            if not peer.outstanding:
+                peer.wake()
+        self.timers.schedule(IDLE_WAKE_INTERVAL, self._wake_idle_peers)
+
+    def _wake_peers(self):
+        for peer in self.peer_pool.connected_peers():
+            peer.wake()
+
+    def _snubbed(self, peer: Peer, peer_key: str):
+        peer_log.info('snub', "%s sent nothing for %.0f s while unchoking us, reassigning its requests",
+                      peer_key, time.monotonic() - peer.last_block_at)
+        peer.snubbed = True
+        peer.stats.on_snub()
+        # The picker can hand these to other peers right away; the peer's
+        # own thread sees it no longer holds them and cancels its requests
+        for piece_index in list(peer.active_pieces):
+            self.piece_manager.release_piece(piece_index, peer_key)
+        peer.wake()
+
+    def _rotate(self, peer: Peer, peer_key: str, reason: str) -> bool:
+        if not len(self.peer_pool):
+            # Nobody to replace it with, a slow peer beats no peer
+            return False
+        peer_log.info('rotate', "Rotating out %s, it %s", peer_key, reason)
+        self.stats.rotated_peers.inc()
+        peer.disconnect()
+        return True
+
+    def _run_peer(self, peer: Peer):
+        pm = self.piece_manager
+        peer_key = f"{peer.ip}:{peer.port}"
+        # (piece, begin) -> length for requests sent and not yet answered
+        outstanding: Dict[Tuple[int, int], int] = {}
+        queued = deque()
+        active_pieces = set()
+        refused_pieces = set()
+        announced = len(self.completed)
+        peer.active_pieces = active_pieces
+        peer.outstanding = outstanding
+
+        def drop_piece(piece_index: int):
+            active_pieces.discard(piece_index)
+            for key in [k for k in outstanding if k[0] == piece_index]:
+                del outstanding[key]
+            for block in [b for b in queued if b[0] == piece_index]:
+                queued.remove(block)
+            pm.release_piece(piece_index, peer_key)
+
+        def forget_piece(piece_index: int):
+            # Finished or failed through a peer racing us for it
+            active_pieces.discard(piece_index)
+            for key in [k for k in outstanding if k[0] == piece_index]:
+                peer.send_cancel(key[0], key[1], outstanding.pop(key))
+            for block in [b for b in queued if b[0] == piece_index]:
+                queued.remove(block)
+
+        def wants(piece_index: int) -> bool:
+            return peer.has_piece(piece_index) and peer.can_request(piece_index) \
+                and piece_index not in refused_pieces and self.smart_ban.allowed(piece_index, peer_key)
+
+        peer.send_piece_state(pm.bitfield(), pm.is_complete())
+
+        try:
+            while self._running() and not self.smart_ban.is_banned(peer_key):
+                message = peer.receive_message()
+                if message is None:
+                    self.stats.request_timeouts.inc(len(outstanding))
+                    break
+                message_id, payload = message
+                if not peer.handle_message(message_id, payload):
+                    peer_log.info('invalid', "Dropping %s, invalid message %d of %d bytes", peer_key, message_id,
+                                  len(payload))
+                    break
+                peer.run_posted()
+
+                if message_id == 7 and len(payload) >= 8:
+                    index, begin = struct.unpack('>II', payload[:8])
+                    outstanding.pop((index, begin), None)
+                    if index not in active_pieces:
+                        peer.stats.on_wasted(len(payload) - 8)
+                    else:
+                        piece_data = pm.add_block(index, begin, payload[8:], peer_key)
+                        if piece_data is not None:
+                            active_pieces.discard(index)
+                            self._complete_piece(index, piece_data, pm.pop_block_origins(index))
+                elif message_id == 0 and not peer.supports_fast:
+                    # Plain choke silently discards every pending request
+                    outstanding.clear()
+                elif message_id == 6:
+                    if len(payload) != 12:
+                        peer_log.info('invalid', "Dropping %s, malformed request of %d bytes", peer_key, len(payload))
+                        break
+                    self._serve_request(peer, *struct.unpack('>III', payload))
+                elif message_id == 2:
+                    self._unchoke(peer)
+                elif message_id == 3:
+                    self._choke(peer)
+
+                while peer.rejected:
+                    index, begin, length = peer.rejected.pop(0)
+                    if outstanding.pop((index, begin), None) is None or index not in active_pieces:
+                        continue
+                    if not peer.peer_choking or index in peer.allowed_fast:
+                        # Refused outright rather than choked, let another peer have it
+                        refused_pieces.add(index)
+                    drop_piece(index)
+
+                if peer.peer_choking:
+                    # Blocks we can no longer ask this peer for go back to the picker
+                    for index in [i for i in active_pieces if not peer.can_request(i)]:
+                        if not any(k[0] == index for k in outstanding):
+                            drop_piece(index)
+
+                for index in [i for i in active_pieces if not pm.is_assigned(i, peer_key)]:
+                    forget_piece(index)
+
+                self._fill_pipeline(peer, peer_key, outstanding, queued, active_pieces, wants)
+
+                while announced < len(self.completed):
+                    peer.send_have(self.completed[announced])
+                    announced += 1
+        finally:
+            for piece_index in list(active_pieces):
+                pm.release_piece(piece_index, peer_key)
+
+    def _unchoke(self, peer: Peer):
+        with self.unchoke_lock:
+            if peer in self.unchoked or len(self.unchoked) >= self.upload_slots:
+                return
+            self.unchoked.add(peer)
+        peer.post(peer.send_unchoke)
+
+    def _choke(self, peer: Peer):
+        with self.unchoke_lock:
+            if peer not in self.unchoked:
+                return
+            self.unchoked.discard(peer)
+        peer.post(peer.send_choke)
+        self._fill_slots()
+
+    def _interested_peers(self) -> List[Peer]:
+        return [peer for peer in self.peer_pool.connected_peers() if peer.connected and peer.peer_interested]
+
+    def _fill_slots(self):
+        # A slot just freed up, hand it to someone waiting rather than
+        # leaving it idle until the next rechoke
+        interested = self._interested_peers()
+        with self.unchoke_lock:
+            waiting = [peer for peer in interested if peer not in self.unchoked]
+            chosen = waiting[:max(0, self.upload_slots - len(self.unchoked))]
+            self.unchoked.update(chosen)
+        for peer in chosen:
+            peer.post(peer.send_unchoke)
+
+    def _rechoke(self):
+        if self.stop_event.is_set():
+            return
+        try:
+            interested = self._interested_peers()
+            # Tit-for-tat: reward the peers that send us the most, or once we
+            # are seeding the ones that take the most
+            if self.piece_manager.is_complete():
+                regular = sorted(interested, key=lambda peer: peer.upload_speed, reverse=True)
+            else:
+                regular = sorted(interested, key=lambda peer: peer.download_speed, reverse=True)
+            regular = regular[:max(0, self.upload_slots - 1)]
+            now = time.monotonic()
+            with self.unchoke_lock:
+                optimistic = self.optimistic
+                unusable = optimistic not in interested or optimistic in regular
+                if unusable or now - self.optimistic_at >= OPTIMISTIC_INTERVAL:
+                    candidates = [peer for peer in interested if peer not in regular and peer is not optimistic]
+                    if candidates:
+                        optimistic = random.choice(candidates)
+                        self.optimistic_at = now
+                    elif unusable:
+                        optimistic = None
+                self.optimistic = optimistic
+                wanted = set(regular)
+                if optimistic is not None and self.upload_slots > 0:
+                    wanted.add(optimistic)
+                to_choke = self.unchoked - wanted
+                to_unchoke = wanted - self.unchoked
+                self.unchoked = wanted
+            # Sends are left to each peer's own thread, this runs on the wheel
+            for peer in to_choke:
+                peer.post(peer.send_choke)
+            for peer in to_unchoke:
+                peer.post(peer.send_unchoke)
+        finally:
+            self.timers.schedule(UNCHOKE_INTERVAL, self._rechoke)
+
+    def _serve_request(self, peer: Peer, piece_index: int, begin: int, length: int):
+        block = None
+        if not peer.choked and 0 < length <= MAX_SERVED_BLOCK and piece_index < len(self.servable) \
+                and self.servable[piece_index]:
+            block = self.cache.read_block(piece_index, begin, length)
+        if block is None or len(block) != length:
+            # Choked peers' requests are silently dropped unless they speak fast
+            peer.send_reject(piece_index, begin, length)
+            return
+        peer.send_piece(piece_index, begin, block)
+
+    def _peer_by_key(self, peer_key: str) -> Optional[Peer]:
+        ip, port = peer_key.rsplit(':', 1)
+        return self.peer_pool.get((ip, int(port)))
+
+    def _ban(self, peer_key: str):
+        ip, port = peer_key.rsplit(':', 1)
+        self.stats.banned_peers.inc()
+        peer = self.peer_pool.ban((ip, int(port)))
+        if peer:
+            # Its worker notices the ban or the closed socket and exits
+            peer.disconnect()
+
+    def _complete_piece(self, piece_index: int, piece_data: bytes, origins: Optional[Dict[int, str]] = None):
+        origins = origins or {}
+        if not self.piece_manager.store_piece(piece_index, piece_data):
+            self.stats.hash_failures.inc()
+            blamed = 0
+            for _, block, peer_key in split_blocks(piece_data, origins):
+                peer = self._peer_by_key(peer_key)
+                if peer:
+                    peer.stats.on_hash_failure(len(block))
+                    blamed += len(block)
+            # Blocks from peers that are already gone still count as waste
+            self.stats.wasted_bytes.inc(len(piece_data) - blamed)
+            for peer_key in self.smart_ban.on_hash_failure(piece_index, piece_data, origins):
+                self._ban(peer_key)
+            return
+        self.stats.on_piece_verified(len(piece_data))
+        for peer_key in self.smart_ban.on_piece_verified(piece_index, piece_data, origins):
+            self._ban(peer_key)
+        # Blocks this peer thread while the disk is over its queue budget
+        self.disk.submit(piece_index, piece_data)
+        with self.piece_ready:
+            # A failed write may already have handed the piece back
+            if self.piece_manager.pieces[piece_index]:
+                self.servable[piece_index] = 1
+                self.completed.append(piece_index)
+            self.piece_ready.notify_all()
+        # The other peers' threads send the HAVE for it
+        self._wake_peers()
+        if self.piece_manager.is_complete():
+            # Only report completion once everything is actually on disk
+            try:
+                self.disk.flush()
+            except OSError:
+                # _write_failed has already stopped the session
+                return
+            if self.piece_manager.is_complete():
+                self.piece_manager.verified_log.flush()
+                self.complete_event.set()
+                # Peer threads block until woken, let them see we are done
+                self._wake_peers()
+
+    def _redownload(self, piece_indices: List[int]):
+        # The pieces go back to the picker; peers may already have our
+        # HAVE for them but get rejects until they are stored again
+        for piece_index in piece_indices:
+            self.piece_manager.unmark_piece(piece_index)
+            self.cache.invalidate(piece_index)
+        with self.piece_ready:
+            for piece_index in piece_indices:
+                self.servable[piece_index] = 0
+
+    def _write_failed(self, piece_indices: List[int], error: OSError):
+        # Runs on a disk thread, the data never reached the disk
+        self._redownload(piece_indices)
+        if self.disk.error is not None and self.error is None:
+            logger.error("Giving up, the disk keeps failing: %s", self.disk.error)
+            self.error = self.disk.error
+            self.stop_event.set()
+
+    def _fill_pipeline(self, peer: Peer, peer_key: str, outstanding: Dict[Tuple[int, int], int],
+                       queued: deque, active_pieces: set, wants):
+        pm = self.piece_manager
+        depth = peer.pipeline_depth()
+        while len(outstanding) < depth:
+            if not queued:
+                if self.disk.is_backlogged():
+                    # Let the disk catch up before taking on more pieces
+                    break
+                preferred = peer.suggested + (list(peer.allowed_fast) if peer.peer_choking else [])
+                peer.suggested = []
+                piece_index = pm.get_next_piece(peer_key, wants, preferred)
+                if piece_index is None:
+                    break
+                active_pieces.add(piece_index)
+                piece_length = pm.get_piece_length(piece_index)
+                for begin in range(0, piece_length, BLOCK_SIZE):
+                    queued.append((piece_index, begin, min(BLOCK_SIZE, piece_length - begin)))
+
+            index, begin, length = queued[0]
+            if not peer.can_request(index):
+                break
+            if not peer.interested:
+                peer.interested = peer.send_interested()
+            if not outstanding:
+                # The snub clock runs only while we are waiting on something
+                peer.last_block_at = time.monotonic()
+            if not peer.request_piece(index, begin, length):
+                break
+            queued.popleft()
+            outstanding[(index, begin)] = length
+
+        if not peer.interested and (peer.has_all or peer.pieces_count) and not pm.is_complete():
+            # Even when choked we must say we are interested to get unchoked
+            peer.interested = peer.send_interested()
@@ -0,0 +1,237 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from downloadSession.DownloadSession import DownloadSession
+from fileManager.FileManager import FileManager
+from log.Log import get_logger
+from pieceManager.SharedPieceManager import SharedPieceManager
+
+logger = get_logger('downloadSession.mp')
+
+STATS_INTERVAL = 1.0
+
+# Fields of the per-worker torrent stats that add up across workers
+SUMMED_FIELDS = ('download_speed', 'upload_speed', 'downloaded', 'uploaded', 'pieces_verified', 'verified_bytes',
+                 'hash_failures', 'request_timeouts', 'rejected_requests', 'wasted_bytes', 'disk_queue_depth',
+                 'disk_queue_bytes', 'snubs', 'idle_disconnects', 'rotated_peers')
+
+
+def _worker_main(index: int, workers: int, torrent, peer_id: bytes, download_dir: str, options: Dict,
+                 shm_name: str, claim_lock, done_count, all_verified, commands, results):
+    piece_manager = SharedPieceManager(torrent, shm_name, claim_lock, done_count, index, workers)
+    file_manager = FileManager(torrent, download_dir)
+    file_manager.attach_files()
+    session = DownloadSession(torrent, peer_id, download_dir, piece_manager=piece_manager,
+                              file_manager=file_manager, **options)
+    session.start()
+
+    def report(kind: str):
+        results.put((kind, index, session.get_stats()))
+
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=STATS_INTERVAL)
+            except queue.Empty:
+                command = None
+            if session.complete_event.is_set():
+                all_verified.set()
+            if session.error is not None:
+                # The session gave up and handed its pieces back, nobody
+                # else will finish them
+                results.put(('error', index, session.error))
+                break
+            if command is None:
+                report('stats')
+            elif command[0] == 'peers':
+                session.add_peers(command[1], command[2])
+            elif command[0] == 'flush':
+                session.disk.flush()
+                report('flushed')
+            elif command[0] == 'stop':
+                break
+    finally:
+        session.stop()
+        report('stopped')
+        piece_manager.close()
+
+
+class MultiProcessSession:
+    """Runs one DownloadSession per worker process over a shard of the peers.
+
+    Workers share piece ownership through SharedPieceManager and write
+    verified pieces straight into the torrent's files, so only peer
+    lists and stats snapshots ever cross a process boundary. Mirrors the
+    DownloadSession API: add_peers, start, wait, get_stats, stop.
+    """
+
+    def __init__(self, torrent, peer_id: bytes, download_dir: str, processes: Optional[int] = None,
+                 listen_port: int = 6881, max_connections: int = 30):
+        self.torrent = torrent
+        self.peer_id = peer_id
+        self.download_dir = download_dir
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        # Each worker gets its share of the connection budget
+        self.options = {'listen_port': listen_port,
+                        'max_connections': max(1, max_connections // self.processes)}
+        self.context = multiprocessing.get_context()
+        self.pending_peers: List[List[Tuple[Tuple[str, int], str]]] = [[] for _ in range(self.processes)]
+        self.next_worker = 0
+        self.workers: List[multiprocessing.Process] = []
+        self.commands = []
+        self.results = None
+        self.shm = None
+        self.done_count = None
+        self.all_verified = None
+        self.worker_stats: Dict[int, Dict] = {}
+        self.flushed = set()
+        self.stopped = set()
+        self.errors: Dict[int, BaseException] = {}
+        self.lock = threading.Lock()
+        self.started_at = 0.0
+
+    def add_peers(self, peers: List[Tuple[str, int]], source: str = 'tracker') -> int:
+        shards = [[] for _ in range(self.processes)]
+        for addr in peers:
+            shards[self.next_worker].append(addr)
+            self.next_worker = (self.next_worker + 1) % self.processes
+        for index, shard in enumerate(shards):
+            if not shard:
+                continue
+            if self.commands:
+                self.commands[index].put(('peers', shard, source))
+            else:
+                self.pending_peers[index].append((shard, source))
+        return len(peers)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        # Files are created once here; workers only attach to them
+        file_manager = FileManager(self.torrent, self.download_dir)
+        file_manager.create_files()
+        file_manager.close()
+
+        context = self.context
+        self.shm = SharedPieceManager.create_state(self.torrent.num_pieces)
+        claim_lock = context.Lock()
+        self.done_count = context.Value('q', 0, lock=False)
+        self.all_verified = context.Event()
+        self.results = context.Queue()
+        for index in range(self.processes):
+            commands = context.Queue()
+            worker = context.Process(target=_worker_main, name=f"download-worker-{index}", daemon=True,
+                                     args=(index, self.processes, self.torrent, self.peer_id, self.download_dir,
+                                           self.options, self.shm.name, claim_lock, self.done_count,
+                                           self.all_verified, commands, self.results))
+            worker.start()
+            self.workers.append(worker)
+            self.commands.append(commands)
+            for shard, source in self.pending_peers[index]:
+                commands.put(('peers', shard, source))
+        logger.info("Started %d download workers", self.processes)
+
+    def _drain(self, timeout: float = 0.0):
+        while True:
+            try:
+                kind, index, stats = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            timeout = 0.0
+            with self.lock:
+                if kind == 'error':
+                    self.errors[index] = stats
+                    continue
+                self.worker_stats[index] = stats
+                if kind == 'flushed':
+                    self.flushed.add(index)
+                elif kind == 'stopped':
+                    self.stopped.add(index)
+
+    def _check_workers(self):
+
+        with self.lock:
+            errors = dict(self.errors)
+        if errors:
+            index, error = min(errors.items())
+            logger.error("Download worker %d failed: %s", index, error)
+            raise error
+        # A crashed worker leaves its claimed pieces and its peers behind,
+        # the others cannot finish the torrent for it
+        crashed = [worker for worker in self.workers if worker.exitcode not in (None, 0)]
+        if not crashed:
+            return
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+        raise RuntimeError(f"download worker {crashed[0].name} exited with code {crashed[0].exitcode}")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            while not self.all_verified.is_set() and self.done_count.value < self.torrent.num_pieces:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                self._drain(0.2)
+                self._check_workers()
+
+            # Verified is not written: every worker drains its disk queue first
+            self.flushed.clear()
+            for commands in self.commands:
+                commands.put(('flush',))
+            while len(self.flushed) < len(self.workers):
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                self._drain(0.2)
+                self._check_workers()
+                if not any(worker.is_alive() for worker in self.workers):
+                    return False
+            # A failed write hands its piece back to be fetched again
+            if self.done_count.value >= self.torrent.num_pieces:
+                return True
+            self.all_verified.clear()
+
+    def get_stats(self) -> Dict:
+        self._drain()
+        with self.lock:
+            snapshots = dict(self.worker_stats)
+        torrent_stats = {field: sum(s['torrent'].get(field, 0) for s in snapshots.values()) for field in SUMMED_FIELDS}
+        first_pieces = [s['torrent']['time_to_first_piece'] for s in snapshots.values()
+                        if s['torrent']['time_to_first_piece'] is not None]
+        torrent_stats['time_to_first_piece'] = min(first_pieces) if first_pieces else None
+        # Quantiles do not add up, report the slowest worker's
+        for field in ('request_rtt', 'disk_write_latency'):
+            values = [s['torrent'][field] for s in snapshots.values()]
+            torrent_stats[field] = {
+                'count': sum(v['count'] for v in values),
+                'p50': max((v['p50'] for v in values if v['p50'] is not None), default=None),
+                'p99': max((v['p99'] for v in values if v['p99'] is not None), default=None),
+            }
+        torrent_stats['pieces_completed'] = self.done_count.value if self.done_count else 0
+        torrent_stats['total_pieces'] = self.torrent.num_pieces
+        torrent_stats['elapsed_seconds'] = time.monotonic() - self.started_at
+        torrent_stats['workers'] = len(self.workers)
+        peers = [peer for index in sorted(snapshots) for peer in snapshots[index]['peers']]
+        return {'torrent': torrent_stats, 'peers': peers, 'workers': snapshots}
+
+    def stop(self, timeout: float = 30.0):
+        for commands in self.commands:
+            commands.put(('stop',))
+        deadline = time.monotonic() + timeout
+        # Keep draining while joining, a worker cannot exit with results
+        # still stuck in its queue
+        while any(worker.is_alive() for worker in self.workers) and time.monotonic() < deadline:
+            self._drain(0.1)
+        for worker in self.workers:
+            if worker.is_alive():
+                logger.warning("Worker %s did not stop, terminating it", worker.name)
+                worker.terminate()
+            worker.join()
+        self._drain()
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
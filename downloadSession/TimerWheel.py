@@ -0,0 +1,82 @@
+import math
+import threading
+import time
+from typing import Callable, List, Optional
+
+from log.Log import get_logger
+
+logger = get_logger('downloadSession.timers')
+
+
+class Timer:
+
+    __slots__ = ('callback', 'rounds', 'cancelled')
+
+    def __init__(self, callback: Callable[[], None], rounds: int):
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Hashed timing wheel driving every connection's timers from one thread.
+
+    A timer lands in the slot its expiry hashes to and carries how many
+    full turns of the wheel remain, so scheduling and firing are O(1)
+    however many connections there are. Expiry is rounded up to the
+    next tick. Callbacks run on the wheel thread and must not block.
+    """
+
+    def __init__(self, tick: float = 0.5, slots: int = 256):
+        self.tick = tick
+        self.slots: List[List[Timer]] = [[] for _ in range(slots)]
+        self.current = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='timer-wheel', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        ticks = max(1, math.ceil(delay / self.tick))
+        rounds, offset = divmod(ticks, len(self.slots))
+        if offset == 0:
+            # Expiring a whole number of turns from now lands on the current slot
+            rounds -= 1
+        with self.lock:
+            timer = Timer(callback, rounds)
+            self.slots[(self.current + offset) % len(self.slots)].append(timer)
+        return timer
+
+    def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while not self.stop_event.wait(max(0.0, next_tick - time.monotonic())):
+            next_tick += self.tick
+            with self.lock:
+                self.current = (self.current + 1) % len(self.slots)
+                slot = self.slots[self.current]
+                due = [timer for timer in slot if not timer.cancelled and timer.rounds == 0]
+                kept = []
+                for timer in slot:
+                    if timer.cancelled or timer.rounds == 0:
+                        continue
+                    timer.rounds -= 1
+                    kept.append(timer)
+                self.slots[self.current] = kept
+            for timer in due:
+                try:
+                    timer.callback()
+                except Exception:
+                    logger.exception("Timer callback failed")
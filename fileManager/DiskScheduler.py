@@ -0,0 +1,189 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from fileManager.FileManager import FileManager
+from log.Log import get_logger
+
+logger = get_logger('fileManager.disk')
+
+MB = 1024 * 1024
+# Consecutive failed writes before the scheduler gives up for good
+MAX_WRITE_FAILURES = 3
+
+
+class DiskScheduler:
+    """Buffers verified pieces and writes them to disk from a worker pool.
+
+    Pieces are held in an index-ordered queue and written lowest offset
+    first, with runs of adjacent pieces merged into one large write, so
+    pieces that finish in random order still reach the disk mostly
+    sequentially. A flush starts once flush_bytes are buffered, once the
+    oldest piece is flush_interval seconds old, or on flush(). When more
+    than max_queue_bytes are waiting, submit() blocks and is_backlogged()
+    tells the network side to stop picking new pieces.
+
+    Pieces whose write fails are handed to on_failed so the caller can
+    download them again. After max_write_failures failed writes in a row
+    the scheduler stores the error, and flush() and close() raise it.
+    """
+
+    def __init__(self, file_manager: FileManager, workers: int = 2, max_queue_bytes: int = 64 * MB,
+                 flush_bytes: int = 4 * MB, coalesce_bytes: int = 4 * MB, flush_interval: float = 1.0,
+                 stats=None, on_written: Optional[Callable[[List[int]], None]] = None,
+                 on_failed: Optional[Callable[[List[int], OSError], None]] = None,
+                 max_write_failures: int = MAX_WRITE_FAILURES):
+        self.file_manager = file_manager
+        self.piece_length = file_manager.torrent.piece_length
+        self.max_queue_bytes = max_queue_bytes
+        self.flush_bytes = flush_bytes
+        self.coalesce_bytes = coalesce_bytes
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.on_written = on_written
+        self.on_failed = on_failed
+        self.max_write_failures = max_write_failures
+
+        self.pending: Dict[int, bytes] = {}
+        self.in_flight: Dict[int, bytes] = {}
+        self.queued_bytes = 0
+        self.oldest = None
+        # Callers currently inside flush()
+        self.flushing = 0
+        self.writes = 0
+        self.write_failures = 0
+        self.pieces_written = 0
+        self.error: Optional[BaseException] = None
+        self.closed = False
+        self.cond = threading.Condition()
+
+        self.workers = [threading.Thread(target=self._worker, name=f"disk-{i}", daemon=True) for i in range(max(1, workers))]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, piece_index: int, data: bytes, block: bool = True):
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("disk scheduler is closed")
+            while block and self.queued_bytes >= self.max_queue_bytes and not self.closed and self.error is None:
+                self.cond.wait(0.5)
+            if piece_index in self.pending or piece_index in self.in_flight:
+                return
+            self.pending[piece_index] = data
+            self.queued_bytes += len(data)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if self.stats:
+                self._update_gauges()
+            self.cond.notify_all()
+
+    def is_backlogged(self) -> bool:
+        return self.queued_bytes >= self.max_queue_bytes
+
+    def get_pending(self, piece_index: int) -> Optional[bytes]:
+        # Pieces are verified before they are queued, so readers can be
+        # served from memory until the write lands
+        with self.cond:
+            data = self.pending.get(piece_index)
+            return data if data is not None else self.in_flight.get(piece_index)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            self.flushing += 1
+            self.cond.notify_all()
+            try:
+                while (self.pending or self.in_flight) and self.error is None:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.cond.wait(remaining if remaining is not None else 0.5)
+            finally:
+                self.flushing -= 1
+            if self.error is not None:
+                raise self.error
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        if self.closed:
+            return
+        try:
+            self.flush(timeout)
+        finally:
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+            for worker in self.workers:
+                worker.join(timeout=5)
+
+    def _update_gauges(self):
+        self.stats.disk_queue_depth.set(len(self.pending) + len(self.in_flight))
+        self.stats.disk_queue_bytes.set(self.queued_bytes)
+
+    def _should_flush(self) -> bool:
+        if not self.pending:
+            return False
+        if self.flushing or self.closed or self.queued_bytes >= self.flush_bytes:
+            return True
+        return time.monotonic() - self.oldest >= self.flush_interval
+
+    def _take_run(self) -> List[int]:
+        # Lowest-offset run of consecutive pieces, capped at coalesce_bytes
+        start = min(self.pending)
+        run = [start]
+        size = len(self.pending[start])
+        while run[-1] + 1 in self.pending and size < self.coalesce_bytes:
+            run.append(run[-1] + 1)
+            size += len(self.pending[run[-1]])
+        for index in run:
+            self.in_flight[index] = self.pending.pop(index)
+        self.oldest = time.monotonic() if self.pending else None
+        return run
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self._should_flush():
+                    if self.closed:
+                        return
+                    wait = None
+                    if self.pending:
+                        wait = max(0.0, self.flush_interval - (time.monotonic() - self.oldest))
+                    self.cond.wait(wait if wait is not None else 0.5)
+                run = self._take_run()
+                chunks = [self.in_flight[index] for index in run]
+
+            started = time.perf_counter()
+            try:
+                data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+                self.file_manager.write_range(run[0] * self.piece_length, data)
+            except OSError as e:
+                logger.error("Writing pieces %d-%d failed: %s", run[0], run[-1], e)
+                with self.cond:
+                    for index in run:
+                        self.queued_bytes -= len(self.in_flight.pop(index))
+                    self.write_failures += 1
+                    if self.on_failed is None or self.write_failures >= self.max_write_failures:
+                        self.error = e
+                    if self.stats:
+                        self._update_gauges()
+                    self.cond.notify_all()
+                if self.on_failed:
+                    # The data is gone, the owner has to fetch these pieces again
+                    self.on_failed(run, e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            with self.cond:
+                for index in run:
+                    self.queued_bytes -= len(self.in_flight.pop(index))
+                self.write_failures = 0
+                self.writes += 1
+                self.pieces_written += len(run)
+                if self.stats:
+                    self.stats.disk_write_latency.observe(elapsed)
+                    self._update_gauges()
+                self.cond.notify_all()
+            logger.debug("Wrote pieces %d-%d (%d bytes) in %.1f ms", run[0], run[-1], len(data), elapsed * 1000)
+            if self.on_written:
+                self.on_written(run)
@@ -1,61 +1,251 @@
+import bisect
+import json
 import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from torrent import Torrent
 
 
 
 class FileManager:
-    
-    def __init__(self, torrent: Torrent, download_dir: str):
+
+    def __init__(self, torrent: Torrent, download_dir: str, allocation: str = 'sparse'):
+        if allocation not in ('sparse', 'full', 'none'):
+            raise ValueError(f"unknown allocation mode: {allocation}")
         self.torrent = torrent
         self.download_dir = download_dir
+        self.allocation = allocation
         self.file_handles = {}
-        
+        self.fds: Dict[object, int] = {}
+        self.fd_lock = threading.Lock()
+        self.file_offsets: List[int] = [torrent_file.offset for torrent_file in torrent.files]
+        self.selected: Set[int] = set(range(len(torrent.files)))
+        self.created = False
+
+        # Bytes of boundary pieces that fall in unselected files. Each such
+        # piece gets a slot: (offset in the part-file, the global byte
+        # ranges it holds, in order)
+        self.part_path = os.path.join(download_dir, f".{torrent.name}.parts")
+        self.part_fd: Optional[int] = None
+        self.part_slots: Dict[int, Tuple[int, List[Tuple[int, int]]]] = {}
+        self.part_size = 0
+        self._load_part_slots()
+
+    def _load_part_slots(self):
+
+        # Slot layout written by close(), so boundary data from an earlier
+        # run is found at the same offsets
+        try:
+            with open(self.part_path + '.json') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not os.path.exists(self.part_path):
+            return
+        for piece, (base, segments) in saved.items():
+            segments = [(start, end) for start, end in segments]
+            self.part_slots[int(piece)] = (base, segments)
+            self.part_size = max(self.part_size, base + sum(end - start for start, end in segments))
+        self.part_fd = os.open(self.part_path, os.O_RDWR)
+
     def create_files(self):
-        
+
+        if self.created:
+            return
         base_path = os.path.join(self.download_dir, self.torrent.name)
         os.makedirs(base_path, exist_ok=True)
-        
-        for torrent_file in self.torrent.files:
-            file_path = os.path.join(base_path, *torrent_file.path)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-           
-            with open(file_path, 'wb') as f:
-                f.truncate(torrent_file.length)
-            
-            self.file_handles[torrent_file] = file_path
-    
-    def write_piece_data(self, piece_index: int, data: bytes):
-        
-        piece_start = piece_index * self.torrent.piece_length
-        piece_end = piece_start + len(data)
-        
-        for torrent_file in self.torrent.files:
-            file_start = torrent_file.offset
-            file_end = file_start + torrent_file.length
-            
-          
-            if piece_start < file_end and piece_end > file_start:
-                
-                overlap_start = max(piece_start, file_start)
-                overlap_end = min(piece_end, file_end)
-                
-          
-                data_offset = overlap_start - piece_start
-                file_offset = overlap_start - file_start
-                overlap_length = overlap_end - overlap_start
-                
-               
-                file_path = self.file_handles[torrent_file]
-                with open(file_path, 'r+b') as f:
-                    f.seek(file_offset)
-                    f.write(data[data_offset:data_offset + overlap_length])
 
+        for file_index in sorted(self.selected):
+            self._create_file(file_index)
+        self.created = True
+
+    def attach_files(self):
+        """Use files another FileManager already created, without truncating them."""
+        for file_index in sorted(self.selected):
+            torrent_file = self.torrent.files[file_index]
+            self.file_handles[torrent_file] = os.path.join(self.download_dir, self.torrent.name, *torrent_file.path)
+        self.created = True
+
+    def _create_file(self, file_index: int):
+
+        torrent_file = self.torrent.files[file_index]
+        file_path = os.path.join(self.download_dir, self.torrent.name, *torrent_file.path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        # A file left by an earlier run or selection keeps its verified data
+        with open(file_path, 'r+b' if os.path.exists(file_path) else 'wb') as f:
+            self._allocate(f.fileno(), torrent_file.length)
+
+        self.file_handles[torrent_file] = file_path
+
+    def select_files(self, file_indices: Iterable[int]):
+        """Only selected files are created; data for the rest that shares a
+        piece with a selected file goes to the part-file."""
+        selected = set(file_indices)
+        added = selected - self.selected
+        self.selected = selected
+        if not self.created:
+            return
+        for file_index in sorted(added):
+            if self.torrent.files[file_index] in self.file_handles:
+                continue
+            self._create_file(file_index)
+            self._move_from_part(file_index)
+
+    def _move_from_part(self, file_index: int):
+
+        torrent_file = self.torrent.files[file_index]
+        file_end = torrent_file.offset + torrent_file.length
+        for base, segments in list(self.part_slots.values()):
+            position = base
+            for start, end in segments:
+                overlap_start, overlap_end = max(start, torrent_file.offset), min(end, file_end)
+                if overlap_start < overlap_end:
+                    data = os.pread(self.part_fd, overlap_end - overlap_start, position + overlap_start - start)
+                    os.pwrite(self._fd(torrent_file), data, overlap_start - torrent_file.offset)
+                position += end - start
+
+    def _allocate(self, fd: int, length: int):
+
+        if self.allocation == 'none' or length == 0:
+            return
+        if self.allocation == 'full' and hasattr(os, 'posix_fallocate'):
+            try:
+                # Reserves real blocks up front so later writes never hit ENOSPC
+                # and the filesystem can lay the file out contiguously
+                os.posix_fallocate(fd, 0, length)
+                return
+            except OSError:
+                pass
+        # Sparse: sets the size without allocating blocks
+        os.ftruncate(fd, length)
 
+    def _fd(self, torrent_file) -> int:
 
+        fd = self.fds.get(torrent_file)
+        if fd is None:
+            with self.fd_lock:
+                fd = self.fds.get(torrent_file)
+                if fd is None:
+                    fd = os.open(self.file_handles[torrent_file], os.O_RDWR | os.O_CREAT, 0o644)
+                    self.fds[torrent_file] = fd
+        return fd
 
+    def _files_in_range(self, start: int, end: int):
+
+        files = self.torrent.files
+        index = max(0, bisect.bisect_right(self.file_offsets, start) - 1)
+        while index < len(files) and files[index].offset < end:
+            torrent_file = files[index]
+            file_end = torrent_file.offset + torrent_file.length
+            if start < file_end and torrent_file.length:
+                overlap_start = max(start, torrent_file.offset)
+                overlap_end = min(end, file_end)
+                yield index, torrent_file, overlap_start, overlap_end
+            index += 1
+
+    def write_range(self, offset: int, data):
+
+        view = memoryview(data)
+        for index, torrent_file, overlap_start, overlap_end in self._files_in_range(offset, offset + len(view)):
+            chunk = view[overlap_start - offset:overlap_end - offset]
+            if self._in_part(index):
+                self._write_part(overlap_start, chunk)
+                continue
+            file_offset = overlap_start - torrent_file.offset
+            fd = self._fd(torrent_file)
+            while chunk:
+                written = os.pwrite(fd, chunk, file_offset)
+                chunk = chunk[written:]
+                file_offset += written
+
+    def read_range(self, offset: int, length: int) -> bytes:
+
+        parts = []
+        for index, torrent_file, overlap_start, overlap_end in self._files_in_range(offset, offset + length):
+            if self._in_part(index):
+                parts.append(self._read_part(overlap_start, overlap_end - overlap_start))
+                continue
+            parts.append(os.pread(self._fd(torrent_file), overlap_end - overlap_start, overlap_start - torrent_file.offset))
+        return b''.join(parts)
+
+    def _in_part(self, file_index: int) -> bool:
+
+        # A file deselected after it was created keeps its data in place
+        return file_index not in self.selected and self.torrent.files[file_index] not in self.file_handles
+
+    def _part_slot(self, piece_index: int) -> Tuple[int, List[Tuple[int, int]]]:
+
+        slot = self.part_slots.get(piece_index)
+        if slot is not None:
+            return slot
+        with self.fd_lock:
+            slot = self.part_slots.get(piece_index)
+            if slot is None:
+                piece_start = piece_index * self.torrent.piece_length
+                piece_end = min(piece_start + self.torrent.piece_length, self.torrent.total_length)
+                segments = [(start, end) for index, _, start, end in self._files_in_range(piece_start, piece_end)
+                            if self._in_part(index)]
+                slot = (self.part_size, segments)
+                self.part_size += sum(end - start for start, end in segments)
+                if self.part_fd is None:
+                    os.makedirs(self.download_dir, exist_ok=True)
+                    self.part_fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+                self.part_slots[piece_index] = slot
+        return slot
+
+    def _part_offset(self, position: int) -> Optional[int]:
+
+        base, segments = self._part_slot(position // self.torrent.piece_length)
+        for start, end in segments:
+            if start <= position < end:
+                return base + position - start
+            base += end - start
+        # The file was selected after the slot was laid out
+        return None
+
+    def _write_part(self, position: int, chunk: memoryview):
+
+        piece_length = self.torrent.piece_length
+        while chunk:
+            # Within one piece the chunk belongs to one file, so to one segment
+            count = min(len(chunk), piece_length - position % piece_length)
+            part_offset = self._part_offset(position)
+            if part_offset is not None:
+                os.pwrite(self.part_fd, chunk[:count], part_offset)
+            chunk = chunk[count:]
+            position += count
+
+    def _read_part(self, position: int, length: int) -> bytes:
+
+        piece_length = self.torrent.piece_length
+        parts = []
+        while length > 0:
+            count = min(length, piece_length - position % piece_length)
+            part_offset = self._part_offset(position)
+            parts.append(os.pread(self.part_fd, count, part_offset) if part_offset is not None else bytes(count))
+            position += count
+            length -= count
+        return b''.join(parts)
+
+    def write_piece_data(self, piece_index: int, data: bytes):
 
+        self.write_range(piece_index * self.torrent.piece_length, data)
 
+    def sync(self):
 
+        for fd in list(self.fds.values()):
+            os.fsync(fd)
 
+    def close(self):
 
+        with self.fd_lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds = {}
+            if self.part_fd is not None:
+                os.close(self.part_fd)
+                self.part_fd = None
+                # Slot layout, so a later run can find the boundary data again
+                with open(self.part_path + '.json', 'w') as f:
+                    json.dump({str(piece): slot for piece, slot in self.part_slots.items()}, f)
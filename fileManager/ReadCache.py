@@ -0,0 +1,191 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from fileManager.FileManager import FileManager
+from log.Log import get_logger
+from stats.Metrics import TorrentStats
+
+logger = get_logger('fileManager.cache')
+
+MB = 1024 * 1024
+
+
+class ReadCache:
+    """Piece-granular cache for serving block requests while seeding.
+
+    A request for the first block of a piece, or for a piece that was
+    asked for recently, reads the whole piece in one go and caches it:
+    peers almost always fetch every block of a piece they start on.
+    Any other request for an uncached piece is a cold one-off and is
+    read straight from disk without touching the cache.
+
+    policy='arc' splits the budget between recently and frequently used
+    pieces so a sweep over the torrent cannot flush the hot set;
+    policy='lru' is plain least recently used. Everything held here has
+    been verified, either on download or by verify when it was loaded,
+    so hits are never hashed again.
+    """
+
+    def __init__(self, file_manager: FileManager, budget_bytes: int = 32 * MB, policy: str = 'arc',
+                 disk=None, verify: Optional[Callable[[int, bytes], bool]] = None,
+                 stats: Optional[TorrentStats] = None):
+        if policy not in ('arc', 'lru'):
+            raise ValueError(f"unknown cache policy: {policy}")
+        torrent = file_manager.torrent
+        self.file_manager = file_manager
+        self.piece_length = torrent.piece_length
+        self.total_length = torrent.total_length
+        self.num_pieces = torrent.num_pieces
+        self.policy = policy
+        self.disk = disk
+        self.verify = verify
+        self.stats = stats or TorrentStats()
+        self.capacity = max(1, budget_bytes // self.piece_length)
+        self.lock = threading.Lock()
+
+        # ARC lists: t1 seen once, t2 seen again; b1/b2 remember what
+        # they recently evicted. LRU only uses t1.
+        self.t1: Dict[int, bytes] = OrderedDict()
+        self.t2: Dict[int, bytes] = OrderedDict()
+        self.b1: Dict[int, None] = OrderedDict()
+        self.b2: Dict[int, None] = OrderedDict()
+        self.target = 0.0
+        self.cached_bytes = 0
+        # Pieces touched by a bypassed read, a second touch admits them
+        self.seen: Dict[int, None] = OrderedDict()
+
+    def _piece_size(self, piece_index: int) -> int:
+        if piece_index == self.num_pieces - 1:
+            return self.total_length - piece_index * self.piece_length
+        return self.piece_length
+
+    def read_block(self, piece_index: int, begin: int, length: int) -> Optional[bytes]:
+        if not 0 <= piece_index < self.num_pieces or begin + length > self._piece_size(piece_index):
+            return None
+
+        piece = self._lookup(piece_index)
+        if piece is None and self.disk is not None:
+            # Verified but still queued for writing
+            piece = self.disk.get_pending(piece_index)
+        if piece is not None:
+            self.stats.read_cache_hits.inc()
+            return piece[begin:begin + length]
+
+        self.stats.read_cache_misses.inc()
+        with self.lock:
+            admit = begin == 0 or piece_index in self.seen or piece_index in self.b1 or piece_index in self.b2
+            if not admit:
+                self._remember(piece_index)
+        if not admit:
+            self.stats.read_cache_bypassed.inc()
+            return self.file_manager.read_range(piece_index * self.piece_length + begin, length)
+
+        piece = self.file_manager.read_range(piece_index * self.piece_length, self._piece_size(piece_index))
+        if self.verify is not None and not self.verify(piece_index, piece):
+            logger.error("Piece %d on disk does not match its hash, not serving it", piece_index)
+            return None
+        self.insert(piece_index, piece)
+        return piece[begin:begin + length]
+
+    def insert(self, piece_index: int, data: bytes):
+        with self.lock:
+            self.seen.pop(piece_index, None)
+            if piece_index in self.t1 or piece_index in self.t2:
+                return
+            if self.policy == 'lru':
+                if len(self.t1) >= self.capacity:
+                    self._evicted(self.t1.popitem(last=False)[1])
+                self.t1[piece_index] = data
+            else:
+                self._arc_insert(piece_index, data)
+            self.cached_bytes += len(data)
+            self.stats.read_cache_bytes.set(self.cached_bytes)
+
+    def invalidate(self, piece_index: int):
+        with self.lock:
+            data = self.t1.pop(piece_index, None) or self.t2.pop(piece_index, None)
+            if data is not None:
+                self.cached_bytes -= len(data)
+                self.stats.read_cache_bytes.set(self.cached_bytes)
+
+    def _lookup(self, piece_index: int) -> Optional[bytes]:
+        with self.lock:
+            data = self.t1.get(piece_index)
+            if data is not None:
+                if self.policy == 'lru':
+                    self.t1.move_to_end(piece_index)
+                else:
+                    del self.t1[piece_index]
+                    self.t2[piece_index] = data
+                return data
+            data = self.t2.get(piece_index)
+            if data is not None:
+                self.t2.move_to_end(piece_index)
+            return data
+
+    def _remember(self, piece_index: int):
+        self.seen[piece_index] = None
+        self.seen.move_to_end(piece_index)
+        if len(self.seen) > 2 * self.capacity:
+            self.seen.popitem(last=False)
+
+    def _arc_insert(self, piece_index: int, data: bytes):
+        c = self.capacity
+        if piece_index in self.b1:
+            self.target = min(c, self.target + max(len(self.b2) / len(self.b1), 1))
+            if len(self.t1) + len(self.t2) >= c:
+                self._replace(in_b2=False)
+            del self.b1[piece_index]
+            self.t2[piece_index] = data
+            return
+        if piece_index in self.b2:
+            self.target = max(0.0, self.target - max(len(self.b1) / len(self.b2), 1))
+            if len(self.t1) + len(self.t2) >= c:
+                self._replace(in_b2=True)
+            del self.b2[piece_index]
+            self.t2[piece_index] = data
+            return
+
+        if len(self.t1) + len(self.b1) >= c:
+            if len(self.t1) < c:
+                self.b1.popitem(last=False)
+                self._replace(in_b2=False)
+            else:
+                self._evicted(self.t1.popitem(last=False)[1])
+        elif len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) >= c:
+            if len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) >= 2 * c:
+                self.b2.popitem(last=False)
+            if len(self.t1) + len(self.t2) >= c:
+                self._replace(in_b2=False)
+        self.t1[piece_index] = data
+
+    def _replace(self, in_b2: bool):
+        if self.t1 and (len(self.t1) > self.target or (in_b2 and len(self.t1) == int(self.target))):
+            evicted, data = self.t1.popitem(last=False)
+            self.b1[evicted] = None
+        elif self.t2:
+            evicted, data = self.t2.popitem(last=False)
+            self.b2[evicted] = None
+        else:
+            return
+        self._evicted(data)
+
+    def _evicted(self, data: bytes):
+        self.cached_bytes -= len(data)
+        self.stats.read_cache_evictions.inc()
+
+    def snapshot(self) -> Dict:
+        hits = self.stats.read_cache_hits.value
+        misses = self.stats.read_cache_misses.value
+        return {
+            'policy': self.policy,
+            'capacity_pieces': self.capacity,
+            'cached_pieces': len(self.t1) + len(self.t2),
+            'cached_bytes': self.cached_bytes,
+            'hits': hits,
+            'misses': misses,
+            'bypassed': self.stats.read_cache_bypassed.value,
+            'evictions': self.stats.read_cache_evictions.value,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        }
@@ -0,0 +1,90 @@
+import socket
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import bencodepy
+
+
+EXTENDED_MESSAGE_ID = 20
+EXTENDED_HANDSHAKE_ID = 0
+
+# Extensions we understand, with the message ids we ask peers to use for them
+LOCAL_EXTENSIONS = {
+    b'ut_pex': 1,
+}
+UT_PEX = LOCAL_EXTENSIONS[b'ut_pex']
+
+CLIENT_NAME = b'torrentStudies 0.1'
+LOCAL_REQQ = 250
+
+# PEX flags (BEP 11)
+PEX_PREFERS_ENCRYPTION = 0x01
+PEX_SEED = 0x02
+PEX_CONNECTABLE = 0x10
+MAX_PEX_PEERS = 50
+
+
+def parse_compact_peers(data: bytes) -> List[Tuple[str, int]]:
+    peers = []
+    for i in range(0, len(data) - 5, 6):
+        ip = socket.inet_ntoa(data[i:i + 4])
+        port = struct.unpack('>H', data[i + 4:i + 6])[0]
+        if port:
+            peers.append((ip, port))
+    return peers
+
+
+def encode_compact_peers(peers: Iterable[Tuple[str, int]]) -> bytes:
+    return b''.join(socket.inet_aton(ip) + struct.pack('>H', port) for ip, port in peers)
+
+
+def build_extended_handshake(listen_port: Optional[int] = None, reqq: int = LOCAL_REQQ) -> bytes:
+    handshake = {
+        b'm': LOCAL_EXTENSIONS,
+        b'v': CLIENT_NAME,
+        b'reqq': reqq,
+    }
+    if listen_port:
+        handshake[b'p'] = listen_port
+    return bencodepy.encode(handshake)
+
+
+def parse_extended_handshake(payload: bytes) -> Dict:
+    decoded = bencodepy.decode(payload)
+    if not isinstance(decoded, dict):
+        raise ValueError("extended handshake is not a dictionary")
+
+    extensions = {}
+    for name, ext_id in decoded.get(b'm', {}).items():
+        # An id of 0 means the peer disabled that extension
+        if isinstance(ext_id, int) and ext_id > 0:
+            extensions[name] = ext_id
+
+    reqq = decoded.get(b'reqq')
+    port = decoded.get(b'p')
+    client = decoded.get(b'v', b'')
+    return {
+        'extensions': extensions,
+        'reqq': reqq if isinstance(reqq, int) and reqq > 0 else None,
+        'port': port if isinstance(port, int) and 0 < port < 65536 else None,
+        'client': client.decode('utf-8', 'replace') if isinstance(client, bytes) else '',
+    }
+
+
+def build_pex(added: List[Tuple[str, int]], dropped: List[Tuple[str, int]]) -> bytes:
+    added = added[:MAX_PEX_PEERS]
+    dropped = dropped[:MAX_PEX_PEERS]
+    return bencodepy.encode({
+        b'added': encode_compact_peers(added),
+        b'added.f': bytes([PEX_CONNECTABLE]) * len(added),
+        b'dropped': encode_compact_peers(dropped),
+    })
+
+
+def parse_pex(payload: bytes) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+    decoded = bencodepy.decode(payload)
+    if not isinstance(decoded, dict):
+        raise ValueError("ut_pex message is not a dictionary")
+    added = parse_compact_peers(decoded.get(b'added', b''))
+    dropped = parse_compact_peers(decoded.get(b'dropped', b''))
+    return added[:MAX_PEX_PEERS], dropped[:MAX_PEX_PEERS]
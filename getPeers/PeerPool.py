@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from getPeers.Peers import Peer
+
+# An address that failed or left is not taken back from a tracker, DHT or
+# PEX until this long has passed, doubling with each failed dial in a row
+RETRY_BACKOFF = 30.0
+MAX_RETRY_BACKOFF = 1800.0
+
+
+class PeerPool:
+
+    def __init__(self, max_connections: int = 50, max_candidates: int = 2000):
+        self.max_connections = max_connections
+        self.max_candidates = max_candidates
+        self.candidates = deque()
+        # Addresses queued, being served or banned; the rest may be re-added
+        self.known = set()
+        self.failures: Dict[Tuple[str, int], int] = {}
+        self.retry_at: Dict[Tuple[str, int], float] = {}
+        self.connected: Dict[Tuple[str, int], Peer] = {}
+        # Dials and inbound handshakes in progress hold a connection slot
+        self.connecting: Set[Tuple[str, int]] = set()
+        self.sources: Dict[str, int] = {}
+        self.banned = set()
+        self.lock = threading.Lock()
+
+    def add_peers(self, peers: Iterable[Tuple[str, int]], source: str = 'tracker') -> int:
+        added = 0
+        now = time.monotonic()
+        with self.lock:
+            for addr in peers:
+                addr = (addr[0], int(addr[1]))
+                if addr in self.known or len(self.candidates) >= self.max_candidates:
+                    continue
+                retry_at = self.retry_at.pop(addr, None)
+                if retry_at is not None and retry_at > now:
+                    self.retry_at[addr] = retry_at
+                    continue
+                self.known.add(addr)
+                self.candidates.append(addr)
+                added += 1
+            self.sources[source] = self.sources.get(source, 0) + added
+        return added
+
+    def next_candidate(self) -> Optional[Tuple[str, int]]:
+        with self.lock:
+            while self._has_room() and self.candidates:
+                addr = self.candidates.popleft()
+                if addr not in self.banned:
+                    self.connecting.add(addr)
+                    return addr
+            return None
+
+    def reserve(self, addr: Tuple[str, int]) -> bool:
+        # Holds a slot for an inbound connection while it handshakes
+        with self.lock:
+            if not self._has_room():
+                return False
+            self.connecting.add(addr)
+            return True
+
+    def release(self, addr: Tuple[str, int]):
+        with self.lock:
+            self.connecting.discard(addr)
+
+    def _has_room(self) -> bool:
+        return len(self.connected) + len(self.connecting) < self.max_connections
+
+    def ban(self, addr: Tuple[str, int]) -> Optional[Peer]:
+        # Returns the live connection so the caller can drop it
+        with self.lock:
+            self.banned.add(addr)
+            self.known.add(addr)
+            return self.connected.get(addr)
+
+    def is_banned_ip(self, ip: str) -> bool:
+        # Inbound connections come from an ephemeral port, not the banned one
+        with self.lock:
+            return any(banned_ip == ip for banned_ip, _ in self.banned)
+
+    def get(self, addr: Tuple[str, int]) -> Optional[Peer]:
+        with self.lock:
+            return self.connected.get(addr)
+
+    def needs_peers(self) -> bool:
+        with self.lock:
+            return self._has_room()
+
+    def mark_connected(self, peer: Peer):
+        peer.on_pex = lambda added: self.add_peers(added, 'pex')
+        with self.lock:
+            self.connecting.discard((peer.ip, peer.port))
+            self.connected[(peer.ip, peer.port)] = peer
+            self.failures.pop((peer.ip, peer.port), None)
+
+    def mark_disconnected(self, peer: Peer):
+        addr = (peer.ip, peer.port)
+        with self.lock:
+            self.connected.pop(addr, None)
+            self._forget(addr, RETRY_BACKOFF)
+
+    def mark_failed(self, addr: Tuple[str, int]):
+        with self.lock:
+            self.connecting.discard(addr)
+            failures = self.failures.get(addr, 0) + 1
+            self.failures[addr] = failures
+            self._forget(addr, min(RETRY_BACKOFF * 2 ** (failures - 1), MAX_RETRY_BACKOFF))
+
+    def _forget(self, addr: Tuple[str, int], backoff: float):
+        # Lets a later announce or PEX message hand the address back.
+        # Inbound peers were never known by their ephemeral port
+        if addr in self.banned or addr not in self.known:
+            return
+        self.known.discard(addr)
+        self.retry_at[addr] = time.monotonic() + backoff
+
+    def connected_peers(self) -> List[Peer]:
+        with self.lock:
+            return list(self.connected.values())
+
+    def connected_addrs(self) -> List[Tuple[str, int]]:
+        with self.lock:
+            return list(self.connected)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.candidates)
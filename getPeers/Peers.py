@@ -1,12 +1,46 @@
+import select
 import socket
 import struct
-from typing import Optional, Tuple
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+from getPeers import Extensions
+from log.Log import RateLimitedLog, get_logger
+from stats.Metrics import PeerStats
 
+logger = get_logger('peer')
+# Dial failures and rejects come from every peer in a swarm, one line per
+# kind per interval is plenty
+peer_log = RateLimitedLog(logger)
+
+
+# Reserved handshake bits
+EXTENSION_PROTOCOL_BIT = (5, 0x10)
+FAST_EXTENSION_BIT = (7, 0x04)
+
+# Fast extension messages (BEP 6)
+SUGGEST_PIECE = 0x0D
+HAVE_ALL = 0x0E
+HAVE_NONE = 0x0F
+REJECT_REQUEST = 0x10
+ALLOWED_FAST = 0x11
+
+DEFAULT_PIPELINE_DEPTH = 16
+MAX_PIPELINE_DEPTH = 250
+
+# receive_message returns (NO_MESSAGE, b'') when wake() interrupts the wait
+# for the next message, so the caller gets a turn to run posted work
+NO_MESSAGE = -2
+# Only bounds a stalled send or a message that stops halfway; waiting for
+# the next message blocks until data arrives or wake() is called
+SOCKET_TIMEOUT = 30
 
 
 class Peer:
     
-    def __init__(self, ip: str, port: int, info_hash: bytes, peer_id: bytes):
+    def __init__(self, ip: str, port: int, info_hash: bytes, peer_id: bytes, listen_port: Optional[int] = None,
+                 num_pieces: int = 0):
         self.ip = ip
         self.port = port
         self.info_hash = info_hash
@@ -18,6 +52,38 @@ class Peer:
         self.peer_choking = True
         self.peer_interested = False
         self.bitfield = None
+        self.have = bytearray()
+        self.has_all = False
+        self.pieces_count = 0
+        self.num_pieces = num_pieces
+        self.supports_fast = False
+        self.allowed_fast = set()
+        self.suggested = []
+        self.rejected = []
+        self.listen_port = listen_port
+        self.remote_peer_id = None
+        self.supports_extensions = False
+        self.extensions = {}
+        self.reqq = None
+        self.client_name = ''
+        self.pex_sent = set()
+        self.on_pex: Optional[Callable[[List[Tuple[str, int]]], None]] = None
+        self.stats = PeerStats()
+        self.send_lock = threading.Lock()
+        now = time.monotonic()
+        self.last_sent = now
+        self.last_received = now
+        # Start of the current wait for a block, reset by blocks and unchokes
+        self.last_block_at = now
+        self.choked_at = now
+        self.snubbed = False
+        # Set by the session so timers can see what this peer still owes us
+        self.active_pieces = set()
+        self.outstanding = {}
+        # Work other threads hand to this peer's thread, see post()
+        self.posted = deque()
+        self.wakeup_r: Optional[socket.socket] = None
+        self.wakeup_w: Optional[socket.socket] = None
         
     def connect(self) -> bool:
         
@@ -25,38 +91,68 @@ class Peer:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(5) 
             self.socket.connect((self.ip, self.port))
-            
-       
-            handshake = self._create_handshake()
-            self.socket.send(handshake)
-            
-         
-            response = self.socket.recv(68)
-            if len(response) != 68:
-                self.socket.close()
-                return False
-                
-        
-            if response[1:20] != b'BitTorrent protocol':
+            self.socket.sendall(self._create_handshake())
+            response = self._recv_exact(68)
+            if not self._valid_handshake(response):
                 self.socket.close()
                 return False
-            if response[28:48] != self.info_hash:
-                self.socket.close()
-                return False
-                
-            self.connected = True
-            self.socket.settimeout(10)  
+            self._on_connected(response)
             return True
             
         except Exception as e:
+            peer_log.debug('connect', "Could not connect to %s:%d: %s", self.ip, self.port, e)
             if self.socket:
                 self.socket.close()
             return False
+
+    def accept(self, sock: socket.socket) -> bool:
+        
+        # Inbound connection: the remote side sends its handshake first and
+        # only gets ours if it asked for our torrent
+        self.socket = sock
+        try:
+            self.socket.settimeout(5)
+            response = self._recv_exact(68)
+            if not self._valid_handshake(response):
+                self.socket.close()
+                return False
+            self.socket.sendall(self._create_handshake())
+            self._on_connected(response)
+            return True
+        except Exception as e:
+            peer_log.debug('accept', "Handshake from %s:%d failed: %s", self.ip, self.port, e)
+            self.socket.close()
+            return False
+
+    def _valid_handshake(self, response: Optional[bytes]) -> bool:
+        
+        return response is not None and len(response) == 68 and response[1:20] == b'BitTorrent protocol' \
+            and response[28:48] == self.info_hash
+
+    def _on_connected(self, response: bytes):
+        
+        self.remote_peer_id = response[48:68]
+        byte, mask = EXTENSION_PROTOCOL_BIT
+        self.supports_extensions = bool(response[20 + byte] & mask)
+        byte, mask = FAST_EXTENSION_BIT
+        self.supports_fast = bool(response[20 + byte] & mask)
+
+        self.connected = True
+        self.socket.settimeout(SOCKET_TIMEOUT)
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_w.setblocking(False)
+        if self.supports_extensions:
+            self.send_extended_handshake()
     
     def _create_handshake(self) -> bytes:
         
         protocol = b'BitTorrent protocol'
-        reserved = b'\x00' * 8
+        reserved = bytearray(8)
+        byte, mask = EXTENSION_PROTOCOL_BIT
+        reserved[byte] |= mask
+        byte, mask = FAST_EXTENSION_BIT
+        reserved[byte] |= mask
+        reserved = bytes(reserved)
         return struct.pack('B', 19) + protocol + reserved + self.info_hash + self.peer_id
     
     def send_message(self, message_id: int, payload: bytes = b'') -> bool:
@@ -69,7 +165,11 @@ class Peer:
             else:
                 length = len(payload) + 1
                 message = struct.pack('>IB', length, message_id) + payload
-            self.socket.send(message)
+            # Other threads should post() their sends; the lock only keeps
+            # frames whole if one writes here directly
+            with self.send_lock:
+                self.socket.sendall(message)
+            self.last_sent = time.monotonic()
             return True
         except:
             return False
@@ -79,13 +179,20 @@ class Peer:
         if not self.connected:
             return None
         try:
-            
+            if self.wakeup_r is not None:
+                readable, _, _ = select.select([self.socket, self.wakeup_r], [], [])
+                if self.wakeup_r in readable:
+                    self.wakeup_r.recv(4096)
+                    if self.socket not in readable:
+                        return (NO_MESSAGE, b'')
+
             length_data = self._recv_exact(4)
             if not length_data:
                 return None
             length = struct.unpack('>I', length_data)[0]
             
             if length == 0: 
+                self.last_received = time.monotonic()
                 return (-1, b'')
             
           
@@ -93,11 +200,29 @@ class Peer:
             if not message_data:
                 return None
             
+            self.last_received = time.monotonic()
             message_id = message_data[0]
             payload = message_data[1:]
             return (message_id, payload)
         except:
             return None
+
+    def wake(self):
+        # Never blocks: a full wakeup buffer already has a wake pending
+        try:
+            self.wakeup_w.send(b'\0')
+        except (AttributeError, OSError):
+            pass
+
+    def post(self, action: Callable[[], object]):
+        """Runs action on this peer's own thread at its next turn, so
+        timers and other peers never block on this peer's socket."""
+        self.posted.append(action)
+        self.wake()
+
+    def run_posted(self):
+        while self.posted:
+            self.posted.popleft()()
     
     def _recv_exact(self, length: int) -> Optional[bytes]:
         
@@ -109,7 +234,10 @@ class Peer:
                     return None
                 data += chunk
             except socket.timeout:
-                return None
+                # Mid-message: keep waiting, the idle timer closes the
+                # socket if the peer has really stalled
+                if not self.connected:
+                    return None
             except:
                 return None
         return data
@@ -117,20 +245,233 @@ class Peer:
     def request_piece(self, piece_index: int, begin: int, length: int) -> bool:
         
         payload = struct.pack('>III', piece_index, begin, length)
+        self.stats.on_request(piece_index, begin)
         return self.send_message(6, payload) 
+
+    @property
+    def download_speed(self) -> float:
+        return self.stats.downloaded.rate()
+
+    @property
+    def upload_speed(self) -> float:
+        return self.stats.uploaded.rate()
     
     def send_interested(self) -> bool:
         
         return self.send_message(2)  
+
+    def send_keepalive(self) -> bool:
+        
+        return self.send_message(-1)
+
+    def send_choke(self) -> bool:
+        
+        self.choked = True
+        return self.send_message(0)
+
+    def send_unchoke(self) -> bool:
+        
+        self.choked = False
+        return self.send_message(1)
+
+    def send_piece(self, piece_index: int, begin: int, block: bytes) -> bool:
+        
+        if not self.send_message(7, struct.pack('>II', piece_index, begin) + block):
+            return False
+        self.stats.on_upload(len(block))
+        return True
+
+    def handle_message(self, message_id: int, payload: bytes) -> bool:
+        """Applies a message to the peer's state. False means the peer broke
+        the protocol and should be dropped."""
+        if message_id == 0:
+            if not self.peer_choking:
+                self.choked_at = time.monotonic()
+            self.peer_choking = True
+            if not self.supports_fast:
+                self.stats.forget_requests()
+        elif message_id == 1:
+            if self.peer_choking:
+                self.last_block_at = time.monotonic()
+            self.peer_choking = False
+        elif message_id == 2:
+            self.peer_interested = True
+        elif message_id == 3:
+            self.peer_interested = False
+        elif message_id == 4 and len(payload) == 4:
+            piece_index = struct.unpack('>I', payload)[0]
+            if piece_index >= self.num_pieces:
+                return False
+            self._set_have(piece_index)
+        elif message_id == 7 and len(payload) >= 8:
+            piece_index, begin = struct.unpack('>II', payload[:8])
+            self.stats.on_block(piece_index, begin, len(payload) - 8)
+            self.last_block_at = time.monotonic()
+            self.snubbed = False
+        elif message_id == 5:
+            if not self._valid_bitfield(payload):
+                return False
+            self.bitfield = payload
+            self.have = bytearray(payload)
+            self.has_all = False
+            self.pieces_count = sum(bin(b).count('1') for b in payload)
+        elif message_id == HAVE_ALL and self.supports_fast:
+            self.has_all = True
+            self.pieces_count = self.num_pieces
+        elif message_id == HAVE_NONE and self.supports_fast:
+            self.have = bytearray()
+            self.has_all = False
+            self.pieces_count = 0
+        elif message_id == SUGGEST_PIECE and self.supports_fast and len(payload) == 4:
+            piece_index = struct.unpack('>I', payload)[0]
+            if piece_index < self.num_pieces:
+                self.suggested.append(piece_index)
+        elif message_id == REJECT_REQUEST and self.supports_fast and len(payload) == 12:
+            rejected = struct.unpack('>III', payload)
+            peer_log.debug('reject', "%s:%d rejected block %d/%d", self.ip, self.port, rejected[0], rejected[1])
+            self.stats.on_reject(rejected[0], rejected[1])
+            self.rejected.append(rejected)
+        elif message_id == ALLOWED_FAST and self.supports_fast and len(payload) == 4:
+            piece_index = struct.unpack('>I', payload)[0]
+            if piece_index < self.num_pieces:
+                self.allowed_fast.add(piece_index)
+        elif message_id == Extensions.EXTENDED_MESSAGE_ID:
+            self.handle_extended(payload)
+        return True
+
+    def _valid_bitfield(self, payload: bytes) -> bool:
+        
+        if len(payload) != (self.num_pieces + 7) // 8:
+            return False
+        # Bits past the last piece must be clear
+        spare = -self.num_pieces % 8
+        return not payload or not payload[-1] & ((1 << spare) - 1)
+
+    def _set_have(self, piece_index: int):
+        
+        if self.has_all:
+            return
+        byte, bit = divmod(piece_index, 8)
+        if byte >= len(self.have):
+            self.have.extend(b'\x00' * (byte + 1 - len(self.have)))
+        mask = 0x80 >> bit
+        if not self.have[byte] & mask:
+            self.have[byte] |= mask
+            self.pieces_count += 1
+
+    def has_piece(self, piece_index: int) -> bool:
+        
+        if self.has_all:
+            return True
+        byte, bit = divmod(piece_index, 8)
+        return byte < len(self.have) and bool(self.have[byte] & (0x80 >> bit))
+
+    def can_request(self, piece_index: int) -> bool:
+        
+        return not self.peer_choking or piece_index in self.allowed_fast
+
+    def send_have(self, piece_index: int) -> bool:
+        
+        return self.send_message(4, struct.pack('>I', piece_index))
+
+    def send_cancel(self, piece_index: int, begin: int, length: int) -> bool:
+        
+        return self.send_message(8, struct.pack('>III', piece_index, begin, length))
+
+    def send_piece_state(self, bitfield: bytes, have_all: bool) -> bool:
+        
+        if self.supports_fast:
+            if have_all:
+                return self.send_message(HAVE_ALL)
+            if not any(bitfield):
+                return self.send_message(HAVE_NONE)
+        elif not any(bitfield):
+            # Without the fast extension an empty bitfield may simply be omitted
+            return True
+        return self.send_message(5, bitfield)
+
+    def send_reject(self, piece_index: int, begin: int, length: int) -> bool:
+        
+        if not self.supports_fast:
+            return False
+        return self.send_message(REJECT_REQUEST, struct.pack('>III', piece_index, begin, length))
+
+    def send_allowed_fast(self, piece_index: int) -> bool:
+        
+        if not self.supports_fast:
+            return False
+        return self.send_message(ALLOWED_FAST, struct.pack('>I', piece_index))
+
+    def pipeline_depth(self) -> int:
+        
+        if self.snubbed:
+            # Let a snubbing peer prove itself with one request at a time
+            return 1
+        if self.reqq:
+            return max(1, min(self.reqq, MAX_PIPELINE_DEPTH))
+        return DEFAULT_PIPELINE_DEPTH
+
+    def send_extended(self, extension_name: bytes, payload: bytes) -> bool:
+        
+        ext_id = self.extensions.get(extension_name)
+        if not ext_id:
+            return False
+        return self.send_message(Extensions.EXTENDED_MESSAGE_ID, bytes([ext_id]) + payload)
+
+    def send_extended_handshake(self) -> bool:
+        
+        payload = Extensions.build_extended_handshake(self.listen_port)
+        return self.send_message(Extensions.EXTENDED_MESSAGE_ID, bytes([Extensions.EXTENDED_HANDSHAKE_ID]) + payload)
+
+    def handle_extended(self, payload: bytes):
+        
+        if not payload:
+            return
+        ext_id, body = payload[0], payload[1:]
+        try:
+            if ext_id == Extensions.EXTENDED_HANDSHAKE_ID:
+                handshake = Extensions.parse_extended_handshake(body)
+                self.extensions = handshake['extensions']
+                self.reqq = handshake['reqq'] or self.reqq
+                self.client_name = handshake['client']
+            elif ext_id == Extensions.UT_PEX:
+                added, _ = Extensions.parse_pex(body)
+                if added and self.on_pex:
+                    self.on_pex(added)
+        except Exception:
+            # A malformed extension message is not worth dropping the peer over
+            pass
+
+    def send_pex(self, connected_peers: List[Tuple[str, int]]) -> bool:
+        
+        if b'ut_pex' not in self.extensions:
+            return False
+        current = set(connected_peers)
+        current.discard((self.ip, self.port))
+        added = list(current - self.pex_sent)
+        dropped = list(self.pex_sent - current)
+        if not added and not dropped:
+            return True
+        self.pex_sent = (self.pex_sent | set(added[:Extensions.MAX_PEX_PEERS])) - set(dropped[:Extensions.MAX_PEX_PEERS])
+        return self.send_extended(b'ut_pex', Extensions.build_pex(added, dropped))
     
     def disconnect(self):
        
         if self.socket:
+            try:
+                # Wakes a reader blocked on this socket in another thread
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
             try:
                 self.socket.close()
             except:
                 pass
         self.connected = False
+        self.stats.forget_requests()
+        for sock in (self.wakeup_r, self.wakeup_w):
+            if sock is not None:
+                sock.close()
 
 
 
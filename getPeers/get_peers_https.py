@@ -3,6 +3,9 @@ import bencodepy
 import struct
 from typing import List, Tuple
 import urllib.parse
+from log.Log import get_logger
+
+logger = get_logger('tracker.http')
 
 
 class get_peers_https:
@@ -16,14 +19,13 @@ class get_peers_https:
     def get_peers_https(self, announce_url: str) -> List[Tuple[str, int]]:
        
         if not self._is_valid_tracker_url(announce_url):
-            print(f"Warning: URL doesn't look like a tracker: {announce_url}")
+            logger.warning("URL doesn't look like a tracker: %s", announce_url)
             return []
             
-        info_hash_encoded = urllib.parse.quote(self.torrent.info_hash, safe='')
-        
+        # requests percent-encodes raw bytes itself, quoting here would encode twice
         params = {
-            'info_hash': info_hash_encoded,
-            'peer_id': self.peer_id.decode('latin-1') if isinstance(self.peer_id, bytes) else self.peer_id,
+            'info_hash': self.torrent.info_hash,
+            'peer_id': self.peer_id,
             'port': self.port,
             'uploaded': 0,
             'downloaded': 0,
@@ -33,7 +35,7 @@ class get_peers_https:
         }
         
         try:
-            print(f"Contacting HTTP tracker: {announce_url}")
+            logger.info("Contacting HTTP tracker: %s", announce_url)
             
             
             headers = {
@@ -43,41 +45,41 @@ class get_peers_https:
             
             response = requests.get(announce_url, params=params, timeout=self.timeout, headers=headers)
             
-            print(f"Response status: {response.status_code}")
-            print(f"Response content type: {response.headers.get('content-type', 'unknown')}")
+            logger.debug("Response status: %s, content type: %s",
+                         response.status_code, response.headers.get('content-type', 'unknown'))
             
             if response.status_code == 200:
                 
                 if response.content.startswith(b'<'):
-                    print("Error: Tracker returned HTML instead of bencoded data")
-                    print("This might be a web directory, not a BitTorrent tracker")
-                    print(f"Response preview: {response.content[:200]}...")
+                    logger.warning("Tracker %s returned HTML instead of bencoded data, "
+                                   "this might be a web directory, not a BitTorrent tracker", announce_url)
+                    logger.debug("Response preview: %r", response.content[:200])
                     return []
                 
                 
                 if response.content.startswith(b'{'):
-                    print("Error: Tracker returned JSON instead of bencoded data")
-                    print(f"Response: {response.content.decode('utf-8', errors='ignore')}")
+                    logger.warning("Tracker %s returned JSON instead of bencoded data", announce_url)
+                    logger.debug("Response: %r", response.content[:200])
                     return []
                 
                 return self.parse_tracker_response(response.content)
             else:
-                print(f"Tracker returned status {response.status_code}")
+                logger.warning("Tracker %s returned status %s", announce_url, response.status_code)
                 if response.content:
-                    print(f"Response content: {response.content[:200]}...")
+                    logger.debug("Response content: %r", response.content[:200])
                 return []
                 
         except requests.exceptions.Timeout:
-            print(f"Timeout contacting tracker {announce_url}")
+            logger.warning("Timeout contacting tracker %s", announce_url)
             return []
         except requests.exceptions.ConnectionError:
-            print(f"Connection error contacting tracker {announce_url}")
+            logger.warning("Connection error contacting tracker %s", announce_url)
             return []
         except requests.exceptions.RequestException as e:
-            print(f"Request error contacting tracker {announce_url}: {e}")
+            logger.warning("Request error contacting tracker %s: %s", announce_url, e)
             return []
         except Exception as e:
-            print(f"Unexpected error contacting tracker {announce_url}: {e}")
+            logger.exception("Unexpected error contacting tracker %s: %s", announce_url, e)
             return []
 
     def _is_valid_tracker_url(self, url: str) -> bool:
@@ -96,31 +98,27 @@ class get_peers_https:
 
     def parse_tracker_response(self, response_data: bytes) -> List[Tuple[str, int]]:
         try:
-            # First, let's see what we're trying to decode
-            print(f"Response data length: {len(response_data)} bytes")
-            print(f"Response data starts with: {response_data[:50]}")
+            logger.debug("Response data length: %d bytes", len(response_data))
             
             decoded = bencodepy.decode(response_data)
             
-            print("\033[1;33m", "Decoded response:", decoded, "\033[m")
+            logger.debug("Decoded response: %r", decoded)
                 
             if b'failure reason' in decoded:
-                print(f"Tracker failure: {decoded[b'failure reason'].decode()}")
+                logger.warning("Tracker failure: %s", decoded[b'failure reason'].decode(errors='replace'))
                 return []
                 
             peers_data = decoded.get(b'peers', b'')
             if not peers_data:
-                print("No peers in response")
+                logger.info("No peers in response")
                 # Check if there's a peers list instead of compact format
                 if b'peers' in decoded and isinstance(decoded[b'peers'], list):
-                    print("Found peers in list format")
+                    logger.debug("Found peers in list format")
                     return self._parse_peers_list(decoded[b'peers'])
                 return []
             
             peers = []
             
-            print("\033[1;33m", "Peers data:", peers_data, "\033[m")
-            
             # Parse compact peers format
             for i in range(0, len(peers_data), 6):
                 if i + 6 > len(peers_data):
@@ -131,16 +129,15 @@ class get_peers_https:
                 port = struct.unpack('>H', port_bytes)[0]
                 peers.append((ip, port))
             
-            print(f"Parsed {len(peers)} peers from compact format")
+            logger.info("Parsed %d peers from compact format", len(peers))
             return peers
             
         except bencodepy.exceptions.DecodingError as e:
-            print(f"Bencode decoding error: {e}")
-            print("This is likely not a valid tracker response")
-            print(f"Response data: {response_data[:100]}...")
+            logger.warning("Bencode decoding error, likely not a valid tracker response: %s", e)
+            logger.debug("Response data: %r", response_data[:100])
             return []
         except Exception as e:
-            print(f"Error parsing tracker response: {e}")
+            logger.warning("Error parsing tracker response: %s", e)
             return []
 
     def _parse_peers_list(self, peers_list: list) -> List[Tuple[str, int]]:
@@ -154,19 +151,17 @@ class get_peers_https:
                     if ip and port:
                         peers.append((ip, port))
             
-            print(f"Parsed {len(peers)} peers from list format")
+            logger.info("Parsed %d peers from list format", len(peers))
             return peers
         except Exception as e:
-            print(f"Error parsing peers list: {e}")
+            logger.warning("Error parsing peers list: %s", e)
             return []
 
     def debug_request(self, announce_url: str) -> dict:
         """Debug method to inspect the request being made"""
-        info_hash_encoded = urllib.parse.quote(self.torrent.info_hash, safe='')
-        
         params = {
-            'info_hash': info_hash_encoded,
-            'peer_id': self.peer_id.decode('latin-1') if isinstance(self.peer_id, bytes) else self.peer_id,
+            'info_hash': self.torrent.info_hash,
+            'peer_id': self.peer_id,
             'port': self.port,
             'uploaded': 0,
             'downloaded': 0,
@@ -1,19 +1,39 @@
 import socket
 import struct
 import random 
+import time
 import urllib.parse
 from typing import List
+from typing import Optional
 from typing import Tuple
+from log.Log import get_logger
 
+logger = get_logger('tracker.udp')
 
 
 
 
 
+
+PROTOCOL_ID = 0x41727101980
+# BEP 15: wait 15 * 2^n seconds for the n-th retransmit
+BASE_TIMEOUT = 15.0
+# BEP 15 allows 8 retries (over an hour), a tracker that quiet is better
+# skipped in favour of the next one
+MAX_RETRIES = 3
+CONNECTION_ID_TTL = 60.0
+
+
+class TrackerError(Exception):
+    pass
+
+
 class get_peers_udp:
-    def __init__(self, torrent, peer_id):
+    def __init__(self, torrent, peer_id, base_timeout: float = BASE_TIMEOUT, max_retries: int = MAX_RETRIES):
         self.torrent = torrent
         self.peer_id = peer_id
+        self.base_timeout = base_timeout
+        self.max_retries = max_retries
 
     def get_peers_udp(self, announce_url: str) -> List[Tuple[str, int]]:
         try:
@@ -23,75 +43,91 @@ class get_peers_udp:
             
         
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(10)
-            
-        
-            connection_id = 0x41727101980  
-            action = 0  
-            transaction_id = random.randint(0, 2**32 - 1)
-            
-            connect_request = struct.pack('>QII', connection_id, action, transaction_id)
-            sock.sendto(connect_request, (tracker_host, tracker_port))
-            
-        
-            response, _ = sock.recvfrom(16)
-            if len(response) < 16:
-                print("Invalid UDP tracker connect response")
-                return []
-            
-            resp_action, resp_transaction_id, connection_id = struct.unpack('>III', response[:12])
-            connection_id = struct.unpack('>Q', response[8:16])[0]
-            
-            if resp_action != 0 or resp_transaction_id != transaction_id:
-                print("UDP tracker connect response mismatch")
-                return []
-            
-            
-            action = 1 
-            transaction_id = random.randint(0, 2**32 - 1)
-            
-            announce_request = struct.pack(
-                '>QII20s20sQQQIIIiH',
-                connection_id,
-                action,
-                transaction_id,
-                self.torrent.info_hash,
-                self.peer_id,
-                0,  
-                self.torrent.total_length, 
-                0, 
-                0,  
-                0,  
-                random.randint(0, 2**32 - 1),  
-                -1,  
-                6881 
-            )
-            
-            sock.sendto(announce_request, (tracker_host, tracker_port))
-            
-            
-            response, _ = sock.recvfrom(8192) 
-            if len(response) < 20:
-                print("Invalid UDP tracker announce response")
-                return []
-            
-            resp_action, resp_transaction_id, interval, leechers, seeders = struct.unpack('>IIIII', response[:20])
-            
-            if resp_action != 1 or resp_transaction_id != transaction_id:
-                print("UDP tracker announce response mismatch")
-                return []
-            
-            
-            peers_data = response[20:]
-            return self._parse_peers(peers_data)
+            sock.connect((tracker_host, tracker_port))
+
+            connection_id = None
+            connected_at = 0.0
+            # One budget for the whole announce: a reconnect after the
+            # connection id expires does not earn more retries
+            retries = 0
+            while retries <= self.max_retries:
+                if connection_id is None or time.monotonic() - connected_at > CONNECTION_ID_TTL:
+                    # Connection ids expire after a minute, get a fresh one
+                    transaction_id = random.randint(0, 2**32 - 1)
+                    response = self._transact(sock, struct.pack('>QII', PROTOCOL_ID, 0, transaction_id),
+                                              transaction_id, 0, 16, self.base_timeout * 2 ** retries)
+                    if response is None:
+                        retries += 1
+                        continue
+                    connection_id = struct.unpack('>Q', response[8:16])[0]
+                    connected_at = time.monotonic()
+
+                transaction_id = random.randint(0, 2**32 - 1)
+                announce_request = struct.pack(
+                    '>QII20s20sQQQIIIiH',
+                    connection_id,
+                    1,
+                    transaction_id,
+                    self.torrent.info_hash,
+                    self.peer_id,
+                    0,  
+                    self.torrent.total_length, 
+                    0, 
+                    0,  
+                    0,  
+                    random.randint(0, 2**32 - 1),  
+                    -1,  
+                    6881 
+                )
+                response = self._transact(sock, announce_request, transaction_id, 1, 20,
+                                          self.base_timeout * 2 ** retries)
+                if response is None:
+                    retries += 1
+                    continue
+
+                resp_action, resp_transaction_id, interval, leechers, seeders = struct.unpack('>IIIII', response[:20])
+                peers_data = response[20:]
+                return self._parse_peers(peers_data)
+
+            logger.warning("UDP tracker %s did not answer after %d retries", announce_url, self.max_retries)
+            return []
             
+        except TrackerError as e:
+            logger.warning("UDP tracker %s returned an error: %s", announce_url, e)
+            return []
         except Exception as e:
-            print(f"Failed to contact UDP tracker: {e}")
+            logger.warning("Failed to contact UDP tracker %s: %s", announce_url, e)
             return []
         finally:
             if 'sock' in locals():
                 sock.close()
 
+    def _transact(self, sock: socket.socket, request: bytes, transaction_id: int, action: int, min_length: int,
+                  timeout: float) -> Optional[bytes]:
+        # Returns None when the request timed out and should be retransmitted
+        sock.send(request)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            sock.settimeout(remaining)
+            try:
+                response = sock.recv(8192)
+            except socket.timeout:
+                return None
+            if len(response) < 8:
+                continue
+            resp_action, resp_transaction_id = struct.unpack('>II', response[:8])
+            if resp_transaction_id != transaction_id:
+                # A late answer to an earlier retransmit
+                continue
+            if resp_action == 3:
+                raise TrackerError(response[8:].decode('utf-8', 'replace'))
+            if resp_action == action and len(response) >= min_length:
+                return response
+
+
     def _parse_peers(self, peers_data: bytes) -> List[Tuple[str, int]]:
         peers = []
         for i in range(0, len(peers_data), 6):
@@ -0,0 +1,101 @@
+import logging
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+
+ROOT_LOGGER = 'torrent'
+DEFAULT_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+
+def get_logger(name: str) -> logging.Logger:
+    # Module loggers hang off one root so a single call configures them all
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def configure(level='INFO', stream=None, fmt: str = DEFAULT_FORMAT, filename: Optional[str] = None):
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.FileHandler(filename) if filename else logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(fmt))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+    return root
+
+
+def set_level(name: str, level):
+    get_logger(name).setLevel(level)
+
+
+class AggregatedLog:
+    """Folds a high-frequency event into one line per interval."""
+
+    def __init__(self, logger: logging.Logger, message: str, interval: float = 5.0, level: int = logging.INFO):
+        self.logger = logger
+        self.message = message
+        self.interval = interval
+        self.level = level
+        self.count = 0
+        self.total = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, amount: int = 1):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        with self.lock:
+            self.count += amount
+            self.total += amount
+            now = time.monotonic()
+            if now - self.last_flush < self.interval:
+                return
+            count, elapsed = self.count, now - self.last_flush
+            self.count = 0
+            self.last_flush = now
+        self.logger.log(self.level, self.message, count, elapsed, self.total)
+
+    def flush(self):
+        with self.lock:
+            count, elapsed = self.count, time.monotonic() - self.last_flush
+            self.count = 0
+            self.last_flush = time.monotonic()
+        if count and self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, self.message, count, elapsed, self.total)
+
+
+class RateLimitedLog:
+    """Lets each key through at most once per interval and reports how many were dropped."""
+
+    def __init__(self, logger: logging.Logger, interval: float = 10.0):
+        self.logger = logger
+        self.interval = interval
+        self.last_emitted: Dict[str, float] = {}
+        self.suppressed: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def log(self, level: int, key: str, message: str, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_emitted.get(key, -self.interval) < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return
+            self.last_emitted[key] = now
+            dropped = self.suppressed.pop(key, 0)
+        if dropped:
+            self.logger.log(level, message + " (%d similar messages suppressed)", *args, dropped)
+        else:
+            self.logger.log(level, message, *args)
+
+    def warning(self, key: str, message: str, *args):
+        self.log(logging.WARNING, key, message, *args)
+
+    def info(self, key: str, message: str, *args):
+        self.log(logging.INFO, key, message, *args)
+
+    def debug(self, key: str, message: str, *args):
+        self.log(logging.DEBUG, key, message, *args)
@@ -1,8 +1,22 @@
 import hashlib
 import threading
-from typing import Optional
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set
 import threading
+import logging
 from torrent import Torrent
+from log.Log import AggregatedLog, get_logger
+
+logger = get_logger('pieceManager')
+
+PRIORITY_SKIP = 0
+PRIORITY_DEFAULT = 4
+PRIORITY_TOP = 7
+
+# A deadline piece held by another peer gets a second, racing request
+# once it is this close to due
+DEADLINE_MARGIN = 2.0
 
 class PieceManager:
 
@@ -13,19 +27,194 @@ class PieceManager:
     def __init__(self, torrent: Torrent):
         self.torrent = torrent
         self.pieces = [False] * torrent.num_pieces
-        self.piece_data = {}
-        self.pending_requests = {} 
+        # piece -> peers downloading it, more than one only when racing a deadline
+        self.pending_requests: Dict[int, Set[str]] = {}
         self.piece_blocks = {} 
+        # piece -> begin -> peer that sent the block, for blame on a failed hash
+        self.block_origins: Dict[int, Dict[int, str]] = {}
+        self.finished_origins: Dict[int, Dict[int, str]] = {}
         self.lock = threading.Lock()
+        self.verified_log = AggregatedLog(logger, "%d pieces verified in last %.1f s (%d total)", level=logging.INFO)
+
+        self.priorities = bytearray([PRIORITY_DEFAULT]) * torrent.num_pieces
+        self.file_priorities: List[int] = [PRIORITY_DEFAULT] * len(torrent.files)
+        self.levels: List[int] = [PRIORITY_DEFAULT]
+        # priority -> pieces at it, so levels never needs a full rescan
+        self.level_counts = Counter({PRIORITY_DEFAULT: torrent.num_pieces})
+        # priority -> pieces at it not downloaded yet, and how many wanted
+        # pieces are left in all, so picking and is_complete never scan
+        self.wanted: Dict[int, Set[int]] = {PRIORITY_DEFAULT: set(range(torrent.num_pieces))}
+        self.wanted_removed: Counter = Counter()
+        self.missing = torrent.num_pieces
+        self.deadlines: Dict[int, float] = {}
+        self.deadline_margin = DEADLINE_MARGIN
+        self.sequential = False
+        self.cursor = 0
+        self.window = 0
+        self.deadline_step = 0.0
         
-    def get_next_piece(self, peer_id: str) -> Optional[int]:
+    def get_next_piece(self, peer_id: str, has_piece: Optional[Callable[[int], bool]] = None,
+                       preferred: Iterable[int] = ()) -> Optional[int]:
         with self.lock:
-            for i, downloaded in enumerate(self.pieces):
-                if not downloaded and i not in self.pending_requests:
-                    self.pending_requests[i] = peer_id
-                    self.piece_blocks[i] = {}
-                    return i
+            pieces = self.pieces
+            priorities = self.priorities
+            pending = self.pending_requests
+
+            def available(i: int) -> bool:
+                return not pieces[i] and priorities[i] and (has_piece is None or has_piece(i))
+
+            for i in preferred:
+                if 0 <= i < len(pieces) and i not in pending and available(i):
+                    return self._assign(i, peer_id)
+
+            if self.deadlines:
+                now = time.monotonic()
+                for deadline, i in sorted((d, i) for i, d in self.deadlines.items()):
+                    if not available(i):
+                        continue
+                    holders = pending.get(i)
+                    if not holders:
+                        return self._assign(i, peer_id)
+                    if peer_id not in holders and len(holders) < 2 and deadline - now < self.deadline_margin:
+                        # Whoever holds it is too slow, race them for it
+                        return self._assign(i, peer_id)
+
+            if self.sequential:
+                for i in range(self.cursor, len(pieces)):
+                    if i not in pending and available(i):
+                        return self._assign(i, peer_id)
+                # Anything behind the cursor is still wanted, just later
+                for i in range(self.cursor):
+                    if i not in pending and available(i):
+                        return self._assign(i, peer_id)
+                return None
+
+            for level in self.levels:
+                for i in self.wanted.get(level, ()):
+                    if i not in pending and (has_piece is None or has_piece(i)):
+                        return self._assign(i, peer_id)
             return None
+
+    def _assign(self, piece_index: int, peer_id: str) -> int:
+        holders = self.pending_requests.get(piece_index)
+        if not holders:
+            self.pending_requests[piece_index] = {peer_id}
+            self.piece_blocks[piece_index] = {}
+            self.block_origins.pop(piece_index, None)
+        else:
+            holders.add(peer_id)
+        return piece_index
+
+    def is_assigned(self, piece_index: int, peer_id: str) -> bool:
+        return peer_id in self.pending_requests.get(piece_index, ())
+
+    def set_piece_priority(self, piece_index: int, priority: int):
+        self.set_piece_priorities((piece_index,), priority)
+
+    def set_piece_priorities(self, piece_indices: Iterable[int], priority: int):
+        with self.lock:
+            for i in piece_indices:
+                self._set_priority(i, priority)
+            self._update_levels()
+
+    def set_file_priority(self, file_index: int, priority: int):
+        # A piece shared by several files gets the highest of their priorities
+        with self.lock:
+            self.file_priorities[file_index] = priority
+            if not self.torrent.files[file_index].length:
+                return
+            first, last = self.file_piece_range(file_index)
+            for i in range(first, last + 1):
+                self._set_priority(i, priority)
+            for i in {first, last}:
+                self._set_priority(i, max(self.file_priorities[f] for f in self.files_in_piece(i)))
+            self._update_levels()
+
+    def _set_priority(self, piece_index: int, priority: int):
+        old = self.priorities[piece_index]
+        if old == priority:
+            return
+        self.level_counts[old] -= 1
+        self.level_counts[priority] += 1
+        self.priorities[piece_index] = priority
+        if self.pieces[piece_index]:
+            return
+        if old:
+            self._unwant(old, piece_index)
+        if priority:
+            self.wanted.setdefault(priority, set()).add(piece_index)
+            self.missing += 1
+
+    def _update_levels(self):
+        self.levels = sorted((level for level, count in self.level_counts.items() if level and count > 0),
+                             reverse=True)
+
+    def file_piece_range(self, file_index: int):
+        torrent_file = self.torrent.files[file_index]
+        first = torrent_file.offset // self.torrent.piece_length
+        last = max(first, (torrent_file.offset + torrent_file.length - 1) // self.torrent.piece_length)
+        return first, min(last, self.torrent.num_pieces - 1)
+
+    def files_in_piece(self, piece_index: int) -> List[int]:
+        start = piece_index * self.torrent.piece_length
+        end = start + self.get_piece_length(piece_index)
+        return [f for f, torrent_file in enumerate(self.torrent.files)
+                if torrent_file.offset < end and torrent_file.offset + torrent_file.length > start]
+
+    def set_piece_deadline(self, piece_index: int, deadline: float):
+        # deadline is a time.monotonic() timestamp
+        with self.lock:
+            if not self.pieces[piece_index]:
+                self.deadlines[piece_index] = deadline
+
+    def clear_deadlines(self):
+        with self.lock:
+            self.deadlines.clear()
+
+    def set_sequential(self, enabled: bool, window: int = 0, deadline_step: float = 1.0):
+        """Pick pieces in order from the cursor; the first window pieces
+        past it get deadlines deadline_step seconds apart."""
+        with self.lock:
+            self.sequential = enabled
+            self.window = window if enabled else 0
+            self.deadline_step = deadline_step
+            if not enabled:
+                self.deadlines.clear()
+        self.set_cursor(self.cursor)
+
+    def set_cursor(self, piece_index: int):
+        with self.lock:
+            self.cursor = max(0, min(piece_index, len(self.pieces) - 1))
+            if not self.window:
+                return
+            # Deadlines behind the cursor no longer matter, ones already
+            # inside the window keep the earlier of old and new
+            self.deadlines = {i: d for i, d in self.deadlines.items() if i >= self.cursor}
+            now = time.monotonic()
+            slot = 0
+            for i in range(self.cursor, len(self.pieces)):
+                if slot >= self.window:
+                    break
+                if self.pieces[i] or not self.priorities[i]:
+                    continue
+                slot += 1
+                deadline = now + slot * self.deadline_step
+                self.deadlines[i] = min(deadline, self.deadlines.get(i, deadline))
+
+    def get_piece_length(self, piece_index: int) -> int:
+        
+        if piece_index == self.torrent.num_pieces - 1:
+            return self.torrent.total_length - (piece_index * self.torrent.piece_length)
+        return self.torrent.piece_length
+
+    def bitfield(self) -> bytes:
+        
+        with self.lock:
+            field = bytearray((len(self.pieces) + 7) // 8)
+            for i, downloaded in enumerate(self.pieces):
+                if downloaded:
+                    field[i // 8] |= 0x80 >> (i % 8)
+            return bytes(field)
     
     def verify_piece(self, piece_index: int, data: bytes) -> bool:
         
@@ -33,14 +222,19 @@ class PieceManager:
         expected_hash = self.torrent.get_piece_hash(piece_index)
         return piece_hash == expected_hash
     
-    def add_block(self, piece_index: int, begin: int, data: bytes) -> Optional[bytes]:
+    def add_block(self, piece_index: int, begin: int, data: bytes, peer_id: Optional[str] = None) -> Optional[bytes]:
         
         with self.lock:
+            if self.pieces[piece_index]:
+                # Another peer won the race for it
+                return None
             if piece_index not in self.piece_blocks:
                 self.piece_blocks[piece_index] = {}
             
            
             self.piece_blocks[piece_index][begin] = data
+            if peer_id is not None:
+                self.block_origins.setdefault(piece_index, {})[begin] = peer_id
             
            
             expected_length = self.torrent.piece_length
@@ -63,6 +257,9 @@ class PieceManager:
             
             
             if len(piece_data) == expected_length:
+                # Hand the piece out once even if a racing peer sends the same blocks
+                del self.piece_blocks[piece_index]
+                self.finished_origins[piece_index] = self.block_origins.pop(piece_index, {})
                 return piece_data
             else:
                 return None
@@ -70,39 +267,88 @@ class PieceManager:
     def store_piece(self, piece_index: int, data: bytes) -> bool:
       
         if not self.verify_piece(piece_index, data):
-            print(f"Piece {piece_index} failed verification!")
+            logger.warning("Piece %d failed verification", piece_index)
             with self.lock:
                
                 if piece_index in self.pending_requests:
                     del self.pending_requests[piece_index]
                 if piece_index in self.piece_blocks:
                     del self.piece_blocks[piece_index]
+                self.block_origins.pop(piece_index, None)
             return False
         
         with self.lock:
-            self.piece_data[piece_index] = data
-            self.pieces[piece_index] = True
+            self._mark(piece_index)
             if piece_index in self.pending_requests:
                 del self.pending_requests[piece_index]
             if piece_index in self.piece_blocks:
                 del self.piece_blocks[piece_index]
+            self.block_origins.pop(piece_index, None)
+            self.deadlines.pop(piece_index, None)
         
-        print(f"✓ Downloaded and verified piece {piece_index + 1}/{self.torrent.num_pieces}")
+        self.verified_log.add()
 
         return True
 
 
-    def release_piece(self, piece_index: int):
+    def mark_piece(self, piece_index: int):
+        # Verified some other way, e.g. checked on disk at startup
+        with self.lock:
+            self._mark(piece_index)
+
+    def unmark_piece(self, piece_index: int):
+        # A verified piece whose data was lost, download it again
+        with self.lock:
+            if not self.pieces[piece_index]:
+                return
+            self.pieces[piece_index] = False
+            priority = self.priorities[piece_index]
+            if priority:
+                self.wanted.setdefault(priority, set()).add(piece_index)
+                self.missing += 1
+
+    def _mark(self, piece_index: int):
+        if self.pieces[piece_index]:
+            return
+        self.pieces[piece_index] = True
+        priority = self.priorities[piece_index]
+        if priority:
+            self._unwant(priority, piece_index)
+
+    def _unwant(self, priority: int, piece_index: int):
+        wanted = self.wanted[priority]
+        wanted.discard(piece_index)
+        self.missing -= 1
+        # A set never shrinks on discard and iterating it walks the whole
+        # table, so rebuild it once half of it is gone
+        self.wanted_removed[priority] += 1
+        if self.wanted_removed[priority] > len(wanted):
+            self.wanted[priority] = set(wanted)
+            self.wanted_removed[priority] = 0
+
+    def release_piece(self, piece_index: int, peer_id: Optional[str] = None):
        
         with self.lock:
+            holders = self.pending_requests.get(piece_index)
+            if holders and peer_id is not None:
+                holders.discard(peer_id)
+                if holders:
+                    # Someone else is still racing for it, keep their blocks
+                    return
             if piece_index in self.pending_requests:
                 del self.pending_requests[piece_index]
             if piece_index in self.piece_blocks:
                 del self.piece_blocks[piece_index]
+            self.block_origins.pop(piece_index, None)
+
+    def pop_block_origins(self, piece_index: int) -> Dict[int, str]:
+        
+        with self.lock:
+            return self.finished_origins.pop(piece_index, {})
     
     def is_complete(self) -> bool:
        
-        return all(self.pieces)
+        return self.missing == 0
     
     def get_progress(self) -> float:
        
@@ -0,0 +1,105 @@
+from multiprocessing import shared_memory
+from typing import Callable, Iterable, Optional
+
+from pieceManager.PieceManager import PieceManager
+from torrent import Torrent
+
+FREE = 0
+CLAIMED = 1
+DONE = 2
+
+
+class SharedPieceManager(PieceManager):
+    """PieceManager for one worker of a multi-process download.
+
+    Piece states live in a shared memory array, one byte per piece, that
+    every worker reads without locking. Claiming a piece or marking it
+    done takes claim_lock, which is held for a single byte write, so
+    workers never download the same piece. Blocks, hashing and disk
+    writes stay local to the worker. Priorities and deadlines are not
+    shared; this mode downloads the whole torrent.
+    """
+
+    def __init__(self, torrent: Torrent, shm_name: str, claim_lock, done_count,
+                 worker_index: int = 0, workers: int = 1):
+        super().__init__(torrent)
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.state = self.shm.buf
+        self.claim_lock = claim_lock
+        self.done_count = done_count
+        # Workers start scanning at different offsets so they rarely
+        # contend for the same free piece
+        self.scan_start = torrent.num_pieces * worker_index // max(1, workers)
+
+    @staticmethod
+    def create_state(num_pieces: int) -> shared_memory.SharedMemory:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, num_pieces))
+        shm.buf[:] = bytes(len(shm.buf))
+        return shm
+
+    def _claim(self, piece_index: int) -> bool:
+        with self.claim_lock:
+            if self.state[piece_index] != FREE:
+                return False
+            self.state[piece_index] = CLAIMED
+        return True
+
+    def get_next_piece(self, peer_id: str, has_piece: Optional[Callable[[int], bool]] = None,
+                       preferred: Iterable[int] = ()) -> Optional[int]:
+        with self.lock:
+            num_pieces = len(self.pieces)
+            for i in preferred:
+                if 0 <= i < num_pieces and self.state[i] == FREE and (has_piece is None or has_piece(i)) \
+                        and self._claim(i):
+                    return self._assign(i, peer_id)
+
+            # One copy of the state lets bytes.find do the scan in C
+            states = bytes(self.state[:num_pieces])
+            for start, stop in ((self.scan_start, num_pieces), (0, self.scan_start)):
+                i = states.find(FREE, start, stop)
+                while i != -1:
+                    if (has_piece is None or has_piece(i)) and self._claim(i):
+                        return self._assign(i, peer_id)
+                    i = states.find(FREE, i + 1, stop)
+            return None
+
+    def release_piece(self, piece_index: int, peer_id: Optional[str] = None):
+        super().release_piece(piece_index, peer_id)
+        with self.lock:
+            if piece_index not in self.pending_requests and self.state[piece_index] == CLAIMED:
+                self.state[piece_index] = FREE
+
+    def store_piece(self, piece_index: int, data: bytes) -> bool:
+        if not super().store_piece(piece_index, data):
+            self.state[piece_index] = FREE
+            return False
+        with self.claim_lock:
+            self.state[piece_index] = DONE
+            self.done_count.value += 1
+        return True
+
+    def unmark_piece(self, piece_index: int):
+        super().unmark_piece(piece_index)
+        with self.claim_lock:
+            if self.state[piece_index] == DONE:
+                self.state[piece_index] = FREE
+                self.done_count.value -= 1
+
+    def bitfield(self) -> bytes:
+        states = bytes(self.state[:len(self.pieces)])
+        field = bytearray((len(states) + 7) // 8)
+        i = states.find(DONE)
+        while i != -1:
+            field[i // 8] |= 0x80 >> (i % 8)
+            i = states.find(DONE, i + 1)
+        return bytes(field)
+
+    def is_complete(self) -> bool:
+        return self.done_count.value >= len(self.pieces)
+
+    def get_progress(self) -> float:
+        return self.done_count.value / len(self.pieces) * 100
+
+    def close(self):
+        self.state = None
+        self.shm.close()
@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+from log.Log import get_logger
+
+logger = get_logger('pieceManager.smartban')
+
+MAX_STRIKES = 3
+EXCLUDE_SECONDS = 60.0
+
+
+def split_blocks(piece_data: bytes, origins: Dict[int, str]) -> List[Tuple[int, bytes, str]]:
+    begins = sorted(origins)
+    ends = begins[1:] + [len(piece_data)]
+    return [(begin, piece_data[begin:end], origins[begin]) for begin, end in zip(begins, ends)]
+
+
+class SmartBan:
+    """Works out which peer poisoned a piece that failed its hash check.
+
+    On a failure the hash of every block is remembered together with the
+    peer that sent it, and the piece is kept away from those peers for a
+    while so it is fetched again from someone else. Once it verifies,
+    any peer whose remembered block differs from the good copy is the
+    culprit and gets banned. A peer that alone supplied failed pieces
+    max_strikes times is banned too, since there is nobody to compare
+    it against.
+    """
+
+    def __init__(self, max_strikes: int = MAX_STRIKES, exclude_seconds: float = EXCLUDE_SECONDS):
+        self.max_strikes = max_strikes
+        self.exclude_seconds = exclude_seconds
+        # piece -> begin -> {(peer, block hash)} from failed attempts
+        self.failed: Dict[int, Dict[int, Set[Tuple[str, bytes]]]] = {}
+        # piece -> (peers to avoid for it, until)
+        self.excluded: Dict[int, Tuple[Set[str], float]] = {}
+        self.strikes = Counter()
+        self.banned: Set[str] = set()
+        self.lock = threading.Lock()
+
+    def on_hash_failure(self, piece_index: int, piece_data: bytes, origins: Dict[int, str]) -> List[str]:
+        blocks = split_blocks(piece_data, origins)
+        contributors = {peer for _, _, peer in blocks}
+        newly_banned = []
+        with self.lock:
+            recorded = self.failed.setdefault(piece_index, {})
+            for begin, block, peer in blocks:
+                recorded.setdefault(begin, set()).add((peer, hashlib.sha1(block).digest()))
+
+            peers, _ = self.excluded.get(piece_index, (set(), 0.0))
+            self.excluded[piece_index] = (peers | contributors, time.monotonic() + self.exclude_seconds)
+
+            if len(contributors) == 1:
+                peer = next(iter(contributors))
+                self.strikes[peer] += 1
+                if self.strikes[peer] >= self.max_strikes and peer not in self.banned:
+                    self.banned.add(peer)
+                    newly_banned.append(peer)
+        for peer in newly_banned:
+            logger.warning("Banning %s after %d failed pieces it sent alone", peer, self.max_strikes)
+        return newly_banned
+
+    def on_piece_verified(self, piece_index: int, piece_data: bytes, origins: Dict[int, str]) -> List[str]:
+        with self.lock:
+            self.excluded.pop(piece_index, None)
+            recorded = self.failed.pop(piece_index, None)
+        if not recorded:
+            return []
+
+        culprits = set()
+        for begin, block, _ in split_blocks(piece_data, origins):
+            good = hashlib.sha1(block).digest()
+            culprits.update(peer for peer, block_hash in recorded.get(begin, ()) if block_hash != good)
+
+        with self.lock:
+            newly_banned = [peer for peer in culprits if peer not in self.banned]
+            self.banned.update(newly_banned)
+        for peer in newly_banned:
+            logger.warning("Banning %s, it sent bad data for piece %d", peer, piece_index)
+        return newly_banned
+
+    def allowed(self, piece_index: int, peer: str) -> bool:
+        entry = self.excluded.get(piece_index)
+        if entry is None:
+            return True
+        peers, until = entry
+        if time.monotonic() > until:
+            # Nobody else had it, give the suspects another go
+            self.excluded.pop(piece_index, None)
+            return True
+        return peer not in peers
+
+    def is_banned(self, peer: str) -> bool:
+        return peer in self.banned
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                'banned': sorted(self.banned),
+                'strikes': dict(self.strikes),
+                'pieces_under_suspicion': len(self.failed),
+            }
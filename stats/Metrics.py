@@ -0,0 +1,307 @@
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+# Metric updates run on download threads, so they never take a lock.
+# Increments on plain ints are effectively atomic under the GIL; a torn
+# read while rendering stats only ever costs a sample or two.
+
+
+class Counter:
+
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Gauge:
+
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def dec(self, amount: int = 1):
+        self.value -= amount
+
+
+class RateMeter:
+
+    __slots__ = ('name', 'help', 'window', 'buckets', 'stamps', 'total', 'started')
+
+    def __init__(self, name: str = '', help: str = '', window: int = 10):
+        self.name = name
+        self.help = help
+        self.window = window
+        self.buckets = [0] * window
+        self.stamps = [0] * window
+        self.total = 0
+        self.started = int(time.monotonic())
+
+    def add(self, amount: int):
+        now = int(time.monotonic())
+        slot = now % self.window
+        if self.stamps[slot] != now:
+            self.stamps[slot] = now
+            self.buckets[slot] = 0
+        self.buckets[slot] += amount
+        self.total += amount
+
+    def rate(self) -> float:
+        # Only complete seconds count, the current one is still filling up
+        now = int(time.monotonic())
+        seconds = min(self.window - 1, now - self.started)
+        if seconds <= 0:
+            return 0.0
+        cutoff = now - seconds
+        total = 0
+        for amount, stamp in zip(self.buckets, self.stamps):
+            if cutoff <= stamp < now:
+                total += amount
+        return total / seconds
+
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_TIMED_REQUESTS = 256
+
+
+class Histogram:
+
+    __slots__ = ('name', 'help', 'bounds', 'counts', 'sum', 'count', 'sample_every', '_tick')
+
+    def __init__(self, name: str = '', help: str = '', bounds: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+                 sample_every: int = 1):
+        self.name = name
+        self.help = help
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.sample_every = sample_every
+        self._tick = 0
+
+    def should_sample(self) -> bool:
+        self._tick += 1
+        return self._tick % self.sample_every == 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+class PeerStats:
+
+    def __init__(self, parent: Optional['TorrentStats'] = None):
+        self.parent = parent
+        self.downloaded = RateMeter('peer_download_bytes', 'Payload bytes received from the peer')
+        self.uploaded = RateMeter('peer_upload_bytes', 'Payload bytes sent to the peer')
+        self.request_rtt = Histogram('peer_request_rtt_seconds', 'Block request round trip time', sample_every=8)
+        self.timeouts = Counter('peer_timeouts', 'Socket reads that timed out')
+        self.rejected = Counter('peer_rejected_requests', 'Requests rejected by the peer')
+        self.wasted_bytes = Counter('peer_wasted_bytes', 'Bytes received that were never used')
+        self.hash_failed_bytes = Counter('peer_hash_failed_bytes', 'Bytes sent in pieces that failed the hash check')
+        self.snubs = Counter('peer_snubs', 'Times the peer sent no block for too long while unchoking us')
+        self.connected_at = time.monotonic()
+        # (piece, begin) -> send time, only for sampled requests
+        self.request_times: Dict[Tuple[int, int], float] = {}
+
+    def on_request(self, piece_index: int, begin: int):
+        if self.request_rtt.should_sample():
+            if len(self.request_times) >= MAX_TIMED_REQUESTS:
+                # Requests that never got an answer, oldest first
+                del self.request_times[next(iter(self.request_times))]
+            self.request_times[(piece_index, begin)] = time.monotonic()
+
+    def forget_requests(self):
+        # The peer dropped every pending request, none of them will be answered
+        self.request_times.clear()
+
+    def on_block(self, piece_index: int, begin: int, length: int):
+        self.downloaded.add(length)
+        sent_at = self.request_times.pop((piece_index, begin), None) if self.request_times else None
+        rtt = time.monotonic() - sent_at if sent_at is not None else None
+        if rtt is not None:
+            self.request_rtt.observe(rtt)
+        if self.parent:
+            self.parent.downloaded.add(length)
+            if rtt is not None:
+                self.parent.request_rtt.observe(rtt)
+
+    def on_upload(self, length: int):
+        self.uploaded.add(length)
+        if self.parent:
+            self.parent.uploaded.add(length)
+
+    def on_reject(self, piece_index: int, begin: int):
+        self.request_times.pop((piece_index, begin), None)
+        self.rejected.inc()
+        if self.parent:
+            self.parent.rejected_requests.inc()
+
+    def on_timeout(self):
+        self.timeouts.inc()
+
+    def on_wasted(self, length: int):
+        self.wasted_bytes.inc(length)
+        if self.parent:
+            self.parent.wasted_bytes.inc(length)
+
+    def on_snub(self):
+        self.snubs.inc()
+        if self.parent:
+            self.parent.snubs.inc()
+
+    def on_hash_failure(self, length: int):
+        self.hash_failed_bytes.inc(length)
+        self.on_wasted(length)
+
+    def snapshot(self) -> Dict:
+        return {
+            'download_speed': self.downloaded.rate(),
+            'upload_speed': self.uploaded.rate(),
+            'downloaded': self.downloaded.total,
+            'uploaded': self.uploaded.total,
+            'request_rtt': self.request_rtt.snapshot(),
+            'timeouts': self.timeouts.value,
+            'rejected': self.rejected.value,
+            'wasted_bytes': self.wasted_bytes.value,
+            'hash_failed_bytes': self.hash_failed_bytes.value,
+            'snubs': self.snubs.value,
+            'connected_seconds': time.monotonic() - self.connected_at,
+        }
+
+
+class TorrentStats:
+
+    def __init__(self):
+        self.downloaded = RateMeter('torrent_download_bytes', 'Payload bytes downloaded')
+        self.uploaded = RateMeter('torrent_upload_bytes', 'Payload bytes uploaded')
+        self.pieces_verified = Counter('torrent_pieces_verified', 'Pieces that passed the hash check')
+        self.verified_bytes = Counter('torrent_verified_bytes', 'Bytes of pieces that passed the hash check')
+        self.hash_failures = Counter('torrent_hash_failures', 'Pieces that failed the hash check')
+        self.request_timeouts = Counter('torrent_request_timeouts', 'Requests dropped by peer timeouts')
+        self.rejected_requests = Counter('torrent_rejected_requests', 'Requests rejected by peers')
+        self.wasted_bytes = Counter('torrent_wasted_bytes', 'Bytes downloaded and thrown away')
+        self.banned_peers = Counter('torrent_banned_peers', 'Peers banned for sending bad data')
+        self.snubs = Counter('torrent_snubs', 'Times a peer sent no block for too long while unchoking us')
+        self.idle_disconnects = Counter('torrent_idle_disconnects', 'Peers dropped for sending nothing at all')
+        self.rotated_peers = Counter('torrent_rotated_peers', 'Unproductive peers dropped to make room for new ones')
+        self.request_rtt = Histogram('torrent_request_rtt_seconds', 'Block request round trip time')
+        self.disk_write_latency = Histogram('torrent_disk_write_seconds', 'Time spent per coalesced disk write')
+        self.disk_queue_depth = Gauge('torrent_disk_queue_depth', 'Pieces waiting to be written')
+        self.disk_queue_bytes = Gauge('torrent_disk_queue_bytes', 'Bytes waiting to be written')
+        self.read_cache_hits = Counter('torrent_read_cache_hits', 'Block reads served from memory')
+        self.read_cache_misses = Counter('torrent_read_cache_misses', 'Block reads that went to disk')
+        self.read_cache_bypassed = Counter('torrent_read_cache_bypassed', 'Cold block reads that skipped the cache')
+        self.read_cache_evictions = Counter('torrent_read_cache_evictions', 'Pieces evicted from the read cache')
+        self.read_cache_bytes = Gauge('torrent_read_cache_bytes', 'Bytes held by the read cache')
+        self.started_at = time.monotonic()
+        self.first_piece_at: Optional[float] = None
+
+    def on_piece_verified(self, length: int):
+        if self.first_piece_at is None:
+            self.first_piece_at = time.monotonic()
+        self.pieces_verified.inc()
+        self.verified_bytes.inc(length)
+
+    def metrics(self) -> List:
+        return [value for value in vars(self).values() if hasattr(value, 'name')]
+
+    def snapshot(self) -> Dict:
+        return {
+            'download_speed': self.downloaded.rate(),
+            'upload_speed': self.uploaded.rate(),
+            'downloaded': self.downloaded.total,
+            'uploaded': self.uploaded.total,
+            'pieces_verified': self.pieces_verified.value,
+            'verified_bytes': self.verified_bytes.value,
+            'hash_failures': self.hash_failures.value,
+            'request_timeouts': self.request_timeouts.value,
+            'rejected_requests': self.rejected_requests.value,
+            'wasted_bytes': self.wasted_bytes.value,
+            'banned_peers': self.banned_peers.value,
+            'snubs': self.snubs.value,
+            'idle_disconnects': self.idle_disconnects.value,
+            'rotated_peers': self.rotated_peers.value,
+            'request_rtt': self.request_rtt.snapshot(),
+            'disk_write_latency': self.disk_write_latency.snapshot(),
+            'disk_queue_depth': self.disk_queue_depth.value,
+            'disk_queue_bytes': self.disk_queue_bytes.value,
+            'elapsed_seconds': time.monotonic() - self.started_at,
+            'time_to_first_piece': self.first_piece_at - self.started_at if self.first_piece_at else None,
+        }
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    inner = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    return '{' + inner + '}'
+
+
+def prometheus_lines(samples: List[Tuple[object, Dict[str, str]]]) -> List[str]:
+    # Every sample is of the same metric, one per label set. The text
+    # format wants each family as a single contiguous group.
+    metric = samples[0][0]
+    lines = []
+    if isinstance(metric, Histogram):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} histogram")
+        for sample, labels in samples:
+            cumulative = 0
+            for bound, count in zip(sample.bounds + (float('inf'),), sample.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{metric.name}_bucket{_format_labels(dict(labels, le=le))} {cumulative}")
+            lines.append(f"{metric.name}_sum{_format_labels(labels)} {sample.sum}")
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {sample.count}")
+    elif isinstance(metric, RateMeter):
+        lines.append(f"# HELP {metric.name}_total {metric.help}")
+        lines.append(f"# TYPE {metric.name}_total counter")
+        lines.extend(f"{metric.name}_total{_format_labels(labels)} {sample.total}" for sample, labels in samples)
+        lines.append(f"# HELP {metric.name}_per_second {metric.help}, per second over the last {metric.window}s")
+        lines.append(f"# TYPE {metric.name}_per_second gauge")
+        lines.extend(f"{metric.name}_per_second{_format_labels(labels)} {sample.rate():.1f}"
+                     for sample, labels in samples)
+    else:
+        kind = 'counter' if isinstance(metric, Counter) else 'gauge'
+        name = f"{metric.name}_total" if kind == 'counter' else metric.name
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{_format_labels(labels)} {sample.value}" for sample, labels in samples)
+    return lines
@@ -0,0 +1,278 @@
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from log.Log import get_logger
+
+logger = get_logger('profiler')
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Since 3.12 cProfile sits on sys.monitoring: only one profiler can be
+# enabled per interpreter, and that one already sees every thread
+SINGLE_CPROFILE = sys.version_info >= (3, 12)
+
+# Stdlib frames a thread sits in while blocked, for platforms without
+# per-thread CPU clocks
+BLOCKING_FRAMES = {
+    ('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('threading.py', 'join'),
+    ('queue.py', 'get'), ('selectors.py', 'select'), ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'), ('connection.py', '_recv_bytes'), ('connection.py', 'poll'),
+}
+
+
+def subsystem_of(filename: str) -> Optional[str]:
+    if filename.startswith('<'):
+        return None
+    filename = os.path.abspath(filename)
+    if not filename.startswith(REPO_ROOT + os.sep):
+        return None
+    return os.path.relpath(filename, REPO_ROOT).split(os.sep)[0]
+
+
+class Profiler:
+    """Runtime-toggled CPU and allocation profiling for a running client.
+
+    mode='sample' polls every thread's stack at a fixed interval, which is
+    cheap enough to leave on in production. Each sample is weighted by the
+    CPU time the thread burnt since the previous one, so threads blocked
+    on sockets or locks do not show up as busy. mode='cprofile' traces every
+    call; before Python 3.12 only in the caller's thread and in threads
+    started while it is enabled, which keep tracing until they exit.
+    Prefer it for bounded runs.
+    """
+
+    def __init__(self, mode: str = 'sample', interval: float = 0.005, memory: bool = True, memory_frames: int = 8):
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f"unknown profiler mode: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.memory = memory
+        self.memory_frames = memory_frames
+        self.running = False
+        self.started_at = 0.0
+        self.stopped_at = 0.0
+
+        self.samples = 0
+        # CPU seconds per subsystem and function in sample mode
+        self.cpu_seconds = 0.0
+        self.subsystem_samples = Counter()
+        self.function_samples = Counter()
+        self._thread_cpu: Dict[int, float] = {}
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self._profiles: List[cProfile.Profile] = []
+        self._profiles_lock = threading.Lock()
+        self._memory_snapshot = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.started_at = time.monotonic()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.memory_frames)
+
+        if self.mode == 'sample':
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+            self._sampler.start()
+        elif SINGLE_CPROFILE:
+            try:
+                self._enable_for_current_thread()
+            except ValueError as e:
+                # A debugger, coverage or another profiler holds the slot
+                self.running = False
+                if self.memory and tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                raise RuntimeError(f"cannot start cProfile ({e}), use mode='sample'") from e
+        else:
+            threading.setprofile(self._thread_bootstrap)
+            self._enable_for_current_thread()
+        logger.info("Profiler started (%s)", self.mode)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.stopped_at = time.monotonic()
+        if self.mode == 'sample':
+            self._stop.set()
+            if self._sampler:
+                self._sampler.join()
+        else:
+            if not SINGLE_CPROFILE:
+                threading.setprofile(None)
+            with self._profiles_lock:
+                for profile in self._profiles:
+                    profile.disable()
+        if self.memory and tracemalloc.is_tracing():
+            self._memory_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        logger.info("Profiler stopped after %.1f s", self.stopped_at - self.started_at)
+
+    def toggle(self) -> bool:
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+        return self.running
+
+    def _enable_for_current_thread(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        with self._profiles_lock:
+            self._profiles.append(profile)
+
+    def _thread_bootstrap(self, frame, event, arg):
+        # Called once as the first profile event of a new thread; hand
+        # the thread over to its own cProfile instance
+        sys.setprofile(None)
+        if self.running:
+            self._enable_for_current_thread()
+
+    def _cpu_used(self, thread_id: int, frame) -> float:
+        # CPU seconds the thread used since its last sample
+        try:
+            now = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except (AttributeError, OSError):
+            code = frame.f_code
+            blocked = (os.path.basename(code.co_filename), code.co_name) in BLOCKING_FRAMES
+            return 0.0 if blocked else self.interval
+        previous = self._thread_cpu.get(thread_id)
+        self._thread_cpu[thread_id] = now
+        return 0.0 if previous is None else now - previous
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in [t for t in self._thread_cpu if t not in frames]:
+                del self._thread_cpu[thread_id]
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                self.samples += 1
+                used = self._cpu_used(thread_id, frame)
+                if used <= 0:
+                    # Blocked in recv, a lock or a sleep, not using the CPU
+                    continue
+                self.cpu_seconds += used
+                innermost = f"{frame.f_code.co_filename}:{frame.f_code.co_name}"
+                self.function_samples[innermost] += used
+                # Time spent in the stdlib (hashlib, socket...) is charged to
+                # the closest repo frame that called into it
+                while frame is not None:
+                    subsystem = subsystem_of(frame.f_code.co_filename)
+                    if subsystem:
+                        self.subsystem_samples[subsystem] += used
+                        break
+                    frame = frame.f_back
+                else:
+                    self.subsystem_samples['<idle/other>'] += used
+
+    def cpu_report(self, limit: int = 25) -> Dict:
+        if self.mode == 'sample':
+            total = self.cpu_seconds or 1.0
+            return {
+                'samples': self.samples,
+                'cpu_seconds': self.cpu_seconds,
+                'subsystems': {name: used / total for name, used in self.subsystem_samples.most_common()},
+                'functions': {name: used / total for name, used in self.function_samples.most_common(limit)},
+            }
+
+        stats = self.pstats()
+        subsystems = Counter()
+        if stats:
+            for (filename, _, _), (_, _, total_time, _, _) in stats.stats.items():
+                subsystems[subsystem_of(filename) or '<stdlib/other>'] += total_time
+        return {'subsystems_seconds': dict(subsystems.most_common())}
+
+    def pstats(self) -> Optional[pstats.Stats]:
+        with self._profiles_lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0], stream=io.StringIO())
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def memory_report(self, limit: int = 25) -> Dict:
+        snapshot = self._memory_snapshot
+        if snapshot is None:
+            if not tracemalloc.is_tracing():
+                return {}
+            snapshot = tracemalloc.take_snapshot()
+        by_subsystem = Counter()
+        for stat in snapshot.statistics('traceback'):
+            owner = '<stdlib/other>'
+            for frame in stat.traceback:
+                subsystem = subsystem_of(frame.filename)
+                if subsystem:
+                    owner = subsystem
+                    break
+            by_subsystem[owner] += stat.size
+        top = [(str(stat.traceback[0]), stat.size, stat.count) for stat in snapshot.statistics('lineno')[:limit]]
+        return {'subsystems_bytes': dict(by_subsystem.most_common()), 'top_lines': top}
+
+    def dump(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        report_path = os.path.join(directory, f"profile-{stamp}.txt")
+        lines = [f"mode: {self.mode}", f"duration: {(self.stopped_at or time.monotonic()) - self.started_at:.1f} s", ""]
+
+        cpu = self.cpu_report()
+        if self.mode == 'sample':
+            lines.append(f"== Share of CPU time by subsystem ({cpu['cpu_seconds']:.2f} s, blocked threads excluded) ==")
+        else:
+            lines.append("== Seconds by subsystem (own time, includes time blocked in calls) ==")
+        for name, value in (cpu.get('subsystems') or cpu.get('subsystems_seconds') or {}).items():
+            lines.append(f"{name:30s} {value:.3f}")
+        if cpu.get('functions'):
+            lines.append("")
+            lines.append("== Hottest functions (share of CPU time) ==")
+            for name, share in cpu['functions'].items():
+                lines.append(f"{share:6.1%}  {name}")
+
+        memory = self.memory_report()
+        if memory:
+            lines.append("")
+            lines.append("== Live allocations by subsystem ==")
+            for name, size in memory['subsystems_bytes'].items():
+                lines.append(f"{name:30s} {size / 1024:.1f} KiB")
+            lines.append("")
+            lines.append("== Top allocation sites ==")
+            for where, size, count in memory['top_lines']:
+                lines.append(f"{size / 1024:10.1f} KiB {count:8d}  {where}")
+
+        with open(report_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        stats = self.pstats() if self.mode == 'cprofile' else None
+        if stats:
+            stats.dump_stats(os.path.join(directory, f"profile-{stamp}.pstats"))
+        logger.info("Profile written to %s", report_path)
+        return report_path
+
+
+def install_signal_toggle(profiler: Profiler, output_dir: str, signum: int = signal.SIGUSR2):
+    """First signal starts profiling, the next one stops it and writes the report."""
+
+    def handler(received, frame):
+        # Stopping joins the sampler and writes files, keep that off the signal frame
+        def toggle():
+            if not profiler.toggle():
+                profiler.dump(output_dir)
+        threading.Thread(target=toggle, name='profiler-toggle', daemon=True).start()
+
+    signal.signal(signum, handler)
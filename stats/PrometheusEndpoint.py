@@ -0,0 +1,68 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from stats.Metrics import prometheus_lines
+
+PEER_METRICS = ('downloaded', 'uploaded', 'timeouts', 'rejected', 'wasted_bytes', 'hash_failed_bytes')
+
+
+class PrometheusEndpoint:
+
+    def __init__(self, session, host: str = '127.0.0.1', port: int = 9099):
+        self.session = session
+        self.host = host
+        self.port = port
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.session.stats.metrics():
+            lines.extend(prometheus_lines([(metric, {})]))
+
+        pm = self.session.piece_manager
+        peers = self.session.peer_pool.connected_peers()
+        lines.append("# HELP torrent_pieces_completed Pieces verified and stored")
+        lines.append("# TYPE torrent_pieces_completed gauge")
+        lines.append(f"torrent_pieces_completed {sum(pm.pieces)}")
+        lines.append("# HELP torrent_connected_peers Peers with an open connection")
+        lines.append("# TYPE torrent_connected_peers gauge")
+        lines.append(f"torrent_connected_peers {len(peers)}")
+
+        if peers:
+            labels = [{'peer': f"{peer.ip}:{peer.port}"} for peer in peers]
+            for field in PEER_METRICS:
+                lines.extend(prometheus_lines([(getattr(peer.stats, field), peer_labels)
+                                               for peer, peer_labels in zip(peers, labels)]))
+        return '\n'.join(lines) + '\n'
+
+    def start(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = endpoint.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='prometheus', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import socket
+import struct
+import sys
+import threading
+from typing import List, Tuple
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from torrent.TorrentFile import TorrentFile
+
+
+class FakeTorrent:
+    """Random data split into pieces, with the attributes the client reads from a Torrent."""
+
+    def __init__(self, size: int, piece_length: int, num_files: int = 1):
+        self.data = os.urandom(size)
+        self.name = 'fake'
+        self.piece_length = piece_length
+        self.total_length = size
+        self.num_pieces = (size + piece_length - 1) // piece_length
+        self.pieces = b''.join(hashlib.sha1(self.data[i:i + piece_length]).digest()
+                               for i in range(0, size, piece_length))
+        self.info_hash = hashlib.sha1(b'fake' + self.pieces).digest()
+        self.announce_list = []
+        self.files: List[TorrentFile] = []
+        per_file = size // num_files
+        offset = 0
+        for index in range(num_files):
+            length = per_file if index < num_files - 1 else size - offset
+            self.files.append(TorrentFile([f"f{index}.bin"], length, offset))
+            offset += length
+
+    def get_piece_hash(self, piece_index: int) -> bytes:
+        return self.pieces[piece_index * 20:piece_index * 20 + 20]
+
+
+def recv_exact(sock: socket.socket, length: int) -> bytes:
+    data = b''
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def handshake(info_hash: bytes, fast: bool = True) -> bytes:
+    reserved = bytearray(8)
+    if fast:
+        reserved[7] |= 0x04
+    return bytes([19]) + b'BitTorrent protocol' + bytes(reserved) + info_hash + b'S' * 20
+
+
+def start_seeder(torrent: FakeTorrent) -> Tuple[Tuple[str, int], socket.socket]:
+    """A loopback peer that has every piece and answers every request."""
+    server = socket.create_server(('127.0.0.1', 0))
+
+    def serve(conn: socket.socket):
+        try:
+            recv_exact(conn, 68)
+            conn.sendall(handshake(torrent.info_hash))
+            # HAVE_ALL, then UNCHOKE
+            conn.sendall(struct.pack('>IB', 1, 0x0E) + struct.pack('>IB', 1, 1))
+            while True:
+                length = struct.unpack('>I', recv_exact(conn, 4))[0]
+                if length == 0:
+                    continue
+                message = recv_exact(conn, length)
+                if message[0] == 6:
+                    index, begin, block_length = struct.unpack('>III', message[1:13])
+                    start = index * torrent.piece_length + begin
+                    block = torrent.data[start:start + block_length]
+                    conn.sendall(struct.pack('>IBII', 9 + len(block), 7, index, begin) + block)
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+
+    def accept_loop():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname(), server
+
+
+@pytest.fixture
+def seeders():
+    servers = []
+
+    def make(torrent: FakeTorrent, count: int = 1) -> List[Tuple[str, int]]:
+        addrs = []
+        for _ in range(count):
+            addr, server = start_seeder(torrent)
+            servers.append(server)
+            addrs.append(addr)
+        return addrs
+
+    yield make
+    for server in servers:
+        # close() alone leaves accept() blocked, shutdown() wakes it
+        try:
+            server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        server.close()
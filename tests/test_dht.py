@@ -0,0 +1,34 @@
+import asyncio
+import os
+
+from dht.DHTNode import DHTNode
+from dht.LocalSwarm import LocalSwarm
+
+
+def test_announced_peer_is_found_from_another_node():
+    async def run():
+        async with LocalSwarm(12) as swarm:
+            info_hash = os.urandom(20)
+            await swarm.announce(info_hash, 5555, node_index=3)
+            return await swarm.nodes[9].get_peers(info_hash)
+
+    assert ('127.0.0.1', 5555) in asyncio.run(run())
+
+
+def test_cache_restores_node_id_and_contacts(tmp_path):
+    cache = str(tmp_path / 'dht.dat')
+
+    async def run():
+        async with LocalSwarm(6) as swarm:
+            client = await swarm.spawn_client(cache)
+            client.save_cache()
+            client.close()
+            restored = DHTNode(cache_path=cache)
+            await restored.start('127.0.0.1', 0)
+            # No bootstrap routers, so every contact comes from the cache
+            await restored.bootstrap([])
+            restored.close()
+            return client.node_id, restored.node_id, len(restored.routing_table)
+
+    first_id, restored_id, contacts = asyncio.run(run())
+    assert restored_id == first_id and contacts > 0
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from conftest import FakeTorrent
+from fileManager.DiskScheduler import DiskScheduler
+
+
+class RecordingFiles:
+
+    def __init__(self, torrent: FakeTorrent, fail: int = 0):
+        self.torrent = torrent
+        self.writes = []
+        self.fail = fail
+
+    def write_range(self, offset: int, data):
+        if self.fail:
+            self.fail -= 1
+            raise OSError(28, "No space left on device")
+        self.writes.append((offset, len(data)))
+
+
+def test_adjacent_pieces_are_coalesced_in_offset_order():
+    files = RecordingFiles(FakeTorrent(8 * 1024, 1024))
+    scheduler = DiskScheduler(files, workers=1, flush_interval=60)
+    for index in (3, 1, 2, 6, 0):
+        scheduler.submit(index, b'\0' * 1024)
+    assert scheduler.get_pending(6) == b'\0' * 1024
+    scheduler.close()
+    assert files.writes == [(0, 4 * 1024), (6 * 1024, 1024)]
+    assert scheduler.get_pending(6) is None
+
+
+def test_failed_writes_are_handed_back():
+    files = RecordingFiles(FakeTorrent(4 * 1024, 1024), fail=1)
+    failed = []
+    done = threading.Event()
+
+    def on_failed(run, error):
+        failed.extend(run)
+        done.set()
+
+    scheduler = DiskScheduler(files, workers=1, flush_interval=60, on_failed=on_failed)
+    scheduler.submit(0, b'\0' * 1024)
+    scheduler.submit(1, b'\0' * 1024)
+    assert scheduler.flush(5)
+    assert done.wait(5) and failed == [0, 1]
+    scheduler.submit(0, b'\0' * 1024)
+    scheduler.close()
+    assert files.writes == [(0, 1024)]
+
+
+def test_repeated_failures_raise_from_flush():
+    files = RecordingFiles(FakeTorrent(4 * 1024, 1024), fail=10)
+    scheduler = DiskScheduler(files, workers=1, flush_interval=60, on_failed=lambda run, error: None,
+                              max_write_failures=2)
+    scheduler.submit(0, b'\0' * 1024)
+    assert scheduler.flush(5)
+    scheduler.submit(2, b'\0' * 1024)
+    with pytest.raises(OSError):
+        scheduler.flush(5)
+    with pytest.raises(OSError):
+        scheduler.close()
+    assert not any(worker.is_alive() for worker in scheduler.workers)
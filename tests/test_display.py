@@ -0,0 +1,46 @@
+import io
+
+from rich.console import Console
+
+from cli.RichBitTorrentDisplay import RichBitTorrentDisplay
+
+
+def snapshot(speed: float, seconds: float, pieces: int = 3):
+    peer = {'ip': '10.0.0.1', 'port': 6881, 'download_speed': speed, 'upload_speed': 0, 'pieces': pieces,
+            'connected_seconds': seconds}
+    return {'torrent': {'downloaded': pieces * 1024, 'verified_bytes': pieces * 1024, 'download_speed': speed,
+                        'upload_speed': 0, 'pieces_completed': pieces, 'total_pieces': 10, 'known_peers': 4},
+            'peers': [peer]}
+
+
+def render(display: RichBitTorrentDisplay) -> str:
+    console = Console(width=120, record=True, file=io.StringIO())
+    console.print(display.create_layout())
+    return console.export_text()
+
+
+def test_live_values_update_without_rebuilding_panels():
+    display = RichBitTorrentDisplay(headless=True)
+    display.start_download('fake', 10 * 1024, 10)
+    display.apply_snapshot(snapshot(1024 * 1024, 5))
+    display.create_layout()
+    stats_panel, peers_panel = display._stats_panel, display._peers_panel
+
+    display.apply_snapshot(snapshot(3 * 1024 * 1024, 6, pieces=4))
+    output = render(display)
+    assert display._stats_panel is stats_panel
+    assert display._peers_panel is peers_panel
+    assert '3.00 MB/s' in output and '6s' in output and '4/10' in output
+
+
+def test_new_peer_rebuilds_the_peers_panel():
+    display = RichBitTorrentDisplay(headless=True)
+    display.apply_snapshot(snapshot(0, 1))
+    display.create_layout()
+    peers_panel = display._peers_panel
+
+    update = snapshot(0, 2)
+    update['peers'].append(dict(update['peers'][0], ip='10.0.0.2'))
+    display.apply_snapshot(update)
+    assert '10.0.0.2:6881' in render(display)
+    assert display._peers_panel is not peers_panel
@@ -0,0 +1,61 @@
+import os
+
+from conftest import FakeTorrent
+from downloadSession.DownloadSession import DownloadSession
+from getPeers.PeerPool import PeerPool
+
+PEER_ID = b'-TS0001-' + b'0' * 12
+
+
+def read_back(torrent: FakeTorrent, download_dir: str) -> bytes:
+    return b''.join(open(os.path.join(download_dir, torrent.name, *f.path), 'rb').read() for f in torrent.files)
+
+
+class RecordingPool(PeerPool):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peak = 0
+
+    def mark_connected(self, peer):
+        super().mark_connected(peer)
+        with self.lock:
+            self.peak = max(self.peak, len(self.connected))
+
+
+def test_download_from_seeders(tmp_path, seeders):
+    torrent = FakeTorrent(3 * 1024 * 1024 + 123, 256 * 1024, 3)
+    session = DownloadSession(torrent, PEER_ID, str(tmp_path))
+    session.add_peers(seeders(torrent, 3))
+    session.start()
+    try:
+        assert session.wait(30)
+    finally:
+        session.stop()
+    assert read_back(torrent, str(tmp_path)) == torrent.data
+
+
+def test_dials_in_progress_count_against_max_connections(tmp_path, seeders):
+    torrent = FakeTorrent(4 * 1024 * 1024, 64 * 1024)
+    pool = RecordingPool(max_connections=3)
+    session = DownloadSession(torrent, PEER_ID, str(tmp_path), max_connections=3, peer_pool=pool)
+    session.add_peers(seeders(torrent, 20))
+    session.start()
+    try:
+        assert session.wait(30)
+    finally:
+        session.stop()
+    assert 0 < pool.peak <= 3
+
+
+def test_pool_reserves_a_slot_per_dial():
+    pool = PeerPool(max_connections=2)
+    pool.add_peers([('10.0.0.1', 1), ('10.0.0.2', 1), ('10.0.0.3', 1)])
+    first, second = pool.next_candidate(), pool.next_candidate()
+    assert pool.next_candidate() is None
+    assert not pool.reserve(('10.0.0.9', 5000))
+
+    pool.mark_failed(first)
+    assert pool.next_candidate() == ('10.0.0.3', 1)
+    pool.release(second)
+    assert pool.needs_peers()
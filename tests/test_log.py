@@ -0,0 +1,31 @@
+import io
+import logging
+
+from log import Log
+from log.Log import RateLimitedLog, configure, get_logger, set_level
+
+
+def test_rate_limited_log_reports_suppressed_messages(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(Log.time, 'monotonic', lambda: now[0])
+    stream = io.StringIO()
+    configure('INFO', stream=stream, fmt='%(message)s')
+    limited = RateLimitedLog(get_logger('test.ratelimit'), interval=10.0)
+
+    for port in range(5):
+        limited.info('idle', "Dropping peer %d", port)
+    limited.info('snub', "Snubbed")
+    now[0] += 10.0
+    limited.info('idle', "Dropping peer %d", 9)
+
+    assert stream.getvalue().splitlines() == [
+        "Dropping peer 0", "Snubbed", "Dropping peer 9 (4 similar messages suppressed)"]
+
+
+def test_set_level_enables_one_module():
+    stream = io.StringIO()
+    configure('WARNING', stream=stream, fmt='%(name)s %(message)s')
+    set_level('test.chatty', logging.DEBUG)
+    get_logger('test.chatty').debug("shown")
+    get_logger('test.quiet').debug("hidden")
+    assert stream.getvalue() == "torrent.test.chatty shown\n"
@@ -0,0 +1,54 @@
+import os
+import shutil
+import signal
+
+import pytest
+
+from conftest import FakeTorrent
+from downloadSession.MultiProcessSession import MultiProcessSession
+
+PEER_ID = b'-TS0001-' + b'1' * 12
+
+
+def test_download_across_workers(tmp_path, seeders):
+    torrent = FakeTorrent(4 * 1024 * 1024 + 77, 64 * 1024, 3)
+    session = MultiProcessSession(torrent, PEER_ID, str(tmp_path), processes=2)
+    session.add_peers(seeders(torrent, 4))
+    session.start()
+    try:
+        assert session.wait(60)
+    finally:
+        session.stop()
+    data = b''.join(open(os.path.join(str(tmp_path), torrent.name, *f.path), 'rb').read() for f in torrent.files)
+    assert data == torrent.data
+
+
+def test_wait_raises_when_a_worker_crashes(tmp_path, seeders):
+    torrent = FakeTorrent(64 * 1024 * 1024, 64 * 1024)
+    session = MultiProcessSession(torrent, PEER_ID, str(tmp_path), processes=2)
+    session.start()
+    try:
+        os.kill(session.workers[1].pid, signal.SIGKILL)
+        session.add_peers(seeders(torrent, 2))
+        with pytest.raises(RuntimeError, match='exited with code'):
+            session.wait()
+    finally:
+        session.stop()
+
+
+def test_wait_raises_when_a_worker_disk_fails(tmp_path, seeders):
+    torrent = FakeTorrent(4 * 1024 * 1024, 64 * 1024)
+    session = MultiProcessSession(torrent, PEER_ID, str(tmp_path), processes=2)
+    session.start()
+    try:
+        # Workers open the file lazily on their first write, which now fails
+        path = os.path.join(str(tmp_path), torrent.name, *torrent.files[0].path)
+        os.remove(path)
+        os.mkdir(path)
+        session.add_peers(seeders(torrent, 2))
+        # Before the fix this timed out and returned False
+        with pytest.raises(OSError):
+            session.wait(60)
+    finally:
+        session.stop()
+        shutil.rmtree(str(tmp_path), ignore_errors=True)
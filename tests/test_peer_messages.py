@@ -0,0 +1,37 @@
+import struct
+
+from getPeers.Peers import HAVE_ALL, Peer
+
+
+def make_peer(num_pieces: int = 100) -> Peer:
+    peer = Peer('127.0.0.1', 1, b'\x01' * 20, b'\x02' * 20, 6881, num_pieces)
+    peer.supports_fast = True
+    return peer
+
+
+def test_have_past_the_last_piece_is_rejected():
+    peer = make_peer()
+    assert not peer.handle_message(4, struct.pack('>I', 0x7fffffff))
+    assert not peer.handle_message(4, struct.pack('>I', 100))
+    assert len(peer.have) == 0 and peer.pieces_count == 0
+
+    assert peer.handle_message(4, struct.pack('>I', 99))
+    assert peer.has_piece(99) and peer.pieces_count == 1
+
+
+def test_bitfield_must_match_the_piece_count():
+    peer = make_peer()
+    assert not peer.handle_message(5, b'\xff' * 100000)
+    assert not peer.handle_message(5, b'\xff' * 12)
+    assert peer.pieces_count == 0
+
+    # 100 pieces: 13 bytes, the low 4 bits of the last byte are spare
+    assert not peer.handle_message(5, b'\xff' * 12 + b'\xf1')
+    assert peer.handle_message(5, b'\xff' * 12 + b'\xf0')
+    assert peer.pieces_count == 100
+
+
+def test_have_all_counts_the_torrent_pieces():
+    peer = make_peer(37)
+    assert peer.handle_message(HAVE_ALL, b'')
+    assert peer.pieces_count == 37 and peer.has_piece(36)
@@ -0,0 +1,58 @@
+from getPeers import PeerPool as peer_pool_module
+from getPeers.PeerPool import PeerPool
+
+
+class FakePeer:
+
+    def __init__(self, ip: str, port: int):
+        self.ip = ip
+        self.port = port
+        self.on_pex = None
+
+
+def test_failed_dial_can_be_re_added_after_backoff(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(peer_pool_module.time, 'monotonic', lambda: now[0])
+    pool = PeerPool()
+    addr = ('10.0.0.1', 6881)
+    pool.add_peers([addr])
+    assert pool.next_candidate() == addr
+
+    pool.mark_failed(addr)
+    assert pool.add_peers([addr]) == 0
+    now[0] += peer_pool_module.RETRY_BACKOFF
+    assert pool.add_peers([addr]) == 1
+
+
+def test_backoff_doubles_with_each_failure(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(peer_pool_module.time, 'monotonic', lambda: now[0])
+    pool = PeerPool()
+    addr = ('10.0.0.1', 6881)
+    for _ in range(2):
+        pool.add_peers([addr])
+        pool.next_candidate()
+        now[0] += 1
+        pool.mark_failed(addr)
+        now[0] += peer_pool_module.RETRY_BACKOFF
+    # Second failure in a row waits twice as long
+    assert pool.add_peers([addr]) == 0
+    now[0] += peer_pool_module.RETRY_BACKOFF
+    assert pool.add_peers([addr]) == 1
+
+
+def test_disconnected_peer_is_forgotten_but_banned_one_is_not(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(peer_pool_module.time, 'monotonic', lambda: now[0])
+    pool = PeerPool()
+    good, bad = ('10.0.0.1', 6881), ('10.0.0.2', 6881)
+    pool.add_peers([good, bad])
+    for addr in (pool.next_candidate(), pool.next_candidate()):
+        pool.mark_connected(FakePeer(*addr))
+    pool.ban(bad)
+    pool.mark_disconnected(FakePeer(*good))
+    pool.mark_disconnected(FakePeer(*bad))
+
+    now[0] += peer_pool_module.RETRY_BACKOFF
+    assert pool.add_peers([good, bad], 'pex') == 1
+    assert pool.next_candidate() == good
@@ -0,0 +1,55 @@
+from conftest import FakeTorrent
+from pieceManager.PieceManager import PRIORITY_DEFAULT, PRIORITY_SKIP, PRIORITY_TOP, PieceManager
+
+
+def piece_data(torrent: FakeTorrent, piece_index: int) -> bytes:
+    return torrent.data[piece_index * torrent.piece_length:(piece_index + 1) * torrent.piece_length]
+
+
+def test_is_complete_tracks_wanted_pieces():
+    torrent = FakeTorrent(8 * 1024, 1024)
+    pm = PieceManager(torrent)
+    pm.set_piece_priorities(range(4, 8), PRIORITY_SKIP)
+    for i in range(4):
+        assert not pm.is_complete()
+        assert pm.store_piece(i, piece_data(torrent, i))
+    assert pm.is_complete()
+
+    pm.unmark_piece(2)
+    assert not pm.is_complete() and pm.missing == 1
+    pm.set_piece_priority(2, PRIORITY_SKIP)
+    assert pm.is_complete()
+    # Wanting a skipped piece again makes the torrent incomplete
+    pm.set_piece_priority(5, PRIORITY_DEFAULT)
+    assert not pm.is_complete()
+
+
+def test_failed_hash_keeps_the_piece_missing():
+    torrent = FakeTorrent(2 * 1024, 1024)
+    pm = PieceManager(torrent)
+    assert not pm.store_piece(0, b'\0' * 1024)
+    assert pm.missing == 2 and not pm.pieces[0]
+
+
+def test_next_piece_prefers_higher_levels_and_skips_pending():
+    torrent = FakeTorrent(16 * 1024, 1024)
+    pm = PieceManager(torrent)
+    pm.set_piece_priorities([9, 12], PRIORITY_TOP)
+    pm.set_piece_priority(0, PRIORITY_SKIP)
+    assert {pm.get_next_piece('a'), pm.get_next_piece('a')} == {9, 12}
+    assert pm.get_next_piece('a') not in (0, 9, 12)
+    assert pm.get_next_piece('b', has_piece=lambda i: i == 0) is None
+
+
+def test_next_piece_after_most_pieces_are_done():
+    torrent = FakeTorrent(4000 * 16, 16)
+    pm = PieceManager(torrent)
+    for i in range(3990):
+        pm.mark_piece(i)
+    picked = set()
+    while True:
+        i = pm.get_next_piece('a')
+        if i is None:
+            break
+        picked.add(i)
+    assert picked == set(range(3990, 4000))
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from stats import Profiler as profiler_module
+from stats.Profiler import Profiler
+
+
+def spin(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(1000))
+
+
+def test_cprofile_sees_threads_started_while_enabled():
+    profiler = Profiler(mode='cprofile', memory=False)
+    profiler.start()
+    try:
+        worker = threading.Thread(target=spin, args=(0.1,))
+        worker.start()
+        worker.join()
+    finally:
+        profiler.stop()
+    assert any(name == 'spin' for _, _, name in profiler.pstats().stats)
+
+
+@pytest.mark.skipif(not profiler_module.SINGLE_CPROFILE, reason="per-thread profilers before 3.12")
+def test_second_cprofile_fails_with_a_clear_error():
+    first = Profiler(mode='cprofile', memory=False)
+    first.start()
+    try:
+        with pytest.raises(RuntimeError, match="mode='sample'"):
+            Profiler(mode='cprofile', memory=False).start()
+    finally:
+        first.stop()
+
+
+def test_sample_mode_skips_blocked_threads():
+    profiler = Profiler(mode='sample', interval=0.002, memory=False)
+    blocker = threading.Event()
+    sleeper = threading.Thread(target=blocker.wait)
+    sleeper.start()
+    profiler.start()
+    try:
+        spin(0.2)
+    finally:
+        profiler.stop()
+        blocker.set()
+        sleeper.join()
+    functions = profiler.cpu_report()['functions']
+    assert not any(name.endswith(':wait') for name in functions)
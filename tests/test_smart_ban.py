@@ -0,0 +1,27 @@
+from pieceManager.SmartBan import SmartBan
+
+
+def test_culprit_is_banned_once_the_piece_verifies():
+    ban = SmartBan()
+    good = b'a' * 16 + b'b' * 16
+    bad = b'a' * 16 + b'X' * 16
+    assert ban.on_hash_failure(0, bad, {0: 'honest', 16: 'liar'}) == []
+    assert not ban.allowed(0, 'liar') and not ban.allowed(0, 'honest')
+    assert ban.allowed(0, 'third')
+
+    assert ban.on_piece_verified(0, good, {0: 'third', 16: 'third'}) == ['liar']
+    assert ban.is_banned('liar') and not ban.is_banned('honest')
+    assert ban.allowed(0, 'honest')
+
+
+def test_lone_sender_is_banned_after_max_strikes():
+    ban = SmartBan(max_strikes=2)
+    assert ban.on_hash_failure(0, b'x' * 32, {0: 'solo', 16: 'solo'}) == []
+    assert ban.on_hash_failure(1, b'y' * 32, {0: 'solo'}) == ['solo']
+    assert ban.on_hash_failure(2, b'z' * 32, {0: 'solo'}) == []
+
+
+def test_exclusion_expires():
+    ban = SmartBan(exclude_seconds=-1)
+    ban.on_hash_failure(0, b'x' * 16, {0: 'peer'})
+    assert ban.allowed(0, 'peer')
@@ -0,0 +1,31 @@
+import threading
+
+from downloadSession.TimerWheel import TimerWheel
+
+
+def test_timers_fire_in_order_and_cancelled_ones_do_not():
+    wheel = TimerWheel(tick=0.01, slots=4)
+    fired = []
+    done = threading.Event()
+    # 0.1 s is more than two turns of a 4-slot wheel
+    wheel.schedule(0.1, lambda: (fired.append('late'), done.set()))
+    wheel.schedule(0.02, lambda: fired.append('early'))
+    wheel.schedule(0.04, lambda: fired.append('cancelled')).cancel()
+    wheel.start()
+    try:
+        assert done.wait(5)
+    finally:
+        wheel.stop()
+    assert fired == ['early', 'late']
+
+
+def test_failing_callback_does_not_stop_the_wheel():
+    wheel = TimerWheel(tick=0.01)
+    done = threading.Event()
+    wheel.schedule(0.01, lambda: 1 / 0)
+    wheel.schedule(0.03, done.set)
+    wheel.start()
+    try:
+        assert done.wait(5)
+    finally:
+        wheel.stop()
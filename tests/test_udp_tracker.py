@@ -0,0 +1,56 @@
+import socket
+import struct
+import threading
+
+from conftest import FakeTorrent
+from getPeers import get_peers_udp as udp_module
+from getPeers.get_peers_udp import get_peers_udp
+
+
+def start_tracker(answer_announces: bool):
+    """A UDP tracker that always answers connects and optionally announces."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    counts = {'connect': 0, 'announce': 0}
+
+    def serve():
+        while True:
+            try:
+                request, addr = sock.recvfrom(2048)
+            except OSError:
+                return
+            action, transaction_id = struct.unpack('>II', request[8:16])
+            if action == 0:
+                counts['connect'] += 1
+                sock.sendto(struct.pack('>IIQ', 0, transaction_id, 42), addr)
+            elif action == 1:
+                counts['announce'] += 1
+                if answer_announces:
+                    peers = socket.inet_aton('10.0.0.1') + struct.pack('>H', 6881)
+                    sock.sendto(struct.pack('>IIIII', 1, transaction_id, 1800, 0, 1) + peers, addr)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return sock, counts
+
+
+def test_announce_retries_share_one_budget(monkeypatch):
+    # Every announce times out and the connection id is always stale, so
+    # each retry reconnects first
+    monkeypatch.setattr(udp_module, 'CONNECTION_ID_TTL', 0.0)
+    sock, counts = start_tracker(answer_announces=False)
+    try:
+        client = get_peers_udp(FakeTorrent(1024, 1024), b'-TS0001-' + b'0' * 12, base_timeout=0.01, max_retries=3)
+        assert client.get_peers_udp(f"udp://127.0.0.1:{sock.getsockname()[1]}/announce") == []
+    finally:
+        sock.close()
+    assert counts['announce'] == 4
+
+
+def test_announce_returns_peers():
+    sock, counts = start_tracker(answer_announces=True)
+    try:
+        client = get_peers_udp(FakeTorrent(1024, 1024), b'-TS0001-' + b'0' * 12, base_timeout=0.5)
+        assert client.get_peers_udp(f"udp://127.0.0.1:{sock.getsockname()[1]}/announce") == [('10.0.0.1', 6881)]
+    finally:
+        sock.close()
+    assert counts == {'connect': 1, 'announce': 1}
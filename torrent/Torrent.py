@@ -1,7 +1,10 @@
 import bencodepy
 from typing import List, Optional
 import hashlib
-from dl_torrent import TorrentFile
+from torrent.TorrentFile import TorrentFile
+from log.Log import get_logger
+
+logger = get_logger('torrent')
 
 
 
@@ -53,8 +56,7 @@ class Torrent:
         self.web_seeds: List[str] = []
         self.announce_list: List[List[str]] = []
 
-        for i in self.torrent_data:
-            print("\033[1;033m", i ,"\033[m")
+        logger.debug("Torrent keys: %s", self.torrent_data.keys())
         
         if b'announce' in self.torrent_data:
             self.announce = self.torrent_data[b'announce'].decode('utf-8')
@@ -62,7 +64,7 @@ class Torrent:
        
         if b'url-list' in self.torrent_data:
             for url in self.torrent_data[b'url-list']:
-                print("\033[1;033m", url ,"\033[m")     
+                logger.debug("Web seed: %s", url)
                 self.web_seeds.append(url.decode('utf-8'))
            
             if not self.announce and self.web_seeds:
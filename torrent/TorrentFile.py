@@ -0,0 +1,12 @@
+from typing import List
+
+
+class TorrentFile:
+
+    def __init__(self, path: List[str], length: int, offset: int = 0):
+        self.path = path
+        self.length = length
+        self.offset = offset
+
+    def __repr__(self) -> str:
+        return f"TorrentFile(path={'/'.join(self.path)!r}, length={self.length}, offset={self.offset})"
@@ -1,17 +1,30 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+import asyncio
+import concurrent.futures
 import struct
 import bencodepy
 from torrent import Torrent
 from getPeers import get_peers_https, get_peers_udp
+from dht.DHTNode import DHTNode
+from log.Log import get_logger
+
+logger = get_logger('tracker')
 
 
 
 
 class TrackerClient:
-    def __init__(self, torrent: Torrent, peer_id: bytes, port: int = 6881):
+    def __init__(self, torrent: Torrent, peer_id: bytes, port: int = 6881,
+                 use_dht: bool = True, dht_cache_path: Optional[str] = None, dht_port: int = 0,
+                 udp_timeout: float = get_peers_udp.BASE_TIMEOUT):
         self.torrent = torrent
         self.peer_id = peer_id
         self.port = port
+        self.use_dht = use_dht
+        self.dht_cache_path = dht_cache_path
+        # The DHT gets its own UDP port, ephemeral unless one is asked for
+        self.dht_port = dht_port
+        self.udp_timeout = udp_timeout
 
         
     def get_peers(self) -> List[Tuple[str, int]]:
@@ -21,15 +34,14 @@ class TrackerClient:
             tier_peers = []
         
             for tracker_url in tier:
-                print(f"Trying tracker: {tracker_url}")
+                logger.debug("Trying tracker: %s", tracker_url)
                 peers = self.try_tracker(tracker_url)
                 
                 if peers:
-                    print("\033[01;33m", peers, "\033[;m")
                     tier_peers.extend(peers)
-                    print(f"Got {len(peers)} peers from {tracker_url}")
+                    logger.info("Got %d peers from %s", len(peers), tracker_url)
                 else:
-                    print(f"No peers from {tracker_url}")
+                    logger.info("No peers from %s", tracker_url)
             
             if tier_peers:
                 all_peers.extend(tier_peers)
@@ -37,26 +49,61 @@ class TrackerClient:
         
         unique_peers = list(set(all_peers))
         if not unique_peers:
-            print("No Peers from TrackerClient")
+            logger.warning("No peers from any tracker")
+            if self.use_dht:
+                unique_peers = self.get_peers_dht()
         return unique_peers
+
+    def get_peers_dht(self, max_peers: int = 50) -> List[Tuple[str, int]]:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            run_in_thread = False
+        else:
+            # asyncio.run refuses to nest, give the lookup a loop of its own
+            run_in_thread = True
+        try:
+            if run_in_thread:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    peers = executor.submit(asyncio.run, self._dht_lookup(max_peers)).result()
+            else:
+                peers = asyncio.run(self._dht_lookup(max_peers))
+        except Exception as e:
+            logger.warning("DHT lookup failed: %s", e)
+            return []
+        logger.info("Got %d peers from DHT", len(peers))
+        return peers
+
+    async def _dht_lookup(self, max_peers: int) -> List[Tuple[str, int]]:
+        node = DHTNode(cache_path=self.dht_cache_path)
+        await node.start(port=self.dht_port)
+        try:
+            await node.bootstrap()
+            peers = await node.get_peers(self.torrent.info_hash, max_peers)
+            if self.dht_cache_path:
+                node.save_cache()
+            return peers
+        finally:
+            node.close()
     
     def try_tracker(self, announce_url: str) -> List[Tuple[str, int]]:
-        print(f"Contacting tracker: {announce_url}")
+        logger.debug("Contacting tracker: %s", announce_url)
 
         if announce_url.startswith('udp://'):
-            return get_peers_udp.get_peers_udp(announce_url, self.torrent, self.peer_id, self.port)
+            udp_client = get_peers_udp.get_peers_udp(self.torrent, self.peer_id, self.udp_timeout)
+            return udp_client.get_peers_udp(announce_url)
         
         elif announce_url.startswith('http://') or announce_url.startswith('https://'):
            
             if not self._is_valid_tracker_url(announce_url):
-                print(f"Warning: URL doesn't look like a tracker: {announce_url}")
+                logger.warning("URL doesn't look like a tracker: %s", announce_url)
                 return []
             
-            http_client = get_peers_https(self.torrent, self.peer_id, self.port)
+            http_client = get_peers_https.get_peers_https(self.torrent, self.peer_id, self.port)
             return http_client.get_peers_https(announce_url)
         
         else:
-            print(f"Unsupported tracker protocol: {announce_url}")
+            logger.warning("Unsupported tracker protocol: %s", announce_url)
             return []
     
     def _is_valid_tracker_url(self, url: str) -> bool:
@@ -75,12 +122,12 @@ class TrackerClient:
             decoded = bencodepy.decode(peers_data)
                 
             if b'failure reason' in decoded:
-                print(f"Tracker failure: {decoded[b'failure reason'].decode()}")
+                logger.warning("Tracker failure: %s", decoded[b'failure reason'].decode(errors='replace'))
                 return []
                 
             peers_data = decoded.get(b'peers', b'')
             if not peers_data:
-                print("No peers in response")
+                logger.info("No peers in response")
                 return []
             
             peers = []
@@ -97,7 +144,7 @@ class TrackerClient:
             
             return peers
         except Exception as e:
-            print(f"Error parsing peers: {e}")
+            logger.warning("Error parsing peers: %s", e)
             return []
     
     def debug_torrent_trackers(self):